@@ -0,0 +1,839 @@
+"""
+accumulators used to aggregate the input data
+chunk by chunk, when the data file is read in chunks.
+accumulators of the same provision can be merged
+to aggregate many input files
+"""
+
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregation_code import (
+    custom_functions,
+    function_registry,
+    heavy_hitters,
+    predicates,
+    state_codec,
+)
+from aggregation_code.plan_class import AGG_INTERVAL_SECONDS, OTHER_GROUP, STATUS_COLUMN
+
+logger = logging.getLogger(__name__)
+
+
+def get_stats_state(stats) -> dict:
+    """
+    returns the column stats with the values as one array
+    """
+    state = dict(stats)
+    state["values"] = (
+        np.concatenate(stats["values"]) if stats["values"] else np.empty(0)
+    )
+    return state
+
+
+def set_stats_state(state) -> dict:
+    """
+    returns the column stats of get_stats_state
+    """
+    stats = custom_functions.init_column_stats()
+    stats.update(state)
+    stats["values"] = [state["values"]] if len(state["values"]) else []
+    return stats
+
+
+class BaseAggregateAccumulator:
+    """
+    accumulates the basic aggregations of a single column
+    """
+
+    def __init__(self, col, funcs):
+        self.col = col
+        self.funcs = funcs
+        self.is_valid = True
+        # exact median needs every value of the column
+        self.needed = custom_functions.get_needed_stats(funcs)
+        self.stats = custom_functions.init_column_stats()
+
+    def update(self, chunk):
+        """
+        adds the chunk of the column to the accumulator
+        """
+        if not self.is_valid:
+            return
+
+        column = chunk[self.col]
+        # column is aggregated only if all the values are numeric,
+        # unless only distinct counts are needed
+        if not custom_functions.is_valid_column(column, self.needed):
+            self.is_valid = False
+            self.stats = custom_functions.init_column_stats()
+            return
+
+        custom_functions.merge_column_stats(
+            self.stats, custom_functions.cal_stats_of_column(column, self.needed)
+        )
+
+    def merge(self, other):
+        """
+        adds the accumulator of the same column of another input
+        """
+        if not (self.is_valid and other.is_valid):
+            self.is_valid = False
+            self.stats = custom_functions.init_column_stats()
+            return
+
+        custom_functions.merge_column_stats(self.stats, other.stats)
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "base:" + str(self.col)
+
+    def get_state(self) -> dict:
+        """
+        returns the partial aggregate state
+        """
+        return {"is_valid": self.is_valid, "stats": get_stats_state(self.stats)}
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        self.is_valid = state["is_valid"]
+        self.stats = set_stats_state(state["stats"])
+
+    def result(self) -> dict:
+        """
+        returns the aggregates in the same format as
+        StreamDash.process_data
+        """
+        if not self.is_valid:
+            return {}
+        return {
+            str(self.col) + "_" + str(function): value
+            for function, value in zip(
+                self.funcs, custom_functions.get_base_aggregates(self.stats, self.funcs)
+            )
+        }
+
+
+class TimeSeriesAccumulator:
+    """
+    accumulates the base aggregates of the columns with an agg_interval,
+    per time bucket of the interval
+    """
+
+    def __init__(self, time_column, interval_aggregates):
+        self.time_column = time_column
+        self.interval_aggregates = interval_aggregates
+        # agg_interval => bucket start => column => stats
+        self.bucket_stats = {interval: {} for interval in interval_aggregates}
+        # columns that are not numeric in any of the chunks,
+        # for the aggregates that need numeric values
+        self.invalid_columns = set()
+
+    def merge_bucket_stats(self, interval, bucket_stats):
+        """
+        adds the stats of the buckets of the interval
+        """
+        interval_stats = self.bucket_stats[interval]
+        for bucket, column_stats in bucket_stats.items():
+            if bucket not in interval_stats:
+                interval_stats[bucket] = column_stats
+                continue
+            for col, stats in column_stats.items():
+                if col in interval_stats[bucket]:
+                    custom_functions.merge_column_stats(interval_stats[bucket][col], stats)
+                else:
+                    interval_stats[bucket][col] = stats
+
+    def update(self, chunk):
+        """
+        adds the chunk to the accumulator
+        """
+        for aggregates in self.interval_aggregates.values():
+            for aggregate in aggregates:
+                if not custom_functions.is_valid_column(
+                    chunk[aggregate.column],
+                    custom_functions.get_needed_stats(aggregate.funcs),
+                ):
+                    self.invalid_columns.add(aggregate.column)
+
+        for interval, aggregates in self.interval_aggregates.items():
+            aggregates = [a for a in aggregates if a.column not in self.invalid_columns]
+            if not aggregates:
+                continue
+            self.merge_bucket_stats(
+                interval,
+                custom_functions.cal_time_bucket_stats(
+                    chunk, self.time_column, interval * AGG_INTERVAL_SECONDS, aggregates
+                ),
+            )
+
+    def merge(self, other):
+        """
+        adds the accumulator of another input
+        """
+        self.invalid_columns.update(other.invalid_columns)
+        for interval, bucket_stats in other.bucket_stats.items():
+            self.merge_bucket_stats(interval, bucket_stats)
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "timeseries"
+
+    def get_state(self) -> dict:
+        """
+        returns the partial aggregate state
+        """
+        return {
+            "invalid_columns": sorted(self.invalid_columns),
+            "bucket_stats": {
+                interval: {
+                    bucket: {
+                        col: get_stats_state(stats) for col, stats in column_stats.items()
+                    }
+                    for bucket, column_stats in bucket_stats.items()
+                }
+                for interval, bucket_stats in self.bucket_stats.items()
+            },
+        }
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        self.invalid_columns = set(state["invalid_columns"])
+        for interval, bucket_stats in state["bucket_stats"].items():
+            self.bucket_stats[interval] = {
+                bucket: {
+                    col: set_stats_state(stats) for col, stats in column_stats.items()
+                }
+                for bucket, column_stats in bucket_stats.items()
+            }
+
+    def result(self) -> dict:
+        """
+        returns timeseries: agg_interval => bucket start (epoch seconds)
+        => aggregates, in the same format as StreamDash.process_data
+        """
+        timeseries = {}
+        for interval, aggregates in self.interval_aggregates.items():
+            aggregates = [a for a in aggregates if a.column not in self.invalid_columns]
+            timeseries[interval] = {}
+            for bucket in sorted(self.bucket_stats[interval]):
+                column_stats = self.bucket_stats[interval][bucket]
+                timeseries[interval][bucket] = {
+                    str(aggregate.column) + "_" + str(function): value
+                    for aggregate in aggregates
+                    for function, value in zip(
+                        aggregate.funcs,
+                        custom_functions.get_base_aggregates(
+                            column_stats[aggregate.column], aggregate.funcs
+                        ),
+                    )
+                }
+        return {"timeseries": timeseries}
+
+
+class CustomFunctionAccumulator:
+    """
+    accumulates the state of a custom function of the registry
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.state = None
+        # seconds spent in the function
+        self.elapsed = 0.0
+
+    def update(self, chunk):
+        """
+        adds the chunk to the accumulator
+        """
+        start = time.perf_counter()
+        state = self.function.partial(chunk)
+        self.state = state if self.state is None else self.function.merge(self.state, state)
+        self.elapsed += time.perf_counter() - start
+
+    def merge(self, other):
+        """
+        adds the accumulator of another input
+        """
+        if other.state is not None:
+            self.state = (
+                other.state
+                if self.state is None
+                else self.function.merge(self.state, other.state)
+            )
+        self.elapsed += other.elapsed
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "custom:" + self.function.name
+
+    def get_state(self):
+        """
+        returns the partial aggregate state
+        """
+        return self.state
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        self.state = state
+
+    def result(self) -> dict:
+        """
+        returns the outputs of the function
+        """
+        if self.state is None:
+            return {}
+        start = time.perf_counter()
+        result = self.function.finalize(self.state)
+        self.elapsed += time.perf_counter() - start
+        return result
+
+
+class TopKAccumulator:
+    """
+    accumulates the summary of the top-k values of a column
+    """
+
+    def __init__(self, top):
+        self.top = top
+        self.status_class = heavy_hitters.get_status_class(top.statuscode)
+        self.summary = heavy_hitters.init_summary()
+
+    def update(self, chunk):
+        """
+        adds the chunk to the summary
+        """
+        values = chunk[self.top.column]
+        rows = values.notna().to_numpy()
+        if self.status_class is not None:
+            status = chunk[STATUS_COLUMN].to_numpy(dtype="float64", na_value=np.nan)
+            rows = rows & (status // 100 == self.status_class)
+        weights = None
+        if self.top.weight is not None:
+            weights = chunk[self.top.weight].to_numpy(dtype="float64", na_value=np.nan)[rows]
+            weights[np.isnan(weights)] = 0
+
+        self.summary = heavy_hitters.merge_summaries(
+            self.summary,
+            heavy_hitters.cal_summary(values[rows], weights, self.top.capacity),
+            self.top.capacity,
+        )
+
+    def merge(self, other):
+        """
+        adds the accumulator of the same top-k of another input
+        """
+        self.summary = heavy_hitters.merge_summaries(
+            self.summary, other.summary, self.top.capacity
+        )
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "topk:" + self.top.name
+
+    def get_state(self) -> dict:
+        """
+        returns the partial aggregate state
+        """
+        return self.summary
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        self.summary = state
+
+    def result(self) -> dict:
+        """
+        returns the top-k values and their error bounds
+        """
+        return {self.top.name: heavy_hitters.get_top(self.summary, self.top.k)}
+
+
+class FilteredAggregateAccumulator:
+    """
+    accumulates the filtered aggregates: the stats of a column are
+    computed once per predicate for all the functions of the column,
+    and the mask of a predicate is shared by all the columns
+    """
+
+    def __init__(self, filtered_aggregates):
+        self.filtered_aggregates = filtered_aggregates
+        # (column, predicate) => stats needed by the functions
+        self.needed = {}
+        for aggregate in filtered_aggregates:
+            self.needed.setdefault((aggregate.column, aggregate.predicate), set()).update(
+                custom_functions.BASE_AGGREGATE_STATS[aggregate.function]
+            )
+        self.stats = {key: custom_functions.init_column_stats() for key in self.needed}
+        # (column, predicate) of the columns that are not numeric
+        # in any of the chunks, for the stats that need numeric values
+        self.invalid = set()
+
+    def update(self, chunk):
+        """
+        adds the rows of the chunk that match each predicate
+        """
+        for key, needed in self.needed.items():
+            if key in self.invalid:
+                continue
+            column, predicate = key
+            if not custom_functions.is_valid_column(chunk[column], needed):
+                self.invalid.add(key)
+                self.stats[key] = custom_functions.init_column_stats()
+                continue
+            mask = predicates.get_mask(predicate, chunk)
+            custom_functions.merge_column_stats(
+                self.stats[key],
+                custom_functions.cal_stats_of_column(chunk[column][mask], needed),
+            )
+
+    def merge(self, other):
+        """
+        adds the accumulator of another input
+        """
+        self.invalid.update(other.invalid)
+        for key, stats in other.stats.items():
+            if key in self.invalid:
+                self.stats[key] = custom_functions.init_column_stats()
+            else:
+                custom_functions.merge_column_stats(self.stats[key], stats)
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "filtered"
+
+    def get_state(self) -> dict:
+        """
+        returns the partial aggregate state
+        """
+        return {
+            "invalid": sorted(self.invalid),
+            "stats": [(key, get_stats_state(stats)) for key, stats in self.stats.items()],
+        }
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        self.invalid = {tuple(key) for key in state["invalid"]}
+        for key, stats in state["stats"]:
+            self.stats[tuple(key)] = set_stats_state(stats)
+
+    def result(self) -> dict:
+        """
+        returns name => value of each filtered aggregate
+        """
+        result = {}
+        for aggregate in self.filtered_aggregates:
+            key = (aggregate.column, aggregate.predicate)
+            if key not in self.invalid:
+                result[aggregate.name] = custom_functions.get_base_aggregates(
+                    self.stats[key], [aggregate.function]
+                )[0]
+        return result
+
+
+def get_group_key(values) -> tuple:
+    """
+    returns the group key of the dimension values as python
+    scalars, None for missing values
+    """
+    return tuple(
+        None if pd.isna(value) else value.item() if isinstance(value, np.generic) else value
+        for value in values
+    )
+
+
+class GroupByAccumulator:
+    """
+    accumulates the aggregates of the plan per group of the values of
+    its dimension columns, at most max_groups groups, the groups with
+    the fewest rows are collapsed into the other group. the key of the
+    other group is the empty tuple, so that it is never the key of the
+    values of a group, say OTHER_GROUP
+    """
+
+    other_key = ()
+
+    def __init__(self, plan):
+        self.dimensions = list(plan.dimensions)
+        self.max_groups = plan.max_groups
+        self.group_plan = plan._replace(dimensions=(), rollup_interval=0)
+        # group key => accumulators of the group
+        self.groups = {}
+        # group key => number of rows
+        self.rows = {}
+
+    def get_group(self, key) -> list:
+        """
+        returns the accumulators of the group, created if needed
+        """
+        if key not in self.groups:
+            self.groups[key] = init_accumulators(self.group_plan)
+            self.rows[key] = 0
+        return self.groups[key]
+
+    def update(self, chunk):
+        """
+        adds the rows of the chunk to their groups, from one groupby
+        over the dimension columns: the rows are sorted once by group,
+        and the accumulators of each group are updated once with its rows
+        """
+        if not len(chunk):
+            return
+        codes = (
+            chunk.groupby(self.dimensions, observed=True, sort=False, dropna=False)
+            .ngroup()
+            .to_numpy()
+        )
+        counts = np.bincount(codes)
+        _, first_rows = np.unique(codes, return_index=True)
+        keys = [
+            get_group_key(values)
+            for values in chunk[self.dimensions].iloc[first_rows].itertuples(index=False)
+        ]
+
+        # new groups by number of rows, while there is room,
+        # the rows of the other new groups go to the other group
+        room = self.max_groups - len(self.groups.keys() - {self.other_key})
+        target_codes = np.empty(len(keys), dtype="int64")
+        target_indexes = {}
+        for code in np.argsort(-counts, kind="stable").tolist():
+            key = keys[code]
+            if key not in self.groups:
+                if room > 0:
+                    room -= 1
+                else:
+                    key = self.other_key
+            target_codes[code] = target_indexes.setdefault(key, len(target_indexes))
+
+        row_targets = target_codes[codes]
+        order = np.argsort(row_targets, kind="stable")
+        bounds = np.searchsorted(row_targets[order], np.arange(1, len(target_indexes)))
+        for key, rows in zip(target_indexes, np.split(order, bounds)):
+            update_accumulators(self.get_group(key), [chunk.iloc[rows]])
+            self.rows[key] += len(rows)
+
+    def collapse(self):
+        """
+        merges the groups with the fewest rows into the other group,
+        so that there are at most max_groups other groups
+        """
+        keys = sorted(
+            (key for key in self.groups if key != self.other_key),
+            key=lambda key: -self.rows[key],
+        )
+        for key in keys[self.max_groups:]:
+            other = self.get_group(self.other_key)
+            for accumulator, group_accumulator in zip(other, self.groups.pop(key)):
+                accumulator.merge(group_accumulator)
+            self.rows[self.other_key] += self.rows.pop(key)
+
+    def merge(self, other):
+        """
+        adds the groups of the accumulator of another input
+        """
+        for key, group in other.groups.items():
+            if key in self.groups:
+                for accumulator, group_accumulator in zip(self.groups[key], group):
+                    accumulator.merge(group_accumulator)
+                self.rows[key] += other.rows[key]
+            else:
+                self.groups[key] = group
+                self.rows[key] = other.rows[key]
+        self.collapse()
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "groupby"
+
+    def get_state(self) -> list:
+        """
+        returns the partial aggregate state
+        """
+        return [
+            (
+                key,
+                self.rows[key],
+                {accumulator.get_key(): accumulator.get_state() for accumulator in group},
+            )
+            for key, group in self.groups.items()
+        ]
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        for key, rows, group_state in state:
+            group = self.get_group(tuple(key))
+            for accumulator in group:
+                if accumulator.get_key() in group_state:
+                    accumulator.set_state(group_state[accumulator.get_key()])
+            self.rows[tuple(key)] = rows
+
+    def result(self) -> dict:
+        """
+        returns the result of each group, by number of rows,
+        the other group last
+        """
+        keys = sorted(
+            self.groups, key=lambda key: (key == self.other_key, -self.rows[key])
+        )
+        return {"groups": [self.get_group_result(key) for key in keys]}
+
+    def get_group_result(self, key) -> dict:
+        """
+        returns the dimension values, rows and result of the group,
+        the dimension values of the other group are OTHER_GROUP
+        """
+        if key == self.other_key:
+            return {
+                "dimensions": dict.fromkeys(self.dimensions, OTHER_GROUP),
+                "other": True,
+                "rows": self.rows[key],
+                "result": get_result(self.groups[key]),
+            }
+        return {
+            "dimensions": dict(zip(self.dimensions, key)),
+            "rows": self.rows[key],
+            "result": get_result(self.groups[key]),
+        }
+
+
+class RollupAccumulator:
+    """
+    accumulates all the aggregates of the plan per time bucket of
+    its rollup_interval, for the rollup store. the accumulators of
+    a bucket are those of the bucket plan, and the result of the
+    input is left to the other accumulators
+    """
+
+    def __init__(self, plan):
+        self.time_column = plan.time_column
+        self.interval_seconds = plan.rollup_interval * AGG_INTERVAL_SECONDS
+        self.bucket_plan = plan.get_bucket_plan()
+        # bucket start (epoch seconds) => accumulators of the bucket
+        self.buckets = {}
+
+    def get_bucket(self, bucket) -> list:
+        """
+        returns the accumulators of the bucket, created if needed
+        """
+        if bucket not in self.buckets:
+            self.buckets[bucket] = init_accumulators(self.bucket_plan)
+        return self.buckets[bucket]
+
+    def update(self, chunk):
+        """
+        adds the rows of the chunk with a request time to their bucket
+        """
+        rows, buckets = custom_functions.get_time_buckets(
+            chunk[self.time_column], self.interval_seconds
+        )
+        bucket_starts = np.unique(buckets)
+        pieces = custom_functions.split_by_bucket(np.flatnonzero(rows), buckets, bucket_starts)
+        for bucket, piece in zip(bucket_starts.tolist(), pieces):
+            update_accumulators(self.get_bucket(bucket), [chunk.iloc[piece]])
+
+    def merge(self, other):
+        """
+        adds the buckets of the accumulator of another input
+        """
+        for bucket, bucket_accumulators in other.buckets.items():
+            if bucket in self.buckets:
+                merge_accumulators([self.buckets[bucket], bucket_accumulators])
+            else:
+                self.buckets[bucket] = bucket_accumulators
+
+    def get_key(self) -> str:
+        """
+        returns the key of the accumulator in the serialized state
+        """
+        return "rollup"
+
+    def get_state(self) -> list:
+        """
+        returns the partial aggregate state
+        """
+        return [
+            (
+                bucket,
+                {accumulator.get_key(): accumulator.get_state() for accumulator in group},
+            )
+            for bucket, group in self.buckets.items()
+        ]
+
+    def set_state(self, state):
+        """
+        sets the partial aggregate state of get_state
+        """
+        for bucket, bucket_state in state:
+            for accumulator in self.get_bucket(bucket):
+                if accumulator.get_key() in bucket_state:
+                    accumulator.set_state(bucket_state[accumulator.get_key()])
+
+    def get_bucket_states(self) -> dict:
+        """
+        returns bucket start => binary partial state of the bucket
+        """
+        return {
+            bucket: dump_state(self.bucket_plan, self.buckets[bucket])
+            for bucket in sorted(self.buckets)
+        }
+
+    def result(self) -> dict:
+        """
+        the buckets are in the rollup store, not in the result
+        """
+        return {}
+
+
+def get_rollup_states(accumulators) -> dict:
+    """
+    returns bucket start => binary partial state of the bucket,
+    empty when the plan has no rollups
+    """
+    for accumulator in accumulators:
+        if isinstance(accumulator, RollupAccumulator):
+            return accumulator.get_bucket_states()
+    return {}
+
+
+def init_accumulators(plan) -> list:
+    """
+    returns the list of accumulators for the base aggregates
+    and custom functions in the aggregation plan
+    """
+    accumulators = []
+    for aggregate in plan.get_whole_file_aggregates():
+        accumulators.append(BaseAggregateAccumulator(aggregate.column, aggregate.funcs))
+
+    interval_aggregates = plan.get_interval_aggregates()
+    if interval_aggregates:
+        accumulators.append(TimeSeriesAccumulator(plan.time_column, interval_aggregates))
+
+    for name in plan.get_custom_function_names():
+        function = function_registry.get_custom_function(name)
+        if function is not None:
+            accumulators.append(CustomFunctionAccumulator(function))
+
+    for top in plan.top_k:
+        accumulators.append(TopKAccumulator(top))
+
+    if plan.filtered_aggregates:
+        accumulators.append(FilteredAggregateAccumulator(plan.filtered_aggregates))
+
+    if plan.dimensions:
+        accumulators.append(GroupByAccumulator(plan))
+
+    if plan.rollup_interval:
+        accumulators.append(RollupAccumulator(plan))
+
+    return accumulators
+
+
+def update_accumulators(accumulators, chunks) -> list:
+    """
+    adds each of the chunks to all the accumulators,
+    the masks of the predicates are shared by the accumulators of a chunk
+    """
+    for chunk in chunks:
+        with predicates.shared_masks(chunk):
+            for accumulator in accumulators:
+                accumulator.update(chunk)
+    return accumulators
+
+
+def merge_accumulators(accumulators_list) -> list:
+    """
+    merges the accumulators of many inputs, all created by
+    init_accumulators for the same plan, into the first one
+    """
+    merged = accumulators_list[0]
+    for accumulators in accumulators_list[1:]:
+        for accumulator, other in zip(merged, accumulators):
+            accumulator.merge(other)
+    return merged
+
+
+def dump_state(plan, accumulators) -> bytes:
+    """
+    returns the compact binary partial aggregate state of the
+    accumulators, tagged with the digest of their plan
+    """
+    return state_codec.encode(
+        {
+            "plan": plan.get_digest(),
+            "states": {
+                accumulator.get_key(): accumulator.get_state()
+                for accumulator in accumulators
+            },
+        }
+    )
+
+
+def load_state(plan, data) -> list:
+    """
+    returns the accumulators of the plan set
+    to the binary state returned by dump_state
+    """
+    state = state_codec.decode(data)
+    if state["plan"] != plan.get_digest():
+        raise ValueError("state is of another aggregation plan: {}".format(state["plan"]))
+
+    accumulators = init_accumulators(plan)
+    for accumulator in accumulators:
+        if accumulator.get_key() in state["states"]:
+            accumulator.set_state(state["states"][accumulator.get_key()])
+    return accumulators
+
+
+def merge_states(plan, states) -> list:
+    """
+    returns the accumulators of the plan with the merge
+    of the binary states, say of the files of an hour
+    """
+    return merge_accumulators([load_state(plan, data) for data in states])
+
+
+def get_function_timings(accumulators) -> dict:
+    """
+    returns custom function name => seconds spent in it
+    """
+    return {
+        accumulator.function.name: accumulator.elapsed
+        for accumulator in accumulators
+        if isinstance(accumulator, CustomFunctionAccumulator)
+    }
+
+
+def get_result(accumulators) -> dict:
+    """
+    returns the result of all the accumulators
+    """
+    result = {}
+    for accumulator in accumulators:
+        result.update(accumulator.result())
+    return result
@@ -0,0 +1,106 @@
+"""
+parsing engine for STRUCTURED input based on
+Apache Arrow's multithreaded CSV reader
+"""
+
+import logging
+
+import pyarrow as pa
+from pyarrow import csv
+
+from aggregation_code.utils import NULL_SENTINEL, get_ordered_columns
+
+logger = logging.getLogger(__name__)
+
+# bytes of input parsed per block, blocks are parsed in parallel
+BLOCK_SIZE = 4 << 20
+
+
+def get_column_types(field_dtypes, usecols) -> dict:
+    """
+    returns the arrow column types for the fields in usecols,
+    from the dtypes in the all_datastream_fields file
+    """
+    column_types = {}
+    for name, spec in field_dtypes.items():
+        if name not in usecols:
+            continue
+        if spec["categorical"]:
+            column_types[name] = pa.dictionary(pa.int32(), pa.string())
+        elif spec["dtype"] == "bigint":
+            column_types[name] = pa.float64()
+    return column_types
+
+
+def get_csv_options(chosen_field_names, usecols, field_dtypes, delimiter):
+    """
+    returns the read, parse and convert options of the arrow reader
+    """
+    read_options = csv.ReadOptions(
+        column_names=chosen_field_names, use_threads=True, block_size=BLOCK_SIZE
+    )
+    parse_options = csv.ParseOptions(delimiter=delimiter)
+    # NULL_SENTINEL is null for the typed columns only,
+    # as strings are not nullable by default
+    convert_options = csv.ConvertOptions(
+        include_columns=get_ordered_columns(chosen_field_names, usecols),
+        column_types=get_column_types(field_dtypes, usecols),
+        null_values=[NULL_SENTINEL, ""],
+    )
+    return read_options, parse_options, convert_options
+
+
+def read_csv(
+    filename_or_buffer,
+    chosen_field_names,
+    usecols,
+    field_dtypes,
+    delimiter,
+    compression="gzip",
+):
+    """
+    reads the gzip compressed (unless compression is None)
+    input and returns a dataframe
+    """
+    with pa.input_stream(filename_or_buffer, compression=compression) as input_stream:
+        table = csv.read_csv(
+            input_stream,
+            *get_csv_options(chosen_field_names, usecols, field_dtypes, delimiter)
+        )
+    # release the arrow buffers as the columns are converted
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def iter_csv(
+    filename_or_buffer,
+    chosen_field_names,
+    usecols,
+    field_dtypes,
+    delimiter,
+    chunksize,
+    compression="gzip",
+):
+    """
+    reads the gzip compressed (unless compression is None) input as
+    a stream of record batches and yields dataframes of chunksize rows
+    """
+    with pa.input_stream(filename_or_buffer, compression=compression) as input_stream:
+        reader = csv.open_csv(
+            input_stream,
+            *get_csv_options(chosen_field_names, usecols, field_dtypes, delimiter)
+        )
+        batches, rows = [], 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows < chunksize:
+                continue
+
+            table = pa.Table.from_batches(batches)
+            for offset in range(0, rows - chunksize + 1, chunksize):
+                yield table.slice(offset, chunksize).to_pandas()
+            remaining = table.slice(rows - rows % chunksize)
+            batches, rows = remaining.to_batches(), remaining.num_rows
+
+        if rows:
+            yield pa.Table.from_batches(batches).to_pandas()
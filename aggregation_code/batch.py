@@ -0,0 +1,217 @@
+"""
+batch mode: aggregates many local input files, say days of logs,
+in a pool of processes. each worker reads the metadata and the
+aggregation plan once, aggregates whole files and returns their
+binary partial state, that is merged into one result
+"""
+
+import glob
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from aggregation_code import accumulators, hyperloglog, ledger, plan_class, quantile_sketch
+from aggregation_code.dashboard_class import StreamDash
+
+logger = logging.getLogger(__name__)
+
+# StreamDash of the worker process, with the metadata and plan read
+WORKER = None
+
+GLOB_CHARACTERS = "*?["
+
+
+def get_input_files(spec) -> list:
+    """
+    returns the sorted list of files of the directory (recursive),
+    the glob pattern, or the path prefix as for the keys of
+    an object store, say sample-input/test-data-
+    """
+    if os.path.isdir(spec):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(spec)
+            for name in names
+        )
+    if any(character in spec for character in GLOB_CHARACTERS):
+        return sorted(path for path in glob.glob(spec, recursive=True) if os.path.isfile(path))
+
+    directory = os.path.dirname(spec) or "."
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        path
+        for path in (
+            os.path.join(root, name)
+            for root, _, names in os.walk(directory)
+            for name in names
+        )
+        if os.path.normpath(path).startswith(os.path.normpath(spec))
+    )
+
+
+def get_processes(processes) -> int:
+    """
+    returns the number of processes, the number of cores when not set
+    """
+    return processes if processes and processes > 0 else os.cpu_count() or 1
+
+
+def init_worker(chunksize, engine, sketch_accuracy, hll_precision, rollup_interval=0):
+    """
+    reads the metadata and the plan, once per worker process,
+    with the rollups of the plan of the parent process
+    """
+    # pylint: disable=global-statement
+    global WORKER
+    quantile_sketch.RELATIVE_ACCURACY = sketch_accuracy
+    hyperloglog.PRECISION = hll_precision
+    WORKER = StreamDash(chunksize=chunksize, engine=engine)
+    WORKER.read_metadata()
+    if rollup_interval:
+        WORKER.plan = plan_class.with_rollups(WORKER.plan, rollup_interval)
+
+
+def count_rows(chunks, counter):
+    """
+    yields the chunks, adding their number of rows to counter["rows"]
+    """
+    for chunk in chunks:
+        counter["rows"] += len(chunk)
+        yield chunk
+
+
+def aggregate_file(input_file) -> tuple:
+    """
+    returns (rows, binary partial state) of the input file,
+    aggregated by the StreamDash of the worker
+    """
+    dataframe = WORKER.read_input(input_file)
+    counter = {"rows": 0}
+    chunks = count_rows(dataframe if WORKER.chunksize else [dataframe], counter)
+    input_accumulators = accumulators.update_accumulators(
+        accumulators.init_accumulators(WORKER.plan), chunks
+    )
+    return counter["rows"], accumulators.dump_state(WORKER.plan, input_accumulators)
+
+
+def get_recorded_states(obj, input_files, processing_ledger) -> dict:
+    """
+    returns input file => state recorded in the ledger
+    for the file and the plan of obj
+    """
+    if processing_ledger is None:
+        return {}
+    digest = obj.plan.get_digest()
+    states = {}
+    for input_file in input_files:
+        recorded = processing_ledger.lookup(
+            ledger.get_file_id(input_file),
+            ledger.get_file_version(input_file),
+            digest,
+            need_state=True,
+        )
+        if recorded is not None:
+            states[input_file] = recorded[1]
+    return states
+
+
+def process_files(
+    obj, input_files, processes=None, processing_ledger=None, rollup_store=None, processed=None
+) -> dict:
+    """
+    aggregates the input files in a pool of processes, the states
+    are merged as they complete with the plan of obj.
+    the files recorded in the ledger are not read, their recorded
+    state is merged, and the files processed are recorded,
+    and their buckets upserted into the rollup store.
+    the states of the files processed are added to the list processed
+    returns the merged result, the files that failed and the
+    throughput of the run, of the files read: the files recorded
+    in the ledger and the files that failed are counted apart
+    """
+    # pylint: disable=too-many-locals
+    processes = get_processes(processes)
+    size = sum(os.path.getsize(input_file) for input_file in input_files)
+    logger.info(
+        "aggregating %s files, %.1f MB, with %s processes",
+        len(input_files),
+        size / 1e6,
+        processes,
+    )
+
+    start = time.perf_counter()
+    merged = accumulators.init_accumulators(obj.plan)
+    recorded = get_recorded_states(obj, input_files, processing_ledger)
+    for state in recorded.values():
+        merged = accumulators.merge_accumulators(
+            [merged, accumulators.load_state(obj.plan, state)]
+        )
+    rows, read, read_size = 0, 0, 0
+    failed = []
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=init_worker,
+        initargs=(
+            obj.chunksize,
+            obj.engine,
+            quantile_sketch.RELATIVE_ACCURACY,
+            hyperloglog.PRECISION,
+            obj.plan.rollup_interval,
+        ),
+    ) as executor:
+        futures = {
+            executor.submit(aggregate_file, input_file): input_file
+            for input_file in input_files
+            if input_file not in recorded
+        }
+        for future in as_completed(futures):
+            try:
+                file_rows, state = future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error(
+                    "processing failed for %s: %s: %s", futures[future], type(err), err
+                )
+                failed.append(futures[future])
+                continue
+            rows += file_rows
+            read += 1
+            read_size += os.path.getsize(futures[future])
+            file_accumulators = accumulators.load_state(obj.plan, state)
+            if processed is not None:
+                processed.append(state)
+            if processing_ledger is not None:
+                processing_ledger.record(
+                    ledger.get_file_id(futures[future]),
+                    ledger.get_file_version(futures[future]),
+                    obj.plan.get_digest(),
+                    accumulators.get_result(file_accumulators),
+                    state,
+                )
+            if rollup_store is not None:
+                rollup_store.upsert(obj.plan, accumulators.get_rollup_states(file_accumulators))
+            merged = accumulators.merge_accumulators([merged, file_accumulators])
+    seconds = time.perf_counter() - start
+
+    obj.accumulators = merged
+    output = {
+        "files": len(input_files) - len(failed),
+        "recorded": len(recorded),
+        "failed": sorted(failed),
+        "merged": accumulators.get_result(merged),
+        "stats": {
+            "processes": processes,
+            "seconds": round(seconds, 3),
+            "files_read": read,
+            "files_skipped": len(recorded),
+            "files_failed": len(failed),
+            "rows": rows,
+            "bytes": read_size,
+            "files_per_second": round(read / seconds, 2),
+            "rows_per_second": round(rows / seconds, 1),
+            "mb_per_second": round(read_size / 1e6 / seconds, 2),
+        },
+    }
+    logger.info("batch stats: %s", output["stats"])
+    return output
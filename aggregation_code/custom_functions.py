@@ -1,12 +1,18 @@
 """
 defines all custom functions to aggregate the data
 """
+import functools
 import json
 import logging
-import os
-import time
+import math
+from collections import Counter
+from datetime import datetime, timezone
+from urllib.parse import unquote
 
-import httpagentparser
+import numpy as np
+import pandas as pd
+
+from aggregation_code import hyperloglog, quantile_sketch
 
 logger = logging.getLogger(__name__)
 
@@ -47,15 +53,15 @@ def convert_time(epoch_time, time_format="%s", delta=1):
         >>> convert_time(epoch_time, delta=300)
         '1541399100'
     """
-    os.environ["TZ"] = "UTC"
-    time.tzset()
     # reset delta if unexpected value
     if delta <= 0:
         delta = 1
     # round off the epoch to specified delta
     epoch_rounded = float(epoch_time) - (float(epoch_time) % delta)
-    # return in GMT format
-    return time.strftime(time_format, time.gmtime(float(epoch_rounded)))
+    # return in GMT format, independent of the TZ of the process;
+    # %s of strftime is local time, so it is replaced by the epoch
+    time_format = time_format.replace("%s", str(int(epoch_rounded)))
+    return datetime.fromtimestamp(epoch_rounded, timezone.utc).strftime(time_format)
 
 
 def is_valid_datatype(data_to_check, data_types):
@@ -69,28 +75,330 @@ def is_valid_datatype(data_to_check, data_types):
     return True
 
 
-def cal_base_aggregates(lst, csvdata, col):
-    """
-    basic aggregations are defined here
-    """
-    out = 0
-    if lst == "sum":
-        out = csvdata[col].sum()
-    if lst == "min":
-        out = csvdata[col].min()
-    if lst == "max":
-        out = csvdata[col].max()
-    if lst == "mean":
-        out = csvdata[col].mean()
-    if lst == "median":
-        out = csvdata[col].median()
-    if lst == "variance":
-        out = csvdata[col].median()
-    if lst == "any":
-        out = csvdata[col].any()
-    if lst == "count":
-        out = csvdata[col].count()
-    return float(out)
+def is_numeric_column(column):
+    """
+    check if the dtype of the column is numeric,
+    missing values are ignored
+    """
+    return pd.api.types.is_numeric_dtype(column)
+
+
+# stats of a column needed by each base aggregate function
+BASE_AGGREGATE_STATS = {
+    "sum": ("sum",),
+    "min": ("min",),
+    "max": ("max",),
+    "mean": ("sum", "count"),
+    "median": ("values",),
+    "variance": ("sum", "sumsq", "count"),
+    "any": ("any",),
+    "count": ("count",),
+    "p50": ("sketch",),
+    "p95": ("sketch",),
+    "p99": ("sketch",),
+    "distinct": ("hll",),
+}
+
+# stats of the columns of any dtype, the others need numeric values
+ANY_DTYPE_STATS = {"hll"}
+
+# quantile of the approximate percentile functions, from a quantile sketch
+QUANTILE_FUNCTIONS = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+
+
+def get_needed_stats(funcs) -> set:
+    """
+    returns the stats of a column needed for the functions
+    """
+    return {
+        stat for function in funcs for stat in BASE_AGGREGATE_STATS.get(function, ())
+    }
+
+
+def needs_numeric_values(needed) -> bool:
+    """
+    checks if any of the needed stats is computed from numeric values
+    """
+    return bool(set(needed) - ANY_DTYPE_STATS)
+
+
+def is_valid_column(column, needed) -> bool:
+    """
+    checks if the needed stats can be computed for the column
+    """
+    return not needs_numeric_values(needed) or is_numeric_column(column)
+
+
+def get_value_hashes(column) -> tuple:
+    """
+    returns (rows, hashes): the mask of the non null values of the column
+    and their uint64 hashes. numeric values are hashed as float64, so that
+    a value has the same hash whatever the integer type of the column
+    """
+    if is_numeric_column(column):
+        values = column.to_numpy(dtype="float64", na_value=np.nan)
+        rows = ~np.isnan(values)
+        return rows, pd.util.hash_array(values[rows])
+    rows = column.notna().to_numpy()
+    return rows, pd.util.hash_pandas_object(column[rows], index=False).to_numpy()
+
+
+def get_numeric_values(column):
+    """
+    returns the non null values of a numeric column as a float64 array
+    """
+    values = column.to_numpy(dtype="float64", na_value=np.nan)
+    if column.hasnans:
+        values = values[~np.isnan(values)]
+    return values
+
+
+def init_column_stats() -> dict:
+    """
+    returns the stats of a column with no values.
+    sumsq is the sum of squares of (value - shift), shift being
+    a value of the column, so that the variance does not lose
+    precision when the mean is large compared to the spread
+    """
+    return {
+        "count": 0,
+        "sum": 0.0,
+        "shift": 0.0,
+        "sumsq": 0.0,
+        "min": np.nan,
+        "max": np.nan,
+        "any": False,
+        "values": [],
+        "sketch": None,
+        "hll": None,
+    }
+
+
+def cal_column_stats(values, needed) -> dict:
+    """
+    returns the needed stats of the float64 array of values,
+    each stat is a single vectorized reduction over the array
+    """
+    stats = init_column_stats()
+    stats["count"] = len(values)
+    if not stats["count"]:
+        return stats
+    if "sum" in needed:
+        stats["sum"] = values.sum()
+    if "sumsq" in needed:
+        stats["shift"] = values[0]
+        shifted = values - stats["shift"]
+        stats["sumsq"] = np.dot(shifted, shifted)
+    if "min" in needed:
+        stats["min"] = values.min()
+    if "max" in needed:
+        stats["max"] = values.max()
+    if "any" in needed:
+        stats["any"] = bool(values.any())
+    if "values" in needed:
+        stats["values"] = [values]
+    if "sketch" in needed:
+        stats["sketch"] = quantile_sketch.cal_sketch(values)
+    return stats
+
+
+def merge_column_stats(stats, other) -> dict:
+    """
+    adds the stats of other to stats
+    """
+    if not stats["count"]:
+        stats["shift"] = other["shift"]
+    # sum of squares of other, shifted by the shift of stats
+    delta = other["shift"] - stats["shift"]
+    shifted_sum = other["sum"] - other["count"] * other["shift"]
+    stats["sumsq"] += (
+        other["sumsq"] + 2 * delta * shifted_sum + other["count"] * delta * delta
+    )
+    stats["count"] += other["count"]
+    stats["sum"] += other["sum"]
+    stats["min"] = np.fmin(stats["min"], other["min"])
+    stats["max"] = np.fmax(stats["max"], other["max"])
+    stats["any"] = stats["any"] or other["any"]
+    stats["values"].extend(other["values"])
+    if other["sketch"] is not None:
+        if stats["sketch"] is None:
+            stats["sketch"] = quantile_sketch.init_sketch(other["sketch"]["accuracy"])
+        quantile_sketch.merge_sketches(stats["sketch"], other["sketch"])
+    if other["hll"] is not None:
+        if stats["hll"] is None:
+            stats["hll"] = hyperloglog.init_hll(other["hll"]["precision"])
+        hyperloglog.merge_hlls(stats["hll"], other["hll"])
+    return stats
+
+
+def cal_stats_of_column(column, needed) -> dict:
+    """
+    returns the needed stats of the column,
+    the numeric stats are left empty if the column is not numeric
+    """
+    values = get_numeric_values(column) if is_numeric_column(column) else np.empty(0)
+    stats = cal_column_stats(values, needed)
+    if "hll" in needed:
+        stats["hll"] = hyperloglog.cal_hll(get_value_hashes(column)[1])
+    return stats
+
+
+def get_base_aggregates(stats, funcs) -> list:
+    """
+    returns the value of each function from the column stats.
+    mean and (sample) variance are derived from sum, sum of squares and count.
+    a value that is not defined, say min of no values, is None
+    """
+    count = stats["count"]
+    mean = stats["sum"] / count if count else np.nan
+    aggregates = {
+        "sum": stats["sum"],
+        "min": stats["min"],
+        "max": stats["max"],
+        "mean": mean,
+        "any": stats["any"],
+        "count": count,
+        "distinct": hyperloglog.get_estimate(stats["hll"]) if stats["hll"] else 0,
+    }
+    if "variance" in funcs:
+        shifted_mean = mean - stats["shift"]
+        aggregates["variance"] = (
+            max(stats["sumsq"] - count * shifted_mean * shifted_mean, 0.0) / (count - 1)
+            if count > 1
+            else np.nan
+        )
+    if "median" in funcs:
+        aggregates["median"] = (
+            np.median(np.concatenate(stats["values"])) if stats["values"] else np.nan
+        )
+    quantiles = [function for function in funcs if function in QUANTILE_FUNCTIONS]
+    if quantiles:
+        aggregates.update(
+            zip(
+                quantiles,
+                quantile_sketch.get_quantiles(
+                    stats["sketch"] or quantile_sketch.init_sketch(),
+                    [QUANTILE_FUNCTIONS[function] for function in quantiles],
+                ),
+            )
+        )
+    # converted to python floats at once, NaN to None as it is not valid JSON
+    return [
+        None if math.isnan(value) else value
+        for value in np.array(
+            [aggregates.get(function, 0) for function in funcs], dtype="float64"
+        ).tolist()
+    ]
+
+
+def cal_base_aggregates(column, funcs) -> list:
+    """
+    basic aggregations are defined here.
+    returns the value of each function of funcs for the column,
+    computed from the stats of a single float64 copy of the column
+    """
+    stats = cal_stats_of_column(column, get_needed_stats(funcs))
+    return get_base_aggregates(stats, funcs)
+
+
+def get_time_buckets(time_column, interval_seconds) -> tuple:
+    """
+    returns (rows, buckets): the mask of the rows with a request time
+    and the start of their time bucket in epoch seconds,
+    floored to interval_seconds with integer arithmetic
+    """
+    times = time_column.to_numpy(dtype="float64", na_value=np.nan)
+    rows = ~np.isnan(times)
+    seconds = np.floor(times[rows]).astype("int64")
+    return rows, seconds - seconds % interval_seconds
+
+
+def split_by_bucket(values, value_buckets, bucket_starts) -> list:
+    """
+    returns the values of each of the sorted bucket starts,
+    value_buckets being the bucket start of each value
+    """
+    order = np.argsort(value_buckets, kind="stable")
+    bounds = np.searchsorted(value_buckets[order], bucket_starts[1:])
+    return np.split(values[order], bounds)
+
+
+def cal_time_bucket_stats(dataframe, time_column, interval_seconds, aggregates) -> dict:
+    """
+    returns bucket start => column => stats, for the base aggregates
+    of the columns, from a single groupby on the bucket start
+    """
+    rows, buckets = get_time_buckets(dataframe[time_column], interval_seconds)
+    bucket_starts = np.unique(buckets)
+
+    columns, shifts, needed = {}, {}, {}
+    for aggregate in aggregates:
+        col = aggregate.column
+        needed[col] = get_needed_stats(aggregate.funcs)
+        if not needs_numeric_values(needed[col]):
+            continue
+        values = dataframe[col].to_numpy(dtype="float64", na_value=np.nan)[rows]
+        columns[col] = values
+        if "sumsq" in needed[col]:
+            # sum of squares around a value of the column
+            not_null = values[~np.isnan(values)]
+            shifts[col] = not_null[0] if len(not_null) else 0.0
+            columns[col + ":sumsq"] = (values - shifts[col]) ** 2
+        if "any" in needed[col]:
+            columns[col + ":any"] = (values != 0) & ~np.isnan(values)
+
+    numeric_columns = [col for col in needed if col in columns]
+    reductions = {}
+    if numeric_columns:
+        grouped = pd.DataFrame(columns).groupby(buckets, sort=True)
+        reductions = {"count": grouped[numeric_columns].count(), "sum": grouped.sum()}
+        for stat in ("min", "max"):
+            stat_columns = [col for col in numeric_columns if stat in needed[col]]
+            if stat_columns:
+                reductions[stat] = getattr(grouped[stat_columns], stat)()
+
+    bucket_stats = {}
+    for bucket in bucket_starts.tolist():
+        bucket_stats[bucket] = {}
+        for col in needed:
+            stats = init_column_stats()
+            bucket_stats[bucket][col] = stats
+            if col not in columns:
+                continue
+            stats["count"] = int(reductions["count"].at[bucket, col])
+            stats["sum"] = reductions["sum"].at[bucket, col]
+            if col in shifts:
+                stats["shift"] = shifts[col]
+                stats["sumsq"] = reductions["sum"].at[bucket, col + ":sumsq"]
+            if "any" in needed[col]:
+                stats["any"] = bool(reductions["sum"].at[bucket, col + ":any"])
+            for stat in ("min", "max"):
+                if stat in needed[col]:
+                    stats[stat] = reductions[stat].at[bucket, col]
+
+    # values of each bucket, for the exact median and the quantile sketches
+    for col in numeric_columns:
+        if not needed[col] & {"values", "sketch"}:
+            continue
+        pieces = split_by_bucket(columns[col], buckets, bucket_starts)
+        for bucket, piece in zip(bucket_starts.tolist(), pieces):
+            piece = piece[~np.isnan(piece)]
+            if "sketch" in needed[col]:
+                bucket_stats[bucket][col]["sketch"] = quantile_sketch.cal_sketch(piece)
+            if len(piece) and "values" in needed[col]:
+                bucket_stats[bucket][col]["values"] = [piece]
+
+    # hashes of the values of each bucket, for the distinct counts
+    for col in needed:
+        if "hll" not in needed[col]:
+            continue
+        hash_rows, hashes = get_value_hashes(dataframe[col][rows])
+        pieces = split_by_bucket(hashes, buckets[hash_rows], bucket_starts)
+        for bucket, piece in zip(bucket_starts.tolist(), pieces):
+            bucket_stats[bucket][col]["hll"] = hyperloglog.cal_hll(piece)
+
+    return bucket_stats
+
 
 def get_unique_counts_of_column(input_df) -> dict:
     """
@@ -105,14 +413,23 @@ def cal_stat_count(status_code_df):
     returns {2,3,4,5}xx_count and request_count
     """
 
+    return cal_stat_count_from_counts(
+        get_unique_counts_of_column(status_code_df), int(status_code_df.count())
+    )
+
+
+def cal_stat_count_from_counts(uniq_status_code_counts, request_count):
+    """
+    returns {2,3,4,5}xx_count and request_count
+    from the distinct counts of the statuscode column
+    """
     mdata = init_metric_fillers()
-    uniq_status_code_counts = get_unique_counts_of_column(status_code_df)
     for status_code, st_count in uniq_status_code_counts.items():
         status_code_prefix = int(int(status_code) / 100)
         if status_code_prefix in [2, 3, 4, 5]:
             mdata[str(status_code_prefix) + "xx_count"] += st_count
 
-    mdata["request_count"] = int(status_code_df.count())
+    mdata["request_count"] = request_count
     return mdata
 
 
@@ -134,19 +451,42 @@ def cal_cache_status(cache_df):
     }
     ```
     """
-    uniq_cache_counts = get_unique_counts_of_column(cache_df)
+    return cal_cache_status_from_counts(get_unique_counts_of_column(cache_df))
+
+
+def cal_cache_status_from_counts(uniq_cache_counts):
+    """
+    returns cache_hit and cache_miss
+    from the distinct counts of the cachestatus column
+    """
     cache = {}
     cache["cache_hit"] = uniq_cache_counts.get("1", 0)
     cache["cache_miss"] = uniq_cache_counts.get("0", 0)
     return cache
 
 
-def cal_offload_rate(cache_df):
+# rows served from the cache, and fetched from the origin
+CACHE_HIT_PREDICATE = "cachestatus == 1"
+ORIGIN_PREDICATE = "cachestatus == 0 and cacherefreshsrc == 'origin'"
+
+
+def cal_offload_counts(dfs) -> tuple:
+    """
+    returns (cache hits, requests with a cachestatus)
+    """
+    # pylint: disable=import-outside-toplevel
+    from aggregation_code import predicates
+    hits = predicates.get_mask(CACHE_HIT_PREDICATE, dfs)
+    return int(hits.sum()), int(dfs["cachestatus"].count())
+
+
+def cal_offload_rate(dfs):
     """
     calculates offload rate as,
     total cache hits * 100 / total hits
     """
-    return cache_df[cache_df == 1].sum() * 100.00 / cache_df.count()
+    cache_hits, count = cal_offload_counts(dfs)
+    return cache_hits * 100.00 / count if count else None
 
 
 def cal_origin_responsetime(dfs):
@@ -155,22 +495,73 @@ def cal_origin_responsetime(dfs):
     sum("turnaroundtimemsec")
     where cachestatus == 0 and cacherefreshsrc == 'origin'
     """
-    return int(
-        dfs.query("cachestatus == 0 and cacherefreshsrc == 'origin'")[
-            "turnaroundtimemsec"
-        ].sum()
-    )
+    # pylint: disable=import-outside-toplevel
+    from aggregation_code import predicates
+    origin = predicates.get_mask(ORIGIN_PREDICATE, dfs)
+    return int(dfs["turnaroundtimemsec"][origin].sum())
+
+
+# client info extracted from the user agent
+UA_INFO = ("os", "browser", "platform")
+
+# distinct user agents kept parsed by the process, reused
+# by the warm invocations of the lambda/azure function
+UA_CACHE_SIZE = 8192
 
 
 def extract_from_ua(ua_string, to_extract):
     """
     extracts requested info from User Agent String
     """
-    client_info = httpagentparser.detect(ua_string)
-    if to_extract in client_info:
-        if client_info[to_extract]["name"] is not None:
-            return client_info[to_extract]["name"]
-    return str("invalid")
+    return detect_user_agent(ua_string)[UA_INFO.index(to_extract)]
+
+
+@functools.lru_cache(maxsize=UA_CACHE_SIZE)
+def detect_user_agent(ua_string) -> tuple:
+    """
+    returns the (os, browser, platform) names of the URL encoded
+    User Agent String, "invalid" when not detected
+    """
+    # imported on first use, only getuserAgent needs it
+    import httpagentparser  # pylint: disable=import-outside-toplevel
+
+    client_info = httpagentparser.detect(unquote(ua_string))
+    return tuple(
+        client_info[to_extract]["name"]
+        if to_extract in client_info and client_info[to_extract]["name"] is not None
+        else "invalid"
+        for to_extract in UA_INFO
+    )
+
+
+def count_user_agents(user_agent) -> dict:
+    """
+    returns os, browser, platform => counts of the names.
+    each distinct user agent is parsed once, and counted
+    by its code in the factorized column
+    """
+    codes, uniques = pd.factorize(user_agent)
+    unique_counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+
+    client_info = {to_extract: Counter() for to_extract in UA_INFO}
+    for ua_string, count in zip(uniques, unique_counts.tolist()):
+        for to_extract, name in zip(UA_INFO, detect_user_agent(ua_string)):
+            client_info[to_extract][name] += count
+
+    # user agents not set
+    missing = int((codes < 0).sum())
+    if missing:
+        for to_extract in UA_INFO:
+            client_info[to_extract]["invalid"] += missing
+    return client_info
+
+
+def sort_counts(counts) -> dict:
+    """
+    returns the counts ordered by count, highest first,
+    same as the order of value_counts()
+    """
+    return dict(Counter(counts).most_common())
 
 
 def parse_user_agent(user_agent):
@@ -189,16 +580,7 @@ def parse_user_agent(user_agent):
     }
     ```
     """
-    ua_info = (
-        "os",
-        "browser",
-        "platform",
-    )
-    client_info = {}
-    for to_extract in ua_info:
-        client_info[to_extract] = user_agent.apply(extract_from_ua, args=(to_extract,))
-        # convert to json
-        client_info[to_extract] = json.loads(
-            client_info[to_extract].value_counts().to_json()
-        )
-    return client_info
+    return {
+        to_extract: sort_counts(counts)
+        for to_extract, counts in count_user_agents(user_agent).items()
+    }
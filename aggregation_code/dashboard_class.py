@@ -2,20 +2,26 @@
 Functions to aggregate data
 """
 
+import collections
 import importlib
 import json
 import logging
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from aggregation_code import custom_functions
+from aggregation_code import accumulators, plan_class
 from aggregation_code.provision_class import ProvisionMetadata
 from aggregation_code.stream_class import StreamMetadata
 from aggregation_code.utils import BaseUtils
 
 logger = logging.getLogger(__name__)
 
+# cloud provider => storage object, reused by the
+# warm invocations of the lambda/azure function
+CLOUD_STORAGE_OBJECTS = {}
+
 
 def import_dynamic_modules(module_name):
     """
@@ -34,6 +40,18 @@ def import_dynamic_modules(module_name):
     return None
 
 
+def get_processed(input_file, future) -> tuple:
+    """
+    returns (input_file, accumulators) of the processed file,
+    or (input_file, exception) when its processing failed
+    """
+    try:
+        return input_file, future.result()
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("processing failed for %s: %s: %s", input_file, type(err), err)
+        return input_file, err
+
+
 class StreamDash:
     """
     main class that reads metadata,
@@ -42,22 +60,32 @@ class StreamDash:
 
     # pylint: disable=too-many-instance-attributes
 
-    def __init__(self, cloud_provider=None):
+    def __init__(self, cloud_provider=None, chunksize=None, engine="pandas"):
 
-        # setting time zone as UTC
-        os.environ["TZ"] = "UTC"
-        time.tzset()
+        # setting time zone as UTC, once per process
+        if os.environ.get("TZ") != "UTC":
+            os.environ["TZ"] = "UTC"
+            time.tzset()
 
         # variables
         self.all_fields_map = {}
         self.result = {}
         self.final_result = {}
+        # custom function name => seconds spent in it
+        self.function_timings = {}
         self.time_period_agregatable_custom_fields = []
 
         # to hold class objects
         self.provision_metadata = None
         self.stream_metadata = None
 
+        # compiled aggregation plan
+        self.plan = None
+        # config file => digest of the content the plan is compiled from
+        self.plan_sources = {}
+        # accumulators of the processed data
+        self.accumulators = []
+
         # input
         self.input_file = None
         self.all_custom_functions = None
@@ -66,6 +94,12 @@ class StreamDash:
         # to hold the results
         self.dataframe = None
 
+        # rows per chunk; input is read at once when not set
+        self.chunksize = chunksize
+
+        # parser for STRUCTURED input: pandas or arrow
+        self.engine = engine
+
         # supported other values: azure or aws
         self.cloud = cloud_provider
 
@@ -79,6 +113,10 @@ class StreamDash:
         cloud service
         """
 
+        if self.cloud in CLOUD_STORAGE_OBJECTS:
+            self.cloud_storage_object = CLOUD_STORAGE_OBJECTS[self.cloud]
+            return
+
         if self.cloud is None:
             self.cloud_storage_object = BaseUtils()
 
@@ -92,16 +130,23 @@ class StreamDash:
             self.aws = import_dynamic_modules("cloud_services.aws.utils")
             self.cloud_storage_object = self.aws.AWSStorageContainer()
 
+        CLOUD_STORAGE_OBJECTS[self.cloud] = self.cloud_storage_object
+
     def read_metadata(self, read_provision=True):
         """
-        Parent function to read all metadata/config files
+        Parent function to read all metadata/config files.
+        when the compiled plan file is found and the config files
+        are the ones it was compiled from, the plan is used as is
         """
+        if read_provision and self.read_plan():
+            return
+
         self.read_all_datastream_fields()
         self.read_all_custom_functions()
         self.read_stream_metadata()
         if read_provision:
             self.read_provision()
-
+            self.compile_plan()
 
     def read_all_datastream_fields(self):
         """
@@ -109,6 +154,7 @@ class StreamDash:
         all field related details say, id, field name, functions etc
         """
         self.all_fields_map = self.cloud_storage_object.read_all_datastream_fields_metadata()
+        self.set_plan_source("all_datastream_fields", self.all_fields_map)
         for i in self.all_fields_map:
             self.all_fields_map[i]["name"] = self.all_fields_map[i]["name"].lower()
 
@@ -116,6 +162,7 @@ class StreamDash:
         self.all_custom_functions = (
             self.cloud_storage_object.read_all_custom_functions_metadata()
         )
+        self.set_plan_source("all_custom_functions", self.all_custom_functions)
         logger.debug("self.all_custom_functions: %s", self.all_custom_functions)
 
     def read_stream_metadata(self):
@@ -125,6 +172,7 @@ class StreamDash:
         """
         self.stream_metadata = StreamMetadata()
         stream_buffer = self.cloud_storage_object.read_stream_metadata()
+        self.set_plan_source("stream_file", stream_buffer)
         self.stream_metadata.populate_fields(stream_buffer, self.all_fields_map)
 
     def read_provision(self):
@@ -132,48 +180,180 @@ class StreamDash:
         To read the provision file containing
         the list of functions to aggregate data
         """
-        self.provision_metadata = ProvisionMetadata()
         prov_buffer = (
             self.cloud_storage_object.read_provision_metadata()
         )  # get_provision_from_file()
+        self.set_provision(prov_buffer)
+
+    def set_provision(self, prov_buffer):
+        """
+        sets the provision metadata from the provision file content
+        """
+        self.set_plan_source("provision_file", prov_buffer)
+        self.provision_metadata = ProvisionMetadata()
         self.provision_metadata.populate_fields(prov_buffer, self.all_custom_functions)
 
+    def read_plan(self) -> bool:
+        """
+        reads the compiled aggregation plan file,
+        returns False if there is no valid plan
+        """
+        self.plan = plan_class.plan_from_dict(
+            self.cloud_storage_object.read_plan_metadata()
+        )
+        if self.plan is None:
+            return False
+        if self.plan.sources != self.get_plan_sources():
+            logger.info("config files changed since the plan was compiled, compiling it")
+            self.plan = None
+            return False
+        logger.debug("aggregation plan: %s", self.plan.get_digest())
+        return True
+
+    def set_plan_source(self, name, content):
+        """
+        keeps the digest of the content of the config file,
+        before it is modified, for the sources of the plan
+        """
+        self.plan_sources[name] = plan_class.get_source_digest(content)
+
+    def get_plan_sources(self) -> tuple:
+        """
+        returns the sorted (config file, digest of its content) of each
+        config file the plan is compiled from, read through the metadata cache
+        """
+        storage = self.cloud_storage_object
+        return tuple(
+            (name, plan_class.get_source_digest(read()))
+            for name, read in (
+                ("all_custom_functions", storage.read_all_custom_functions_metadata),
+                ("all_datastream_fields", storage.read_all_datastream_fields_metadata),
+                ("provision_file", storage.read_provision_metadata),
+                ("stream_file", storage.read_stream_metadata),
+            )
+        )
+
+    def compile_plan(self):
+        """
+        compiles the aggregation plan from the
+        provision, stream and custom function metadata
+        """
+        self.plan = plan_class.compile_plan(
+            self.provision_metadata, self.stream_metadata
+        )._replace(sources=tuple(sorted(self.plan_sources.items())))
+        logger.debug("aggregation plan: %s", self.plan.get_digest())
+
+    def write_plan(self):
+        """
+        compiles the aggregation plan and writes it
+        next to the config files
+        """
+        self.compile_plan()
+        self.cloud_storage_object.upload_file(
+            self.cloud_storage_object.input_configs["plan_file"],
+            plan_class.dumps_plan(self.plan).encode("utf-8"),
+        )
+
+    def get_read_args(self) -> tuple:
+        """
+        returns the format, the field names of the input data file
+        and the names of the columns to read
+        """
+        return (
+            self.plan.stream_format,
+            list(self.plan.field_names),
+            self.plan.get_column_names(),
+        )
+
+    def get_read_options(self) -> dict:
+        """
+        returns the options to read the input data file
+        """
+        return {
+            "chunksize": self.chunksize,
+            "field_dtypes": self.plan.get_field_dtypes(),
+            "delimiter": self.plan.delimiter,
+            "engine": self.engine,
+        }
+
     def read_input_data(self, input_file, bucket_name=None):
         """
         read the input file and sets the dataframe
         """
 
         self.input_file = input_file
+        self.dataframe = self.read_input(input_file, bucket_name)
+
+    def read_input(self, input_file, bucket_name=None):
+        """
+        read the input file and returns the dataframe,
+        or an iterator of dataframes when chunksize is set
+        """
+        dataframe = None
+
         # from local dir
         if self.cloud is None:
-            self.dataframe = self.cloud_storage_object.read_data_file_from_local(
-                self.input_file,
-                self.stream_metadata.stream_format,
-                self.stream_metadata.get_stream_field_names(),
-                self.provision_metadata.get_provision_field_names(),
+            dataframe = self.cloud_storage_object.read_data_file_from_local(
+                input_file,
+                *self.get_read_args(),
+                **self.get_read_options(),
             )
 
         # for azure
         if self.cloud == "azure":
-            self.dataframe = self.cloud_storage_object.read_data_file_from_azure_blob(
-                self.input_file,
-                self.stream_metadata.stream_format,
-                self.stream_metadata.get_stream_field_names(),
-                self.provision_metadata.get_provision_field_names(),
+            dataframe = self.cloud_storage_object.read_data_file_from_azure_blob(
+                input_file,
+                *self.get_read_args(),
+                **self.get_read_options(),
             )
 
         # for aws
         if self.cloud == "aws":
 
             # read data file from s3 storage
-            self.dataframe = self.cloud_storage_object.read_data_file_from_s3(
+            dataframe = self.cloud_storage_object.read_data_file_from_s3(
                 bucket_name,
-                self.input_file,
-                self.stream_metadata.stream_format,
-                self.stream_metadata.get_stream_field_names(),
-                self.provision_metadata.get_provision_field_names(),
+                input_file,
+                *self.get_read_args(),
+                **self.get_read_options(),
             )
 
+        return dataframe
+
+    def aggregate_input(self, input_file, bucket_name=None) -> list:
+        """
+        reads and aggregates the input file,
+        returns the accumulators with the aggregated data.
+        it does not modify the object, so it can be called from threads
+        """
+        dataframe = self.read_input(input_file, bucket_name)
+        chunks = dataframe if self.chunksize else [dataframe]
+        return accumulators.update_accumulators(
+            accumulators.init_accumulators(self.plan), chunks
+        )
+
+    def process_input_files(self, input_files, max_workers=4):
+        """
+        reads and aggregates the list of (input_file, bucket_name)
+        in a pool of max_workers threads, so that download and parsing
+        of the files overlap.
+        yields (input_file, accumulators of the file or the exception
+        raised for it) in order, as each file is processed. at most
+        max_workers files are read ahead of the caller, so the
+        accumulators of a file are released once the caller is done
+        with them
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = collections.deque()
+            for input_file, bucket_name in input_files:
+                pending.append(
+                    (input_file, executor.submit(self.aggregate_input, input_file, bucket_name))
+                )
+                if len(pending) >= max_workers:
+                    yield get_processed(*pending.popleft())
+            while pending:
+                yield get_processed(*pending.popleft())
+
     def get_custom_fields(self):
         """
         Gets all custom fields available to the user
@@ -197,69 +377,33 @@ class StreamDash:
 
     def process_data(self) -> dict:
         """
-        reads self.dataframe and aggregate data
+        reads self.dataframe, at once or chunk by chunk, and aggregate data.
+        only the accumulators are held in memory across chunks
         """
-
-        # invoke selected aggregation functions for fields
-        for col, function_list in self.provision_metadata.fields_to_aggregate.items():
-            if custom_functions.is_valid_datatype(self.dataframe[col], (int, float)):
-                for function in function_list["funcs"]:
-                    key_name = str(col) + "_" + str(function)
-                    self.result[key_name] = custom_functions.cal_base_aggregates(
-                        function, self.dataframe, col
-                    )
-
-        # invoke selected custom aggregate functions
-        for function in self.provision_metadata.custom_functions:
-            if function == "cal_stat_count":
-                self.result.update(
-                    custom_functions.cal_stat_count(self.dataframe["statuscode"])
-                )
-
-            if function == "find_cachestatus":
-                self.result.update(
-                    custom_functions.cal_cache_status(self.dataframe["cachestatus"])
-                )
-
-            if function == "cal_traffic_volume":
-                self.result["trafficvolume"] = custom_functions.cal_traffic_volume(
-                    self.dataframe["totalbytes"]
-                )
-
-            if function == "OffloadRate":
-                self.result["OffloadRate"] = custom_functions.cal_offload_rate(
-                    self.dataframe["cachestatus"]
-                )
-
-            if function == "originResponsetime":
-                self.result[
-                    "originResponsetime"
-                ] = custom_functions.cal_origin_responsetime(
-                    self.dataframe[
-                        ["cachestatus", "cacherefreshsrc", "turnaroundtimemsec"]
-                    ]
-                )
-
-            if function == "getuserAgent":
-                self.result.update(
-                    custom_functions.parse_user_agent(self.dataframe["ua"])
-                )
-
-            if function == "test":  # only for testing purpose
-                print(self.dataframe["totalbytes"])
-                print(self.dataframe["cachestatus"])
-                print(self.dataframe["bytes"])
-                print(self.dataframe["ua"])
-
-            # all new custom defined functions can be invoked here
+        chunks = self.dataframe if self.chunksize else [self.dataframe]
+        self.accumulators = accumulators.update_accumulators(
+            accumulators.init_accumulators(self.plan), chunks
+        )
+        self.result.update(accumulators.get_result(self.accumulators))
+        self.function_timings = accumulators.get_function_timings(self.accumulators)
+        logger.debug("custom function timings: %s", self.function_timings)
 
         # logger.debug(f"\nself.result: \n{json.dumps(self.result, indent=2)}")
 
         return self.result
 
+    def get_state(self) -> bytes:
+        """
+        returns the binary partial aggregate state of the processed data,
+        to be merged later with accumulators.merge_states
+        """
+        return accumulators.dump_state(self.plan, self.accumulators)
 
-def test_print(*args):
-    """
-    test function
-    """
-    print(args)
+    def get_stream_id(self) -> str:
+        """
+        returns the streamId of the stream file, empty if not set.
+        the stream file is read through the metadata cache, as it is
+        not read when the compiled plan is used
+        """
+        stream_id = self.cloud_storage_object.read_stream_metadata().get("streamId")
+        return "" if stream_id is None else str(stream_id)
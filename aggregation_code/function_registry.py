@@ -0,0 +1,187 @@
+"""
+registry of the custom functions that can be provisioned.
+each function declares the columns it reads, the keys it outputs
+and its implementation as partial/merge/finalize:
+    partial(dataframe) -> state of the rows of the dataframe
+    merge(state, state) -> state of the rows of both
+    finalize(state) -> dict of the output keys
+so that the same function aggregates a whole file, chunks of a file
+or many files. new metrics are added with register_custom_function
+or register_mergeable_function, without changes to the runtime
+"""
+
+import logging
+from collections import Counter
+from typing import Callable, NamedTuple
+
+import pandas as pd
+
+from aggregation_code import custom_functions
+
+logger = logging.getLogger(__name__)
+
+
+class CustomFunction(NamedTuple):
+    """
+    custom function of the registry
+    """
+
+    name: str
+    inputs: tuple
+    outputs: tuple
+    partial: Callable
+    merge: Callable
+    finalize: Callable
+    # False when the state is the input columns themselves
+    mergeable: bool = True
+    aggregatable_over_time: bool = False
+
+    def run(self, dataframe) -> dict:
+        """
+        returns the outputs of the function for the dataframe
+        """
+        return self.finalize(self.partial(dataframe))
+
+
+# function name => CustomFunction
+CUSTOM_FUNCTIONS = {}
+
+
+def register_mergeable_function(
+    name, inputs, outputs, partial, merge, finalize, aggregatable_over_time=False
+):
+    """
+    registers a function with a mergeable state
+    """
+    # pylint: disable=too-many-arguments
+    CUSTOM_FUNCTIONS[name] = CustomFunction(
+        name,
+        tuple(inputs),
+        tuple(outputs),
+        partial,
+        merge,
+        finalize,
+        mergeable=True,
+        aggregatable_over_time=aggregatable_over_time,
+    )
+
+
+def register_custom_function(name, inputs, outputs, aggregatable_over_time=False):
+    """
+    decorator that registers func(dataframe) -> dict of the outputs.
+    the function is not mergeable, the input columns of every chunk
+    are kept until the result is computed
+    """
+
+    def decorator(func):
+        CUSTOM_FUNCTIONS[name] = CustomFunction(
+            name,
+            tuple(inputs),
+            tuple(outputs),
+            lambda dataframe: dataframe[list(inputs)],
+            lambda state, other: pd.concat([state, other], ignore_index=True),
+            func,
+            mergeable=False,
+            aggregatable_over_time=aggregatable_over_time,
+        )
+        return func
+
+    return decorator
+
+
+def get_custom_function(name):
+    """
+    returns the registered function, None if it is not registered
+    """
+    if name not in CUSTOM_FUNCTIONS:
+        logger.debug("function not registered: %s", name)
+    return CUSTOM_FUNCTIONS.get(name)
+
+
+def add_states(state, other):
+    """
+    merges states that support + (numbers, tuples of numbers, Counters)
+    """
+    if isinstance(state, tuple):
+        return tuple(value + other_value for value, other_value in zip(state, other))
+    return state + other
+
+
+def cal_offload_rate_from_counts(state) -> dict:
+    """
+    returns OffloadRate from (cache hits, requests with a cachestatus)
+    """
+    cache_hits, count = state
+    if count == 0:
+        return {"OffloadRate": None}
+    return {"OffloadRate": cache_hits * 100.00 / count}
+
+
+register_mergeable_function(
+    "cal_stat_count",
+    inputs=("statuscode",),
+    outputs=("request_count", "2xx_count", "3xx_count", "4xx_count", "5xx_count"),
+    partial=lambda dataframe: (
+        Counter(custom_functions.get_unique_counts_of_column(dataframe["statuscode"])),
+        int(dataframe["statuscode"].count()),
+    ),
+    merge=add_states,
+    finalize=lambda state: custom_functions.cal_stat_count_from_counts(*state),
+    aggregatable_over_time=True,
+)
+
+register_mergeable_function(
+    "find_cachestatus",
+    inputs=("cachestatus",),
+    outputs=("cache_hit", "cache_miss"),
+    partial=lambda dataframe: Counter(
+        custom_functions.get_unique_counts_of_column(dataframe["cachestatus"])
+    ),
+    merge=add_states,
+    finalize=custom_functions.cal_cache_status_from_counts,
+    aggregatable_over_time=True,
+)
+
+register_mergeable_function(
+    "cal_traffic_volume",
+    inputs=("totalbytes",),
+    outputs=("trafficvolume",),
+    partial=lambda dataframe: custom_functions.cal_traffic_volume(
+        dataframe["totalbytes"]
+    ),
+    merge=add_states,
+    finalize=lambda state: {"trafficvolume": state},
+    aggregatable_over_time=True,
+)
+
+register_mergeable_function(
+    "OffloadRate",
+    inputs=("cachestatus",),
+    outputs=("OffloadRate",),
+    partial=custom_functions.cal_offload_counts,
+    merge=add_states,
+    finalize=cal_offload_rate_from_counts,
+)
+
+register_mergeable_function(
+    "originResponsetime",
+    inputs=("cachestatus", "cacherefreshsrc", "turnaroundtimemsec"),
+    outputs=("originResponsetime",),
+    partial=custom_functions.cal_origin_responsetime,
+    merge=add_states,
+    finalize=lambda state: {"originResponsetime": state},
+)
+
+register_mergeable_function(
+    "getuserAgent",
+    inputs=("ua",),
+    outputs=custom_functions.UA_INFO,
+    partial=lambda dataframe: custom_functions.count_user_agents(dataframe["ua"]),
+    merge=lambda state, other: {
+        to_extract: state[to_extract] + other[to_extract] for to_extract in state
+    },
+    finalize=lambda state: {
+        to_extract: custom_functions.sort_counts(counts)
+        for to_extract, counts in state.items()
+    },
+)
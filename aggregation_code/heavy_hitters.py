@@ -0,0 +1,129 @@
+"""
+top-k heavy hitters with bounded memory: a Space-Saving summary keeps
+the (weighted) count of at most capacity values, the values of a chunk
+are counted exactly and the summary keeps the largest counts.
+summaries are merged by adding the counts, a value missing from
+a summary being counted with the floor of that summary, the bound
+of the count of the values it dropped. each count is an upper bound
+of the true count and count - error a lower bound
+"""
+
+import re
+
+import pandas as pd
+
+# counters kept per value reported, when the capacity is not set
+DEFAULT_CAPACITY_FACTOR = 10
+
+STATUS_CLASS_PATTERN = re.compile(r"^[1-5]xx$")
+
+
+def get_status_class(status_filter):
+    """
+    returns the first digit of the status codes of "5xx",
+    None if not a valid status class
+    """
+    if status_filter is None or not STATUS_CLASS_PATTERN.match(str(status_filter)):
+        return None
+    return int(str(status_filter)[0])
+
+
+def init_summary() -> dict:
+    """
+    returns a summary of no values.
+    counts: value => upper bound of the count
+    errors: value => count - lower bound of the count, when not 0
+    floor: upper bound of the count of the values not in counts
+    total: sum of the counts of all the values
+    """
+    return {"counts": {}, "errors": {}, "floor": 0, "total": 0}
+
+
+def truncate_summary(summary, capacity) -> dict:
+    """
+    keeps the capacity values with the largest counts
+    """
+    counts = summary["counts"]
+    if len(counts) <= capacity:
+        return summary
+    order = sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))
+    summary["floor"] = max(summary["floor"], order[capacity][1])
+    summary["counts"] = dict(order[:capacity])
+    summary["errors"] = {
+        value: error
+        for value, error in summary["errors"].items()
+        if value in summary["counts"]
+    }
+    return summary
+
+
+def cal_summary(values, weights=None, capacity=100) -> dict:
+    """
+    returns the summary of the non null values of the series,
+    weighted by the array of weights, counted once each when None
+    """
+    summary = init_summary()
+    if weights is None:
+        counts = values.value_counts(sort=False)
+    else:
+        counts = (
+            pd.Series(weights, index=values.index)
+            .groupby(values, observed=True, sort=False)
+            .sum()
+        )
+    counts = counts[counts > 0]
+    if not len(counts):
+        return summary
+
+    summary["total"] = counts.sum().item()
+    if len(counts) > capacity:
+        counts = counts.nlargest(capacity + 1)
+        summary["floor"] = counts.iloc[-1].item()
+        counts = counts.iloc[:-1]
+    summary["counts"] = dict(zip(counts.index.tolist(), counts.tolist()))
+    return summary
+
+
+def merge_summaries(summary, other, capacity) -> dict:
+    """
+    returns the summary of the values of both summaries
+    """
+    counts, errors = {}, {}
+    for value in summary["counts"].keys() | other["counts"].keys():
+        count, error = 0, 0
+        for part in (summary, other):
+            if value in part["counts"]:
+                count += part["counts"][value]
+                error += part["errors"].get(value, 0)
+            else:
+                count += part["floor"]
+                error += part["floor"]
+        counts[value] = count
+        if error:
+            errors[value] = error
+
+    merged = {
+        "counts": counts,
+        "errors": errors,
+        "floor": summary["floor"] + other["floor"],
+        "total": summary["total"] + other["total"],
+    }
+    return truncate_summary(merged, capacity)
+
+
+def get_top(summary, k) -> dict:
+    """
+    returns the k values with the largest counts and the error bounds:
+    the true count of a value is between count - error and count,
+    a value not in top has a count of at most the larger
+    of max_error and the last count of top
+    """
+    order = sorted(summary["counts"].items(), key=lambda item: (-item[1], str(item[0])))
+    return {
+        "top": [
+            {"value": value, "count": count, "error": summary["errors"].get(value, 0)}
+            for value, count in order[:k]
+        ],
+        "total": summary["total"],
+        "max_error": summary["floor"],
+    }
@@ -0,0 +1,94 @@
+"""
+HyperLogLog distinct counter over 64 bit hashes of the values.
+the first precision bits of a hash select one of 2^precision registers,
+each register keeps the highest rank (position of the first 1 bit)
+of the rest of the bits. the standard error is 1.04 / sqrt(2^precision),
+counters of the same precision are merged with the register maximum
+"""
+
+import numpy as np
+
+DEFAULT_PRECISION = 14
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+# precision of the new counters, set by run_aggregations
+PRECISION = DEFAULT_PRECISION
+
+
+def init_hll(precision=None) -> dict:
+    """
+    returns a counter with no values
+    """
+    precision = precision or PRECISION
+    if not MIN_PRECISION <= precision <= MAX_PRECISION:
+        raise ValueError(
+            "precision {} is not in {}-{}".format(precision, MIN_PRECISION, MAX_PRECISION)
+        )
+    return {"precision": precision, "registers": np.zeros(1 << precision, dtype="uint8")}
+
+
+def get_bit_lengths(values):
+    """
+    returns the number of bits of each uint64 value
+    """
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype="uint8")
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = values >= np.uint64(1 << shift)
+        values[high] >>= np.uint64(shift)
+        lengths[high] += shift
+    lengths += (values > 0).astype("uint8")
+    return lengths
+
+
+def cal_hll(hashes, precision=None) -> dict:
+    """
+    returns the counter of the uint64 hashes of the values
+    """
+    hll = init_hll(precision)
+    if not len(hashes):
+        return hll
+
+    bits = 64 - hll["precision"]
+    indexes = (hashes >> np.uint64(bits)).astype("int64")
+    rest = hashes & np.uint64((1 << bits) - 1)
+    ranks = (bits + 1 - get_bit_lengths(rest)).astype("int64")
+
+    # highest rank of each register: sorted by register then rank,
+    # the last key of each register has the highest rank
+    keys = np.unique(indexes * 64 + ranks)
+    indexes = keys // 64
+    last = np.append(indexes[1:] != indexes[:-1], True)
+    hll["registers"][indexes[last]] = keys[last] % 64
+    return hll
+
+
+def merge_hlls(hll, other) -> dict:
+    """
+    adds the values of other to hll
+    """
+    if hll["precision"] != other["precision"]:
+        raise ValueError(
+            "counters of precision {} and {} can not be merged".format(
+                hll["precision"], other["precision"]
+            )
+        )
+    np.maximum(hll["registers"], other["registers"], out=hll["registers"])
+    return hll
+
+
+def get_estimate(hll) -> float:
+    """
+    returns the estimated number of distinct values, rounded,
+    with linear counting for small cardinalities
+    """
+    registers = hll["registers"]
+    size = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / size)
+    estimate = alpha * size * size / np.ldexp(1.0, -registers.astype("int64")).sum()
+
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * size and zeros:
+        estimate = size * np.log(size / zeros)
+    return float(np.round(estimate))
@@ -0,0 +1,330 @@
+"""
+ledger of the processed input objects. S3 and blob triggers deliver
+at least once and prefixes are re-driven, so the result and the
+binary partial state of an object are recorded with
+    (object id, version: ETag or size, digest of the aggregation plan)
+and a duplicate delivery returns them without reading the object.
+there is one entry per object: an entry of another version or plan
+is a miss, and is replaced when the object is processed again, so a
+changed provision invalidates only the entries of its plan.
+the entries are kept in a store, a key-value table of object id =>
+record: SQLite, DynamoDB or Azure Table storage
+"""
+
+import hashlib
+import importlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# largest item of a DynamoDB table
+DYNAMODB_MAX_BYTES = 400 * 1024
+
+# largest binary or string property of an Azure Table entity
+TABLE_MAX_PROPERTY_BYTES = 64 * 1024
+
+# partition of the entities of an Azure Table
+TABLE_PARTITION_KEY = "ds2"
+
+
+class SQLiteStore:
+    """
+    store of the ledger in a local SQLite file
+    """
+
+    max_state_bytes = None
+    max_result_bytes = None
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS ledger ("
+                "object_id TEXT PRIMARY KEY, version TEXT, plan TEXT, "
+                "result TEXT, state BLOB, processed_at REAL)"
+            )
+
+    def get(self, object_id):
+        """
+        returns the record of the object, None if not found
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT version, plan, result, state, processed_at "
+                "FROM ledger WHERE object_id = ?",
+                (object_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        version, plan, result, state, processed_at = row
+        return {
+            "object_id": object_id,
+            "version": version,
+            "plan": plan,
+            "result": result,
+            "state": bytes(state) if state is not None else None,
+            "processed_at": processed_at,
+        }
+
+    def put(self, record):
+        """
+        inserts or replaces the record of the object
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    record["object_id"],
+                    record["version"],
+                    record["plan"],
+                    record["result"],
+                    record["state"],
+                    record["processed_at"],
+                ),
+            )
+
+
+class DynamoDBStore:
+    """
+    store of the ledger in a DynamoDB table of partition key object_id,
+    table is the boto3 Table resource, or any object with
+    get_item(Key=...) and put_item(Item=...)
+    """
+
+    # room is left for the other attributes of the item
+    max_state_bytes = DYNAMODB_MAX_BYTES // 2
+    max_result_bytes = DYNAMODB_MAX_BYTES // 4
+
+    def __init__(self, table):
+        self.table = table
+
+    def get(self, object_id):
+        """
+        returns the record of the object, None if not found
+        """
+        item = self.table.get_item(Key={"object_id": object_id}).get("Item")
+        if item is None:
+            return None
+        state = item.get("state")
+        # boto3 returns Binary attributes wrapped
+        state = getattr(state, "value", state)
+        return {
+            "object_id": item["object_id"],
+            "version": item["version"],
+            "plan": item["plan"],
+            "result": item["result"],
+            "state": bytes(state) if state is not None else None,
+            "processed_at": float(item["processed_at"]),
+        }
+
+    def put(self, record):
+        """
+        inserts or replaces the record of the object
+        """
+        item = {
+            key: value
+            for key, value in record.items()
+            if value is not None and key != "processed_at"
+        }
+        # numbers are stored as strings, DynamoDB does not take floats
+        item["processed_at"] = str(record["processed_at"])
+        self.table.put_item(Item=item)
+
+
+class TableStore:
+    """
+    store of the ledger in an Azure Table, table is the TableClient
+    of azure.data.tables, or any object with get_entity(partition_key,
+    row_key) and upsert_entity(entity). the row key is the sha256
+    of the object id, as keys can not have / or #
+    """
+
+    max_state_bytes = TABLE_MAX_PROPERTY_BYTES
+    # strings are stored as UTF-16
+    max_result_bytes = TABLE_MAX_PROPERTY_BYTES // 2
+
+    def __init__(self, table, not_found=(KeyError,)):
+        self.table = table
+        # exceptions of get_entity when there is no entity
+        self.not_found = not_found
+
+    @staticmethod
+    def get_row_key(object_id) -> str:
+        """
+        returns the row key of the object
+        """
+        return hashlib.sha256(object_id.encode("utf-8")).hexdigest()
+
+    def get(self, object_id):
+        """
+        returns the record of the object, None if not found
+        """
+        try:
+            entity = self.table.get_entity(TABLE_PARTITION_KEY, self.get_row_key(object_id))
+        except self.not_found:
+            return None
+        if entity.get("object_id") != object_id:
+            return None
+        state = entity.get("state")
+        return {
+            "object_id": object_id,
+            "version": entity["version"],
+            "plan": entity["plan"],
+            "result": entity["result"],
+            "state": bytes(state) if state is not None else None,
+            "processed_at": float(entity["processed_at"]),
+        }
+
+    def put(self, record):
+        """
+        inserts or replaces the record of the object
+        """
+        entity = {
+            "PartitionKey": TABLE_PARTITION_KEY,
+            "RowKey": self.get_row_key(record["object_id"]),
+            "object_id": record["object_id"],
+            "version": record["version"],
+            "plan": record["plan"],
+            "result": record["result"],
+            "processed_at": record["processed_at"],
+        }
+        if record["state"] is not None:
+            entity["state"] = record["state"]
+        self.table.upsert_entity(entity)
+
+
+class Ledger:
+    """
+    records the result and state of the processed objects,
+    with hit/miss counters
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+
+    def lookup(self, object_id, version, plan_digest, need_state=False):
+        """
+        returns (result, state) recorded for the version of the object
+        and the plan, None if it is not recorded, or without the state
+        when need_state is set. state is None when not recorded
+        """
+        try:
+            record = self.store.get(object_id)
+        except Exception as err:  # pylint: disable=broad-except
+            logger.error("%s: %s", type(err), err)
+            record = None
+
+        hit = (
+            record is not None
+            and record["version"] == str(version)
+            and record["plan"] == plan_digest
+            and not (need_state and record["state"] is None)
+        )
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not hit:
+            return None
+        logger.debug("ledger hit: %s %s", object_id, version)
+        return json.loads(record["result"]), record["state"]
+
+    def record(self, object_id, version, plan_digest, result, state=None):
+        """
+        records the result and state of the version of the object,
+        the state is left out when it is too large for the store
+        """
+        result = json.dumps(result)
+        if self.store.max_result_bytes and len(result) > self.store.max_result_bytes:
+            logger.warning("result too large for the ledger, not recorded: %s", object_id)
+            return
+        if (
+            state is not None
+            and self.store.max_state_bytes
+            and len(state) > self.store.max_state_bytes
+        ):
+            logger.warning("state too large for the ledger, not recorded: %s", object_id)
+            state = None
+
+        try:
+            self.store.put(
+                {
+                    "object_id": object_id,
+                    "version": str(version),
+                    "plan": plan_digest,
+                    "result": result,
+                    "state": state,
+                    "processed_at": time.time(),
+                }
+            )
+        except Exception as err:  # pylint: disable=broad-except
+            logger.error("%s: %s", type(err), err)
+            return
+        with self.lock:
+            self.recorded += 1
+
+    def get_stats(self) -> dict:
+        """
+        returns the hit/miss counters
+        """
+        return {"hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+def get_file_id(path) -> str:
+    """
+    returns the object id of a local file
+    """
+    return "file://" + os.path.abspath(path)
+
+
+def get_file_version(path) -> str:
+    """
+    returns the version of a local file, from its size and mtime
+    """
+    stat = os.stat(path)
+    return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
+
+
+def open_ledger(url):
+    """
+    returns the Ledger of the url:
+        sqlite:///tmp/ds2-ledger.db, or a path to a SQLite file
+        dynamodb://table-name
+        table://table-name, with the connection string of the
+        azure storage account of cloud_services.azure
+    None when url is empty or the store can not be opened
+    """
+    if not url:
+        return None
+    try:
+        if url.startswith("dynamodb://"):
+            boto3 = importlib.import_module("boto3")
+            table = boto3.resource("dynamodb").Table(url[len("dynamodb://"):])
+            return Ledger(DynamoDBStore(table))
+        if url.startswith("table://"):
+            tables = importlib.import_module("azure.data.tables")
+            exceptions = importlib.import_module("azure.core.exceptions")
+            connection_details = importlib.import_module(
+                "cloud_services.azure.connection_details"
+            )
+            table = tables.TableServiceClient.from_connection_string(
+                connection_details.load_metadata_config()["azure_storage_connectionstring"]
+            ).create_table_if_not_exists(url[len("table://"):])
+            return Ledger(TableStore(table, (exceptions.ResourceNotFoundError,)))
+        path = url[len("sqlite://"):] if url.startswith("sqlite://") else url
+        return Ledger(SQLiteStore(path))
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("ledger %s not opened: %s: %s", url, type(err), err)
+    return None
@@ -0,0 +1,115 @@
+"""
+process level cache of the metadata/config files.
+the cache lives as long as the process, so it is reused across
+warm invocations of the lambda/azure function.
+an entry is served from memory for ttl seconds, after which it is
+revalidated with a conditional read (ETag/If-None-Match) and
+downloaded again only if it has changed.
+a file that does not exist is cached as not found for ttl seconds too
+"""
+
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# seconds an entry is used without revalidation
+DEFAULT_TTL = 300
+
+
+class MetadataNotFoundError(FileNotFoundError):
+    """
+    raised by the fetch of a metadata file that does not exist
+    """
+
+
+class CacheEntry:
+    """
+    cached value with its ETag and last validation time,
+    found is False for a file that does not exist
+    """
+
+    def __init__(self, value, etag, validated_at, found=True):
+        self.value = value
+        self.etag = etag
+        self.validated_at = validated_at
+        self.found = found
+
+
+class MetadataCache:
+    """
+    metadata cache with hit/miss counters
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.not_modified = 0
+        self.misses = 0
+
+    def get(self, key, fetch):
+        """
+        returns a copy of the value cached for the key.
+        fetch(etag) is called when the key is not cached or is due
+        for revalidation, and returns (value, etag);
+        value is None when not modified since etag.
+        fetch raises MetadataNotFoundError when the file does not
+        exist, raised again for the key until it is due
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry.validated_at < self.ttl:
+                self.hits += 1
+                if not entry.found:
+                    raise MetadataNotFoundError(key)
+                return copy.deepcopy(entry.value)
+
+        try:
+            value, etag = fetch(entry.etag if entry is not None else None)
+        except MetadataNotFoundError:
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = CacheEntry(None, None, now, found=False)
+            raise
+
+        with self.lock:
+            if value is None and entry is not None:
+                self.not_modified += 1
+                entry.validated_at = now
+            else:
+                self.misses += 1
+                entry = self.entries[key] = CacheEntry(value, etag, now)
+            logger.debug("metadata cache %s: %s", key, self.get_stats())
+            return copy.deepcopy(entry.value)
+
+    def invalidate(self, key=None):
+        """
+        removes the key, or all the keys, from the cache
+        """
+        with self.lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def get_stats(self) -> dict:
+        """
+        returns the hit/miss counters.
+        hits: served from memory, not_modified: revalidated with
+        a conditional read, misses: downloaded
+        """
+        return {
+            "hits": self.hits,
+            "not_modified": self.not_modified,
+            "misses": self.misses,
+            "entries": len(self.entries),
+        }
+
+
+# cache shared by all the storage objects of the process
+METADATA_CACHE = MetadataCache()
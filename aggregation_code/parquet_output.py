@@ -0,0 +1,243 @@
+"""
+Parquet output of the per bucket results, to query the history of the
+aggregates with Athena or DuckDB. a row has the aggregates of a bucket:
+    source: timeseries, the buckets of the agg_interval aggregates,
+        or rollup, all the aggregates per bucket of the rollups
+    interval: minutes of the bucket
+    bucket_start: start of the bucket, UTC
+    the dimension columns of the plan, null in the rows of all the groups
+    rows: rows of the group, in the rows of a group
+    a float64 column per aggregate, <key>.<nested key> for nested values
+the files are hive partitions of the stream and of the UTC date and
+hour of the buckets:
+    <prefix>/stream_id=<id>/date=<YYYY-MM-DD>/hour=<HH>/part-<time>-<id>.parquet
+the rows added during an invocation are buffered and written by flush
+as one file per partition, so that small inputs do not make small files
+"""
+
+import datetime
+import importlib
+import io
+import logging
+import uuid
+from urllib.parse import urlsplit
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import parquet as pq
+
+from aggregation_code import accumulators, sinks
+from aggregation_code.utils import BaseUtils
+
+logger = logging.getLogger(__name__)
+
+# value of the partition of a stream without streamId
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# rows per file, larger partitions are split
+MAX_ROWS_PER_FILE = 1000000
+
+# rows per row group of a file
+ROW_GROUP_SIZE = 100000
+
+COMPRESSION = "snappy"
+
+SOURCE_TIMESERIES = "timeseries"
+SOURCE_ROLLUP = "rollup"
+
+# keys of a result that are not aggregates of the bucket
+NESTED_RESULT_KEYS = ("timeseries", "groups")
+
+
+def get_aggregates(result) -> dict:
+    """
+    returns name => value of the numeric aggregates of the result,
+    nested values are named <key>.<nested key>
+    """
+    return {
+        metric.name: metric.value
+        for metric in sinks.get_metrics(
+            {key: value for key, value in result.items() if key not in NESTED_RESULT_KEYS}, 0
+        )
+    }
+
+
+def get_timeseries_rows(result) -> list:
+    """
+    returns the rows of the buckets of the timeseries
+    of the result and of its groups
+    """
+    rows = []
+    for interval, buckets in result.get("timeseries", {}).items():
+        for bucket, aggregates in buckets.items():
+            row = get_aggregates(aggregates)
+            row.update(source=SOURCE_TIMESERIES, interval=int(interval), bucket_start=int(bucket))
+            rows.append(row)
+    for group in result.get("groups", []):
+        for row in get_timeseries_rows(group["result"]):
+            row.update(group["dimensions"])
+            rows.append(row)
+    return rows
+
+
+def get_bucket_rows(result, interval, bucket) -> list:
+    """
+    returns the rows of the aggregates of the result of a rollup
+    bucket, and of each of its groups
+    """
+    row = get_aggregates(result)
+    row.update(source=SOURCE_ROLLUP, interval=interval, bucket_start=bucket)
+    rows = [row]
+    for group in result.get("groups", []):
+        row = get_aggregates(group["result"])
+        row.update(group["dimensions"])
+        row.update(
+            source=SOURCE_ROLLUP, interval=interval, bucket_start=bucket, rows=group["rows"]
+        )
+        rows.append(row)
+    return rows
+
+
+def get_rows(input_accumulators) -> list:
+    """
+    returns the rows of the per bucket results of the accumulators
+    """
+    rows = get_timeseries_rows(accumulators.get_result(input_accumulators))
+    for accumulator in input_accumulators:
+        if isinstance(accumulator, accumulators.RollupAccumulator):
+            interval = accumulator.interval_seconds // 60
+            for bucket in sorted(accumulator.buckets):
+                rows.extend(
+                    get_bucket_rows(
+                        accumulators.get_result(accumulator.buckets[bucket]), interval, bucket
+                    )
+                )
+    return rows
+
+
+def get_partition(stream_id, bucket) -> tuple:
+    """
+    returns (stream id, date, hour) of the partition of the bucket start
+    """
+    start = datetime.datetime.fromtimestamp(bucket, tz=datetime.timezone.utc)
+    return stream_id or DEFAULT_PARTITION, start.strftime("%Y-%m-%d"), start.strftime("%H")
+
+
+class ParquetOutputWriter:
+    """
+    buffers the rows of the partitions, flush writes each partition
+    to storage: BaseUtils or a cloud_services storage container
+    """
+
+    def __init__(self, storage, location, prefix="", dimensions=()):
+        self.storage = storage
+        self.location = location
+        self.prefix = prefix.strip("/")
+        self.dimensions = list(dimensions)
+        # (stream id, date, hour) => rows
+        self.partitions = {}
+
+    def add(self, stream_id, input_accumulators) -> int:
+        """
+        buffers the rows of the accumulators, returns their number
+        """
+        rows = get_rows(input_accumulators)
+        for row in rows:
+            self.partitions.setdefault(get_partition(stream_id, row["bucket_start"]), []).append(
+                row
+            )
+        return len(rows)
+
+    def get_table(self, rows) -> pa.Table:
+        """
+        returns the table of the rows, the dimension columns and
+        source dictionary encoded, the aggregates as float64
+        """
+        dataframe = pd.DataFrame(rows)
+        fixed = ["source", "interval", "bucket_start"] + self.dimensions + ["rows"]
+        for column in fixed:
+            if column not in dataframe:
+                dataframe[column] = None
+        columns = fixed + sorted(set(dataframe.columns) - set(fixed))
+        dataframe = dataframe[columns].sort_values(
+            ["source", "interval", "bucket_start"], kind="stable"
+        )
+        for column in ["source"] + self.dimensions:
+            dataframe[column] = dataframe[column].map(
+                lambda value: None if pd.isna(value) else str(value)
+            ).astype("category")
+        dataframe["interval"] = dataframe["interval"].astype("int16")
+        dataframe["bucket_start"] = pd.to_datetime(dataframe["bucket_start"], unit="s", utc=True)
+        dataframe["rows"] = dataframe["rows"].astype("float64").astype("Int64")
+        for column in columns[len(fixed):]:
+            dataframe[column] = dataframe[column].astype("float64")
+        return pa.Table.from_pandas(dataframe, preserve_index=False)
+
+    def get_key(self, partition) -> str:
+        """
+        returns the key of a new file of the partition
+        """
+        stream_id, date, hour = partition
+        name = "part-{}-{}.parquet".format(
+            datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S"),
+            uuid.uuid4().hex[:12],
+        )
+        key = "stream_id={}/date={}/hour={}/{}".format(stream_id, date, hour, name)
+        return self.prefix + "/" + key if self.prefix else key
+
+    def write_table(self, partition, table) -> str:
+        """
+        writes the table as a new file of the partition, returns its url
+        """
+        buffer = io.BytesIO()
+        pq.write_table(
+            table,
+            buffer,
+            compression=COMPRESSION,
+            use_dictionary=["source"] + self.dimensions,
+            row_group_size=ROW_GROUP_SIZE,
+            coerce_timestamps="ms",
+            allow_truncated_timestamps=True,
+        )
+        return self.storage.write_output_file(
+            self.location, self.get_key(partition), buffer.getvalue()
+        )
+
+    def flush(self) -> list:
+        """
+        writes the buffered rows as one file per partition,
+        returns the urls of the files written
+        """
+        partitions, self.partitions = self.partitions, {}
+        files = []
+        for partition, rows in sorted(partitions.items()):
+            table = self.get_table(rows)
+            for offset in range(0, table.num_rows, MAX_ROWS_PER_FILE):
+                files.append(
+                    self.write_table(partition, table.slice(offset, MAX_ROWS_PER_FILE))
+                )
+        logger.debug("parquet output: %s files", len(files))
+        return files
+
+
+def open_output_writer(url, obj) -> ParquetOutputWriter:
+    """
+    returns the writer of the url, with the storage of the cloud of obj
+    when it is the same:
+        s3://<bucket>/<prefix>
+        azure://<container>/<prefix>
+        file:///path, or a local path
+    """
+    parts = urlsplit(url)
+    if parts.scheme == "s3":
+        storage = obj.cloud_storage_object
+        if obj.cloud != "aws":
+            storage = importlib.import_module("cloud_services.aws.utils").AWSStorageContainer()
+        return ParquetOutputWriter(storage, parts.netloc, parts.path, obj.plan.dimensions)
+    if parts.scheme == "azure":
+        storage = obj.cloud_storage_object
+        if obj.cloud != "azure":
+            storage = importlib.import_module("cloud_services.azure.utils").AzureStorageContainer()
+        return ParquetOutputWriter(storage, parts.netloc, parts.path, obj.plan.dimensions)
+    path = parts.path if parts.scheme == "file" else url
+    return ParquetOutputWriter(BaseUtils(), path, "", obj.plan.dimensions)
@@ -0,0 +1,178 @@
+"""
+pipelined mode for a single large input file. gzip is not splittable,
+so the stages overlap instead:
+    - a reader thread decompresses the file into line aligned blocks
+    - a pool of worker processes parses and aggregates the blocks
+      into binary partial states
+    - the states are merged as they complete
+at most queue_depth blocks wait to be submitted and at most
+queue_depth are in the pool, so memory is bounded by the block size
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from aggregation_code import accumulators, batch, hyperloglog, quantile_sketch
+from aggregation_code.utils import open_input
+
+logger = logging.getLogger(__name__)
+
+# bytes of decompressed input per block
+DEFAULT_BLOCK_SIZE = 16 << 20
+
+# blocks queued and in the pool, per worker
+QUEUE_DEPTH_PER_WORKER = 2
+
+# end of the blocks of the reader thread
+END = None
+
+
+def iter_blocks(file_reader, block_size):
+    """
+    yields the content of the binary file reader in blocks
+    of about block_size bytes that end with a full line
+    """
+    rest = b""
+    while True:
+        data = file_reader.read(block_size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b"\n") + 1
+        if not end:
+            rest = data
+            continue
+        rest = data[end:]
+        yield data[:end]
+    if rest:
+        yield rest
+
+
+def get_mp_context():
+    """
+    returns the context of the worker processes. the pool starts its
+    workers while the reader thread runs, and forking a process with
+    running threads can deadlock the children, so the workers are
+    forked from a forkserver, or spawned where it is not available
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["aggregation_code.pipeline"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def read_blocks(input_file, block_size, block_queue, errors):
+    """
+    puts the decompressed blocks of the input file in the queue, then END.
+    an exception is added to errors
+    """
+    try:
+        with open_input(input_file) as file_reader:
+            for block in iter_blocks(file_reader, block_size):
+                block_queue.put(block)
+    except Exception as err:  # pylint: disable=broad-except
+        errors.append(err)
+    finally:
+        block_queue.put(END)
+
+
+def aggregate_block(block) -> tuple:
+    """
+    returns (rows, binary partial state) of the block of
+    decompressed lines, aggregated by the StreamDash of the worker
+    """
+    worker = batch.WORKER
+    read_options = dict(worker.get_read_options(), chunksize=None, compression=None)
+    dataframe = worker.cloud_storage_object.read_data_file(
+        io.BytesIO(block), *worker.get_read_args(), **read_options
+    )
+    input_accumulators = accumulators.update_accumulators(
+        accumulators.init_accumulators(worker.plan), [dataframe]
+    )
+    return len(dataframe), accumulators.dump_state(worker.plan, input_accumulators)
+
+
+def process_file(obj, input_file, processes=None, block_size=DEFAULT_BLOCK_SIZE) -> dict:
+    """
+    aggregates the local gzip compressed input file in the pipeline,
+    the states are merged with the plan of obj.
+    returns the result and the throughput of the run
+    """
+    # pylint: disable=too-many-locals
+    processes = batch.get_processes(processes)
+    queue_depth = processes * QUEUE_DEPTH_PER_WORKER
+    logger.info(
+        "aggregating %s in blocks of %.1f MB, with %s processes",
+        input_file,
+        block_size / 1e6,
+        processes,
+    )
+
+    start = time.perf_counter()
+    merged = accumulators.init_accumulators(obj.plan)
+    block_queue = queue.Queue(maxsize=queue_depth)
+    errors = []
+    reader = threading.Thread(
+        target=read_blocks,
+        args=(input_file, block_size, block_queue, errors),
+        daemon=True,
+    )
+    rows, blocks, size = 0, 0, 0
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=get_mp_context(),
+        initializer=batch.init_worker,
+        initargs=(
+            obj.chunksize,
+            obj.engine,
+            quantile_sketch.RELATIVE_ACCURACY,
+            hyperloglog.PRECISION,
+            obj.plan.rollup_interval,
+        ),
+    ) as executor:
+        reader.start()
+        pending = set()
+        block = block_queue.get()
+        while block is not END or pending:
+            if block is not END and len(pending) < queue_depth:
+                pending.add(executor.submit(aggregate_block, block))
+                blocks += 1
+                size += len(block)
+                block = block_queue.get()
+                continue
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                block_rows, state = future.result()
+                rows += block_rows
+                merged = accumulators.merge_accumulators(
+                    [merged, accumulators.load_state(obj.plan, state)]
+                )
+    reader.join()
+    if errors:
+        raise errors[0]
+    seconds = time.perf_counter() - start
+
+    obj.accumulators = merged
+    output = {
+        "merged": accumulators.get_result(merged),
+        "stats": {
+            "processes": processes,
+            "seconds": round(seconds, 3),
+            "blocks": blocks,
+            "rows": rows,
+            "bytes": os.path.getsize(input_file),
+            "decompressed_bytes": size,
+            "rows_per_second": round(rows / seconds, 1),
+            "mb_per_second": round(size / 1e6 / seconds, 2),
+        },
+    }
+    logger.info("pipeline stats: %s", output["stats"])
+    return output
@@ -0,0 +1,617 @@
+"""
+compiles the provision, stream and custom function metadata
+into an aggregation plan.
+the plan is immutable and hashable; it is serialized next to
+the config files so that the runtime loads it as is instead of
+deriving it from the metadata on every run
+"""
+
+import hashlib
+import json
+import logging
+import re
+from typing import NamedTuple
+
+from aggregation_code import custom_functions, function_registry, heavy_hitters, predicates
+
+logger = logging.getLogger(__name__)
+
+# bumped when the serialized format of the plan changes,
+# plans of other versions are compiled again by the runtime
+PLAN_FORMAT_VERSION = 8
+
+# agg_interval of the aggregates over the whole input file
+NO_INTERVAL = -1
+
+# agg_interval is in minutes
+AGG_INTERVAL_SECONDS = 60
+
+# rows are put in time buckets by the request time
+TIME_COLUMN = "reqtimesec"
+
+# dtype of the request time in all_datastream_fields
+TIME_COLUMN_DTYPE = "bigint"
+
+# agg_interval of the buckets of the rollup store, the finest tier
+ROLLUP_INTERVAL = 1
+
+# rows of a top-k are filtered by the class of their status code
+STATUS_COLUMN = "statuscode"
+
+# groups of the dimension values aggregated separately, the groups
+# with the fewest rows are collapsed into OTHER_GROUP
+DEFAULT_MAX_GROUPS = 100
+OTHER_GROUP = "__other__"
+
+# columns of the rows of the parquet output that are not dimensions,
+# fields of these names can not be dimensions
+RESERVED_DIMENSIONS = ("source", "interval", "bucket_start", "rows")
+
+# filtered aggregate of the provision file, say
+# sum(turnaroundtimemsec) where cachestatus == 0
+FILTERED_AGGREGATE_PATTERN = re.compile(
+    r"^\s*(\w+)\s*\(\s*(\w+)\s*\)\s+where\s+(.+)$", re.S
+)
+
+
+class ColumnPlan(NamedTuple):
+    """
+    column of the input file to read
+    """
+
+    name: str
+    position: int
+    dtype: str = None
+    categorical: bool = False
+
+
+class BaseAggregatePlan(NamedTuple):
+    """
+    base aggregate functions of a column
+    """
+
+    column: str
+    agg_interval: int
+    funcs: tuple
+
+
+class CustomFunctionPlan(NamedTuple):
+    """
+    custom function and the columns it reads,
+    aggregated over the whole input file
+    """
+
+    name: str
+    inputs: tuple
+
+
+class TopKPlan(NamedTuple):
+    """
+    top-k values of a column, by number of rows or by
+    the sum of the weight column, of the rows of a status class
+    """
+
+    name: str
+    column: str
+    k: int
+    capacity: int
+    weight: str = None
+    statuscode: str = None
+
+    def get_columns(self) -> list:
+        """
+        returns the columns the top-k reads
+        """
+        columns = [self.column]
+        if self.weight is not None:
+            columns.append(self.weight)
+        if self.statuscode is not None:
+            columns.append(STATUS_COLUMN)
+        return columns
+
+
+class FilteredAggregatePlan(NamedTuple):
+    """
+    base aggregate function of a column,
+    over the rows that match the predicate
+    """
+
+    name: str
+    column: str
+    function: str
+    predicate: str
+
+    def get_columns(self) -> list:
+        """
+        returns the columns the filtered aggregate reads
+        """
+        columns = predicates.get_columns(predicates.parse_predicate(self.predicate))
+        return [self.column] + sorted(columns - {self.column})
+
+
+class TimeBucketPlan(NamedTuple):
+    """
+    columns with base aggregates of an agg_interval
+    """
+
+    agg_interval: int
+    columns: tuple
+
+
+class AggregationPlan(NamedTuple):
+    """
+    everything the runtime needs to read and aggregate an input file
+    """
+
+    stream_format: str
+    delimiter: str
+    field_names: tuple
+    columns: tuple
+    base_aggregates: tuple
+    custom_functions: tuple
+    time_buckets: tuple
+    time_column: str = None
+    top_k: tuple = ()
+    dimensions: tuple = ()
+    max_groups: int = DEFAULT_MAX_GROUPS
+    filtered_aggregates: tuple = ()
+    # agg_interval of the buckets of all the aggregates, 0 when not rolled up
+    rollup_interval: int = 0
+    # (config file, get_source_digest of its content) of the
+    # config files the plan is compiled from
+    sources: tuple = ()
+    version: int = PLAN_FORMAT_VERSION
+
+    def get_column_names(self) -> list:
+        """
+        returns the names of the columns to read, in file order
+        """
+        return [column.name for column in self.columns]
+
+    def get_field_dtypes(self) -> dict:
+        """
+        returns the dtype details of the columns to read,
+        same format as StreamMetadata.get_stream_field_dtypes
+        """
+        return {
+            column.name: {"dtype": column.dtype, "categorical": column.categorical}
+            for column in self.columns
+            if column.dtype is not None
+        }
+
+    def get_whole_file_aggregates(self) -> list:
+        """
+        returns the base aggregates over the whole input file
+        """
+        return [
+            aggregate
+            for aggregate in self.base_aggregates
+            if aggregate.agg_interval == NO_INTERVAL
+        ]
+
+    def get_interval_aggregates(self) -> dict:
+        """
+        returns agg_interval => base aggregates of the interval,
+        for the aggregates in time buckets
+        """
+        interval_aggregates = {}
+        for aggregate in self.base_aggregates:
+            if aggregate.agg_interval != NO_INTERVAL:
+                interval_aggregates.setdefault(aggregate.agg_interval, []).append(
+                    aggregate
+                )
+        return interval_aggregates
+
+    def get_custom_function_names(self) -> list:
+        """
+        returns the names of the custom functions
+        """
+        return [function.name for function in self.custom_functions]
+
+    def drop_custom_functions(self, *names):
+        """
+        returns the plan without the custom functions in names
+        """
+        return compile_plan_from_parts(
+            self.stream_format,
+            self.delimiter,
+            self.field_names,
+            {column.name: column for column in self.columns},
+            self.base_aggregates,
+            [f for f in self.custom_functions if f.name not in names],
+            self.time_column,
+            self.top_k,
+            self.dimensions,
+            self.max_groups,
+            self.filtered_aggregates,
+            self.rollup_interval,
+        )._replace(sources=self.sources)
+
+    def get_bucket_plan(self):
+        """
+        returns the plan of the aggregates of a rollup bucket:
+        all the aggregates over the rows of the bucket, without the
+        sources, so that the buckets of the same aggregates are merged
+        when other config files change
+        """
+        return self._replace(
+            base_aggregates=tuple(
+                aggregate._replace(agg_interval=NO_INTERVAL)
+                for aggregate in self.base_aggregates
+            ),
+            time_buckets=(),
+            time_column=None,
+            rollup_interval=0,
+            sources=(),
+        )
+
+    def get_digest(self) -> str:
+        """
+        returns the sha256 of the serialized plan
+        """
+        return hashlib.sha256(dumps_plan(self).encode("utf-8")).hexdigest()
+
+
+def get_source_digest(content) -> str:
+    """
+    returns the sha256 of the content of a config file, a dict,
+    independent of its formatting and of the storage it is read from
+    """
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    ).hexdigest()
+
+
+def to_agg_interval(value) -> int:
+    """
+    returns the agg_interval of the provision file as int,
+    empty or invalid intervals are NO_INTERVAL
+    """
+    try:
+        interval = int(value)
+        return interval if interval > 0 else NO_INTERVAL
+    except (TypeError, ValueError):
+        logger.warning("invalid agg_interval %s, using %s", value, NO_INTERVAL)
+    return NO_INTERVAL
+
+
+def compile_plan_from_parts(
+    stream_format,
+    delimiter,
+    field_names,
+    stream_columns,
+    base_aggregates,
+    custom_functions,
+    time_column=None,
+    top_k=(),
+    dimensions=(),
+    max_groups=DEFAULT_MAX_GROUPS,
+    filtered_aggregates=(),
+    rollup_interval=0,
+) -> AggregationPlan:
+    """
+    returns the plan that reads only the columns used by the
+    base aggregates, custom functions, top-k, dimensions
+    and filtered aggregates,
+    and the time column when there are time buckets or rollups.
+    dimension columns not aggregated are read as categoricals
+    """
+    # pylint: disable=too-many-arguments
+    used = {aggregate.column for aggregate in base_aggregates}
+    for function in custom_functions:
+        used.update(function.inputs)
+    for top in top_k:
+        used.update(top.get_columns())
+    for aggregate in filtered_aggregates:
+        used.update(aggregate.get_columns())
+    if rollup_interval:
+        time_column = TIME_COLUMN
+    if time_column is not None:
+        used.add(time_column)
+
+    stream_columns = dict(stream_columns)
+    for dimension in dimensions:
+        if dimension not in used:
+            stream_columns[dimension] = stream_columns[dimension]._replace(categorical=True)
+    used.update(dimensions)
+
+    time_buckets = {}
+    for aggregate in base_aggregates:
+        time_buckets.setdefault(aggregate.agg_interval, []).append(aggregate.column)
+
+    return AggregationPlan(
+        stream_format=stream_format,
+        delimiter=delimiter,
+        field_names=tuple(field_names),
+        columns=tuple(
+            sorted(
+                (stream_columns[name] for name in used),
+                key=lambda column: column.position,
+            )
+        ),
+        base_aggregates=tuple(base_aggregates),
+        custom_functions=tuple(custom_functions),
+        time_buckets=tuple(
+            TimeBucketPlan(interval, tuple(columns))
+            for interval, columns in sorted(time_buckets.items())
+        ),
+        time_column=time_column,
+        top_k=tuple(top_k),
+        dimensions=tuple(dimensions),
+        max_groups=max_groups,
+        filtered_aggregates=tuple(filtered_aggregates),
+        rollup_interval=rollup_interval,
+    )
+
+
+def with_rollups(plan, rollup_interval=ROLLUP_INTERVAL) -> AggregationPlan:
+    """
+    returns the plan that also aggregates the rows in buckets of
+    rollup_interval minutes for the rollup store, reading the
+    request time. the plan is returned as is when the stream
+    has no request time
+    """
+    if TIME_COLUMN not in plan.field_names:
+        logger.warning("%s not in stream, rollups are disabled", TIME_COLUMN)
+        return plan
+    stream_columns = {column.name: column for column in plan.columns}
+    stream_columns.setdefault(
+        TIME_COLUMN,
+        ColumnPlan(TIME_COLUMN, plan.field_names.index(TIME_COLUMN), TIME_COLUMN_DTYPE),
+    )
+    return compile_plan_from_parts(
+        plan.stream_format,
+        plan.delimiter,
+        plan.field_names,
+        stream_columns,
+        plan.base_aggregates,
+        plan.custom_functions,
+        plan.time_column,
+        plan.top_k,
+        plan.dimensions,
+        plan.max_groups,
+        plan.filtered_aggregates,
+        rollup_interval,
+    )._replace(sources=plan.sources)
+
+
+def compile_top_k(spec, stream_columns):
+    """
+    returns the TopKPlan of a top-k spec of the provision file,
+    None if the spec is not valid
+    """
+    column = str(spec.get("field", "")).lower()
+    weight = spec["weight"].lower() if spec.get("weight") else None
+    statuscode = spec.get("statuscode")
+    try:
+        k = int(spec.get("k", 10))
+        capacity = int(spec.get("capacity", k * heavy_hitters.DEFAULT_CAPACITY_FACTOR))
+    except (TypeError, ValueError):
+        logger.warning("invalid k or capacity, skipping top-k: %s", spec)
+        return None
+    if k <= 0 or capacity < k:
+        logger.warning("k must be positive and at most capacity, skipping top-k: %s", spec)
+        return None
+    if statuscode is not None and heavy_hitters.get_status_class(statuscode) is None:
+        logger.warning("statuscode must be a class like 5xx, skipping top-k: %s", spec)
+        return None
+
+    name = [column, "top"]
+    if weight:
+        name += ["by", weight]
+    if statuscode:
+        name.append(statuscode)
+    top = TopKPlan(spec.get("name") or "_".join(name), column, k, capacity, weight, statuscode)
+
+    missing = [col for col in top.get_columns() if col not in stream_columns]
+    if missing:
+        logger.warning("fields %s not in stream, skipping top-k: %s", missing, top.name)
+        return None
+    return top
+
+
+def compile_filtered_aggregate(name, spec, stream_columns):
+    """
+    returns the FilteredAggregatePlan of a "function(field) where predicate"
+    spec of the provision file, None if the spec is not valid.
+    the predicate is kept in its canonical form, so that the same
+    predicate written differently shares its mask
+    """
+    match = FILTERED_AGGREGATE_PATTERN.match(str(spec))
+    if match is None:
+        logger.warning("not a function(field) where predicate, skipping %s: %s", name, spec)
+        return None
+    function, column, text = match.groups()
+    if function not in custom_functions.BASE_AGGREGATE_STATS:
+        logger.warning("unknown function %s, skipping: %s", function, name)
+        return None
+    try:
+        predicate = predicates.format_predicate(predicates.parse_predicate(text))
+    except ValueError as err:
+        logger.warning("invalid predicate, skipping %s: %s", name, err)
+        return None
+
+    aggregate = FilteredAggregatePlan(str(name), column.lower(), function, predicate)
+    missing = [col for col in aggregate.get_columns() if col not in stream_columns]
+    if missing:
+        logger.warning("fields %s not in stream, skipping: %s", missing, name)
+        return None
+    return aggregate
+
+
+def compile_plan(provision_metadata, stream_metadata) -> AggregationPlan:
+    """
+    returns the plan of the populated ProvisionMetadata and StreamMetadata.
+    fields and custom functions that need a column not in
+    the stream, and functions not in the registry, are left out of the plan
+    """
+    stream_columns = {
+        field.name: ColumnPlan(field.name, position, field.dtype, field.categorical)
+        for position, field in enumerate(stream_metadata.chosen_fields)
+    }
+
+    base_aggregates = []
+    for col, function_list in provision_metadata.fields_to_aggregate.items():
+        if not function_list["funcs"]:
+            continue
+        if col not in stream_columns:
+            logger.warning("field not in stream, skipping: %s", col)
+            continue
+        base_aggregates.append(
+            BaseAggregatePlan(
+                col,
+                to_agg_interval(function_list["agg_interval"]),
+                tuple(function_list["funcs"]),
+            )
+        )
+
+    # time buckets need the request time of the rows
+    time_column = None
+    if any(aggregate.agg_interval != NO_INTERVAL for aggregate in base_aggregates):
+        if TIME_COLUMN in stream_columns:
+            time_column = TIME_COLUMN
+        else:
+            logger.warning(
+                "%s not in stream, agg_interval is ignored", TIME_COLUMN
+            )
+            base_aggregates = [
+                aggregate._replace(agg_interval=NO_INTERVAL)
+                for aggregate in base_aggregates
+            ]
+
+    custom_functions = []
+    for function in provision_metadata.custom_functions:
+        registered = function_registry.get_custom_function(function)
+        if registered is None:
+            logger.warning("function not registered, skipping: %s", function)
+            continue
+        # the columns are the inputs declared in the registry
+        inputs = registered.inputs
+        missing = [col for col in inputs if col not in stream_columns]
+        if missing:
+            logger.warning("fields %s not in stream, skipping: %s", missing, function)
+            continue
+        custom_functions.append(CustomFunctionPlan(function, inputs))
+
+    top_k = [compile_top_k(spec, stream_columns) for spec in provision_metadata.top_k]
+
+    dimensions = []
+    for dimension in provision_metadata.dimensions:
+        if dimension not in stream_columns:
+            logger.warning("dimension not in stream, skipping: %s", dimension)
+            continue
+        if dimension in RESERVED_DIMENSIONS:
+            logger.warning("dimension name is reserved, skipping: %s", dimension)
+            continue
+        if dimension not in dimensions:
+            dimensions.append(dimension)
+
+    filtered_aggregates = [
+        compile_filtered_aggregate(name, spec, stream_columns)
+        for name, spec in provision_metadata.filtered.items()
+    ]
+
+    return compile_plan_from_parts(
+        stream_metadata.stream_format,
+        stream_metadata.get_delimiter(),
+        stream_metadata.get_stream_field_names(),
+        stream_columns,
+        base_aggregates,
+        custom_functions,
+        time_column,
+        [top for top in top_k if top is not None],
+        dimensions,
+        provision_metadata.max_groups,
+        [aggregate for aggregate in filtered_aggregates if aggregate is not None],
+    )
+
+
+def plan_to_dict(plan) -> dict:
+    """
+    returns the plan as a JSON serializable dict
+    """
+    return {
+        "version": plan.version,
+        "stream_format": plan.stream_format,
+        "delimiter": plan.delimiter,
+        "field_names": list(plan.field_names),
+        "columns": [column._asdict() for column in plan.columns],
+        "base_aggregates": [
+            {**aggregate._asdict(), "funcs": list(aggregate.funcs)}
+            for aggregate in plan.base_aggregates
+        ],
+        "custom_functions": [
+            {**function._asdict(), "inputs": list(function.inputs)}
+            for function in plan.custom_functions
+        ],
+        "time_buckets": [
+            {
+                "agg_interval": bucket.agg_interval,
+                "columns": list(bucket.columns),
+            }
+            for bucket in plan.time_buckets
+        ],
+        "time_column": plan.time_column,
+        "top_k": [top._asdict() for top in plan.top_k],
+        "dimensions": list(plan.dimensions),
+        "max_groups": plan.max_groups,
+        "filtered_aggregates": [
+            aggregate._asdict() for aggregate in plan.filtered_aggregates
+        ],
+        "rollup_interval": plan.rollup_interval,
+        "sources": [list(source) for source in plan.sources],
+    }
+
+
+def plan_from_dict(plan_dict):
+    """
+    returns the plan of the dict written by plan_to_dict,
+    None when the dict is empty or of another format version
+    """
+    if plan_dict.get("version") != PLAN_FORMAT_VERSION:
+        if plan_dict:
+            logger.warning(
+                "plan format version %s is not %s, ignoring the plan",
+                plan_dict.get("version"),
+                PLAN_FORMAT_VERSION,
+            )
+        return None
+
+    return AggregationPlan(
+        stream_format=plan_dict["stream_format"],
+        delimiter=plan_dict["delimiter"],
+        field_names=tuple(plan_dict["field_names"]),
+        columns=tuple(ColumnPlan(**column) for column in plan_dict["columns"]),
+        base_aggregates=tuple(
+            BaseAggregatePlan(
+                aggregate["column"], aggregate["agg_interval"], tuple(aggregate["funcs"])
+            )
+            for aggregate in plan_dict["base_aggregates"]
+        ),
+        custom_functions=tuple(
+            CustomFunctionPlan(function["name"], tuple(function["inputs"]))
+            for function in plan_dict["custom_functions"]
+        ),
+        time_buckets=tuple(
+            TimeBucketPlan(bucket["agg_interval"], tuple(bucket["columns"]))
+            for bucket in plan_dict["time_buckets"]
+        ),
+        time_column=plan_dict["time_column"],
+        top_k=tuple(TopKPlan(**top) for top in plan_dict["top_k"]),
+        dimensions=tuple(plan_dict["dimensions"]),
+        max_groups=plan_dict["max_groups"],
+        filtered_aggregates=tuple(
+            FilteredAggregatePlan(**aggregate)
+            for aggregate in plan_dict["filtered_aggregates"]
+        ),
+        rollup_interval=plan_dict["rollup_interval"],
+        sources=tuple(tuple(source) for source in plan_dict["sources"]),
+        version=plan_dict["version"],
+    )
+
+
+def dumps_plan(plan) -> str:
+    """
+    serializes the plan to JSON
+    """
+    return json.dumps(plan_to_dict(plan), indent=2, sort_keys=True)
@@ -0,0 +1,224 @@
+"""
+predicates of the filtered aggregates, say
+    cachestatus == 0 and cacherefreshsrc == 'origin'
+a predicate is parsed once into a tree of hashable tuples:
+    ("cmp", column, op, value), ("and", (...)), ("or", (...)), ("not", p)
+and evaluated to a boolean mask over the rows of a chunk. masks are kept
+per chunk, so a sub-predicate shared by many aggregates and functions,
+say cachestatus == 0, is evaluated once per chunk.
+a comparison never matches the rows with a missing value, nor does its
+negation: not p only matches the rows where every column of p has a value,
+so cachestatus != 0 and not (cachestatus == 0) are the same rows
+"""
+
+import ast
+import contextlib
+import functools
+import operator
+import threading
+
+import numpy as np
+import pandas as pd
+
+COMPARISONS = {
+    ast.Eq: "==",
+    ast.NotEq: "!=",
+    ast.Lt: "<",
+    ast.LtE: "<=",
+    ast.Gt: ">",
+    ast.GtE: ">=",
+    ast.In: "in",
+    ast.NotIn: "not in",
+}
+
+# comparison of the operands swapped, 0 < x is x > 0
+SWAPPED = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+# masks of the chunk being aggregated by the thread
+_local = threading.local()
+
+
+def to_value(node):
+    """
+    returns the constant of the node, or the tuple of constants of a list
+    """
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return tuple(to_value(item) for item in node.elts)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -to_value(node.operand)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)):
+        return node.value
+    raise ValueError("not a constant: {}".format(ast.dump(node)))
+
+
+def to_comparison(left, op, right) -> tuple:
+    """
+    returns the comparison of a column and a constant
+    """
+    op = COMPARISONS.get(type(op))
+    if op is None:
+        raise ValueError("unsupported comparison")
+    if isinstance(right, ast.Name) and not isinstance(left, ast.Name) and op in SWAPPED:
+        left, right, op = right, left, SWAPPED[op]
+    if not isinstance(left, ast.Name):
+        raise ValueError("a comparison must have a column name")
+    value = to_value(right)
+    if (op in ("in", "not in")) != isinstance(value, tuple):
+        raise ValueError("in and not in need a list of constants")
+    return ("cmp", left.id.lower(), op, value)
+
+
+def to_predicate(node) -> tuple:
+    """
+    returns the predicate of the node of the parsed expression,
+    the operands of and/or are sorted, so that equivalent
+    predicates are the same tuple and share their mask
+    """
+    if isinstance(node, ast.BoolOp):
+        operands = {to_predicate(value) for value in node.values}
+        name = "and" if isinstance(node.op, ast.And) else "or"
+        return (name, tuple(sorted(operands, key=repr)))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return ("not", to_predicate(node.operand))
+    if isinstance(node, ast.Compare):
+        operands = [node.left] + node.comparators
+        comparisons = {
+            to_comparison(left, op, right)
+            for left, op, right in zip(operands, node.ops, operands[1:])
+        }
+        if len(comparisons) == 1:
+            return comparisons.pop()
+        return ("and", tuple(sorted(comparisons, key=repr)))
+    raise ValueError("unsupported expression: {}".format(ast.dump(node)))
+
+
+@functools.lru_cache(maxsize=None)
+def parse_predicate(text) -> tuple:
+    """
+    returns the predicate of the expression,
+    raises ValueError if it is not a supported predicate
+    """
+    try:
+        return to_predicate(ast.parse(text.strip(), mode="eval").body)
+    except SyntaxError as err:
+        raise ValueError("invalid predicate {!r}: {}".format(text, err)) from err
+
+
+def get_columns(predicate) -> set:
+    """
+    returns the columns compared by the predicate
+    """
+    if predicate[0] == "cmp":
+        return {predicate[1]}
+    if predicate[0] == "not":
+        return get_columns(predicate[1])
+    return set().union(*(get_columns(operand) for operand in predicate[1]))
+
+
+def format_predicate(predicate) -> str:
+    """
+    returns the canonical expression of the predicate
+    """
+    if predicate[0] == "cmp":
+        _, column, op, value = predicate
+        return "{} {} {!r}".format(column, op, list(value) if isinstance(value, tuple) else value)
+    if predicate[0] == "not":
+        return "not ({})".format(format_predicate(predicate[1]))
+    return " {} ".format(predicate[0]).join(
+        "({})".format(format_predicate(operand)) for operand in predicate[1]
+    )
+
+
+def is_numeric_like(column) -> bool:
+    """
+    checks if the column is numeric, or categorical of numeric categories
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return pd.api.types.is_numeric_dtype(column.cat.categories)
+    return pd.api.types.is_numeric_dtype(column)
+
+
+def evaluate_comparison(column, op, value):
+    """
+    returns the mask of the rows of the column that match,
+    False for the missing values
+    """
+    not_null = column.notna().to_numpy()
+    if op in ("in", "not in"):
+        mask = column.isin(list(value)).to_numpy()
+        return mask if op == "in" else ~mask & not_null
+    if is_numeric_like(column) and not isinstance(value, str):
+        values = column.to_numpy(dtype="float64", na_value=np.nan)
+        return OPERATORS[op](values, value) & not_null
+    if isinstance(column.dtype, pd.CategoricalDtype) and op not in ("==", "!="):
+        column = column.astype(object)
+    mask = OPERATORS[op](column, value).to_numpy(dtype=bool, na_value=False)
+    return mask & not_null
+
+
+def get_not_null(columns, chunk, masks) -> np.ndarray:
+    """
+    returns the mask of the rows of the chunk with a value in every column
+    """
+    key = ("notna", tuple(sorted(columns)))
+    if key not in masks:
+        masks[key] = np.logical_and.reduce(
+            [chunk[column].notna().to_numpy() for column in key[1]]
+        )
+    return masks[key]
+
+
+def evaluate(predicate, chunk, masks) -> np.ndarray:
+    """
+    returns the mask of the rows of the chunk that match the predicate,
+    masks is predicate => mask of the predicates already evaluated
+    """
+    if predicate in masks:
+        return masks[predicate]
+    if predicate[0] == "cmp":
+        _, column, op, value = predicate
+        mask = evaluate_comparison(chunk[column], op, value)
+    elif predicate[0] == "not":
+        mask = ~evaluate(predicate[1], chunk, masks) & get_not_null(
+            get_columns(predicate[1]), chunk, masks
+        )
+    else:
+        reduce = np.logical_and if predicate[0] == "and" else np.logical_or
+        mask = functools.reduce(
+            reduce, (evaluate(operand, chunk, masks) for operand in predicate[1])
+        )
+    masks[predicate] = mask
+    return mask
+
+
+@contextlib.contextmanager
+def shared_masks(chunk):
+    """
+    shares the masks evaluated by get_mask on the chunk
+    until the end of the with block
+    """
+    previous = getattr(_local, "masks", None)
+    _local.masks = (chunk, {})
+    try:
+        yield
+    finally:
+        _local.masks = previous
+
+
+def get_mask(text, chunk) -> np.ndarray:
+    """
+    returns the mask of the rows of the chunk that match the expression,
+    reusing the masks of the chunk shared with shared_masks
+    """
+    current = getattr(_local, "masks", None)
+    masks = current[1] if current is not None and current[0] is chunk else {}
+    return evaluate(parse_predicate(text), chunk, masks)
@@ -6,6 +6,8 @@ necessary fields that will be used for aggregation.
 import logging
 import json
 
+from aggregation_code.plan_class import DEFAULT_MAX_GROUPS
+
 logger = logging.getLogger(__name__)
 
 
@@ -18,6 +20,13 @@ class ProvisionMetadata:
         self.__data = {}
         self.fields_to_aggregate = {}
         self.custom_functions = {}
+        # specs of the top-k aggregates
+        self.top_k = []
+        # columns the aggregates are grouped by
+        self.dimensions = []
+        self.max_groups = DEFAULT_MAX_GROUPS
+        # name => "function(field) where predicate"
+        self.filtered = {}
         self.default_agg_interval = -1
 
     def __str__(self) -> str:
@@ -35,7 +44,13 @@ class ProvisionMetadata:
         # construct the necessary fields needed to apply
         # basic aggregate functions and custom functions
         for func_name in self.__data.keys():
-            if func_name != "custom-func":
+            if func_name == "top-k":
+                self.top_k = list(self.__data["top-k"])
+            elif func_name == "dimensions":
+                self.populate_dimensions(self.__data["dimensions"])
+            elif func_name == "filtered":
+                self.filtered = dict(self.__data["filtered"])
+            elif func_name != "custom-func":
                 self.fields_to_aggregate[func_name] = {
                     "agg_interval": self.__data[func_name][0],
                     "funcs": self.__data[func_name][1],
@@ -67,6 +82,28 @@ class ProvisionMetadata:
             "provision_metadata.custom_functions... \n%s",
             json.dumps(self.custom_functions, indent=2),
         )
+        logger.debug("provision_metadata.top_k... \n%s", json.dumps(self.top_k, indent=2))
+        logger.debug("provision_metadata.filtered... \n%s", json.dumps(self.filtered, indent=2))
+        logger.debug(
+            "provision_metadata.dimensions: %s, max_groups: %s",
+            self.dimensions,
+            self.max_groups,
+        )
+
+    def populate_dimensions(self, dimensions):
+        """
+        sets self.dimensions and self.max_groups from the
+        list of fields, or {"fields": [...], "max-groups": N}
+        """
+        if isinstance(dimensions, dict):
+            try:
+                self.max_groups = max(
+                    1, int(dimensions.get("max-groups", DEFAULT_MAX_GROUPS))
+                )
+            except (TypeError, ValueError):
+                logger.warning("invalid max-groups %s", dimensions.get("max-groups"))
+            dimensions = dimensions.get("fields", [])
+        self.dimensions = [str(dimension).lower() for dimension in dimensions]
 
     def get_provision_field_names(self):
         """
@@ -0,0 +1,123 @@
+"""
+DDSketch quantile sketch: values are counted in logarithmic bins,
+so that every quantile is returned within a relative error of the
+exact value. sketches of the same relative accuracy are merged by
+adding the counts of their bins; the number of bins grows with the
+log of the range of the values, not with the number of values
+"""
+
+from collections import Counter
+
+import numpy as np
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# relative accuracy of the new sketches, set by run_aggregations
+RELATIVE_ACCURACY = DEFAULT_RELATIVE_ACCURACY
+
+# values closer to 0 are counted as 0
+MIN_INDEXABLE_VALUE = 1e-9
+
+
+def get_gamma(relative_accuracy) -> float:
+    """
+    returns the ratio of the bounds of a bin
+    """
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def init_sketch(relative_accuracy=None) -> dict:
+    """
+    returns a sketch with no values
+    """
+    return {
+        "accuracy": relative_accuracy or RELATIVE_ACCURACY,
+        "zero": 0,
+        "positive": Counter(),
+        "negative": Counter(),
+    }
+
+
+def get_bins(values, gamma) -> Counter:
+    """
+    returns bin index => count of the positive values
+    """
+    if not len(values):
+        return Counter()
+    indexes = np.ceil(np.log(values) / np.log(gamma)).astype("int64")
+    indexes, counts = np.unique(indexes, return_counts=True)
+    return Counter(dict(zip(indexes.tolist(), counts.tolist())))
+
+
+def cal_sketch(values, relative_accuracy=None) -> dict:
+    """
+    returns the sketch of the float64 array of non null values
+    """
+    sketch = init_sketch(relative_accuracy)
+    gamma = get_gamma(sketch["accuracy"])
+    positive = values[values > MIN_INDEXABLE_VALUE]
+    negative = -values[values < -MIN_INDEXABLE_VALUE]
+    sketch["zero"] = len(values) - len(positive) - len(negative)
+    sketch["positive"] = get_bins(positive, gamma)
+    sketch["negative"] = get_bins(negative, gamma)
+    return sketch
+
+
+def get_count(sketch) -> int:
+    """
+    returns the number of values in the sketch
+    """
+    return (
+        sketch["zero"]
+        + sum(sketch["positive"].values())
+        + sum(sketch["negative"].values())
+    )
+
+
+def merge_sketches(sketch, other) -> dict:
+    """
+    adds the bins of other to sketch
+    """
+    if not get_count(other):
+        return sketch
+    if not get_count(sketch):
+        sketch["accuracy"] = other["accuracy"]
+    if sketch["accuracy"] != other["accuracy"]:
+        raise ValueError(
+            "sketches of relative accuracy {} and {} can not be merged".format(
+                sketch["accuracy"], other["accuracy"]
+            )
+        )
+    sketch["zero"] += other["zero"]
+    sketch["positive"].update(other["positive"])
+    sketch["negative"].update(other["negative"])
+    return sketch
+
+
+def get_quantiles(sketch, quantiles) -> list:
+    """
+    returns the value of each quantile (0 to 1) of the sketch,
+    NaN for an empty sketch
+    """
+    count = get_count(sketch)
+    if not count:
+        return [np.nan] * len(quantiles)
+
+    gamma = get_gamma(sketch["accuracy"])
+    negative = sorted(sketch["negative"].items(), reverse=True)
+    positive = sorted(sketch["positive"].items())
+    # bins in increasing order of their values
+    indexes = np.array(
+        [index for index, _ in negative] + [index for index, _ in positive],
+        dtype="float64",
+    )
+    bin_values = 2 * np.power(gamma, indexes) / (gamma + 1)
+    bin_values[: len(negative)] *= -1
+    bin_values = np.insert(bin_values, len(negative), 0.0)
+    counts = np.array(
+        [count for _, count in negative] + [sketch["zero"]] + [count for _, count in positive]
+    )
+
+    ranks = np.array(quantiles, dtype="float64") * (count - 1)
+    positions = np.searchsorted(np.cumsum(counts), ranks, side="right")
+    return bin_values[positions].tolist()
@@ -0,0 +1,311 @@
+"""
+rollup store of the per bucket partial aggregates, so that dashboards
+query the history without reading the raw logs again.
+the binary state of each 1 minute bucket of an input is upserted
+into the 1m tier, merged with the state of the other inputs of the
+minute. compaction merges the states into the 5m, 1h and 1d tiers:
+each row keeps the pending delta not yet merged into its parent,
+so compaction only merges states and never rescans raw data.
+each tier has its own retention, relative to its newest bucket.
+the rows are kept in a local SQLite file, keyed by
+    (tier, digest of the bucket plan, bucket start in epoch seconds)
+with the bucket plans, so the states are compacted and queried
+without the provision
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+
+from aggregation_code import accumulators, plan_class
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 24 * 3600
+
+DURATION_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": DAY_SECONDS}
+
+
+class RollupTier(NamedTuple):
+    """
+    tier of the rollup store, buckets of seconds kept for retention seconds
+    """
+
+    name: str
+    seconds: int
+    retention: int
+
+
+# from the finest tier, each tier is compacted into the next one
+TIERS = (
+    RollupTier("1m", 60, 2 * DAY_SECONDS),
+    RollupTier("5m", 300, 14 * DAY_SECONDS),
+    RollupTier("1h", 3600, 90 * DAY_SECONDS),
+    RollupTier("1d", DAY_SECONDS, 800 * DAY_SECONDS),
+)
+
+
+def parse_duration(text) -> int:
+    """
+    returns the seconds of the duration, say 90s, 15m, 36h or 30d
+    """
+    text = text.strip()
+    if text and text[-1] in DURATION_SECONDS:
+        return int(float(text[:-1]) * DURATION_SECONDS[text[-1]])
+    return int(float(text))
+
+
+def parse_retention(text, tiers=TIERS) -> tuple:
+    """
+    returns the tiers with the retention of the text, as
+    tier=duration separated by commas, say 1m=1d,1d=400d
+    """
+    retention = {}
+    for item in filter(None, (item.strip() for item in text.split(","))):
+        name, _, duration = item.partition("=")
+        retention[name.strip()] = parse_duration(duration)
+    unknown = retention.keys() - {tier.name for tier in tiers}
+    if unknown:
+        raise ValueError("unknown rollup tiers: {}".format(sorted(unknown)))
+    return tuple(
+        tier._replace(retention=retention.get(tier.name, tier.retention)) for tier in tiers
+    )
+
+
+def merge_states(plan, states) -> bytes:
+    """
+    returns the merge of the binary states of the plan, None being empty
+    """
+    states = [state for state in states if state is not None]
+    if len(states) <= 1:
+        return states[0] if states else None
+    return accumulators.dump_state(plan, accumulators.merge_states(plan, states))
+
+
+class RollupStore:
+    """
+    store of the rollups in a local SQLite file
+    """
+
+    def __init__(self, path, tiers=TIERS):
+        self.path = path
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        # digest => bucket plan
+        self.plans = {}
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS rollups ("
+                "tier TEXT, plan TEXT, bucket INTEGER, state BLOB, pending BLOB, "
+                "updated_at REAL, PRIMARY KEY (tier, plan, bucket))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS plans (plan TEXT PRIMARY KEY, definition TEXT)"
+            )
+
+    def get_tier(self, name) -> RollupTier:
+        """
+        returns the tier of the name
+        """
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier
+        raise ValueError("unknown rollup tier: {}".format(name))
+
+    def add_states(self, tier, plan, bucket_states, pending):
+        """
+        merges the binary state of each bucket start of the tier
+        into the rows, and into their pending delta when pending is
+        set. called in a transaction
+        """
+        digest = plan.get_digest()
+        for bucket, state in bucket_states.items():
+            row = self.connection.execute(
+                "SELECT state, pending FROM rollups WHERE tier = ? AND plan = ? AND bucket = ?",
+                (tier.name, digest, bucket),
+            ).fetchone()
+            row_state, row_pending = row if row is not None else (None, None)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    tier.name,
+                    digest,
+                    bucket,
+                    merge_states(plan, [row_state, state]),
+                    merge_states(plan, [row_pending, state]) if pending else None,
+                    time.time(),
+                ),
+            )
+
+    def upsert(self, plan, bucket_states):
+        """
+        merges the binary state of each 1 minute bucket start into the
+        finest tier, plan is the plan of the input, or its bucket plan
+        """
+        if not bucket_states:
+            return
+        plan = plan.get_bucket_plan()
+        with self.lock, self.connection:
+            if plan.get_digest() not in self.plans:
+                self.connection.execute(
+                    "INSERT OR IGNORE INTO plans VALUES (?, ?)",
+                    (plan.get_digest(), plan_class.dumps_plan(plan)),
+                )
+                self.plans[plan.get_digest()] = plan
+            self.add_states(self.tiers[0], plan, bucket_states, len(self.tiers) > 1)
+        logger.debug("rollups: %s buckets upserted", len(bucket_states))
+
+    def compact(self) -> int:
+        """
+        merges the pending deltas of each tier into the buckets
+        of the next tier, tier by tier. returns the number of
+        rows compacted
+        """
+        compacted = 0
+        for tier, parent in zip(self.tiers, self.tiers[1:]):
+            with self.lock, self.connection:
+                rows = self.connection.execute(
+                    "SELECT plan, bucket, pending FROM rollups "
+                    "WHERE tier = ? AND pending IS NOT NULL",
+                    (tier.name,),
+                ).fetchall()
+                # plan => parent bucket start => pending deltas
+                deltas = {}
+                for digest, bucket, pending in rows:
+                    deltas.setdefault(digest, {}).setdefault(
+                        bucket - bucket % parent.seconds, []
+                    ).append(pending)
+                for digest, parent_deltas in deltas.items():
+                    plan = self.get_plan(digest)
+                    if plan is None:
+                        logger.warning("rollup plan %s is of another version", digest)
+                        continue
+                    self.add_states(
+                        parent,
+                        plan,
+                        {
+                            bucket: merge_states(plan, states)
+                            for bucket, states in parent_deltas.items()
+                        },
+                        parent is not self.tiers[-1],
+                    )
+                self.connection.execute(
+                    "UPDATE rollups SET pending = NULL WHERE tier = ? AND pending IS NOT NULL",
+                    (tier.name,),
+                )
+            compacted += len(rows)
+        logger.debug("rollups: %s rows compacted", compacted)
+        return compacted
+
+    def expire(self) -> int:
+        """
+        deletes the rows older than the retention of their tier,
+        relative to the newest bucket of the tier. rows with a pending
+        delta are kept until compacted. returns the number of rows deleted
+        """
+        deleted = 0
+        with self.lock, self.connection:
+            for tier in self.tiers:
+                deleted += self.connection.execute(
+                    "DELETE FROM rollups WHERE tier = ? AND pending IS NULL AND bucket < "
+                    "(SELECT MAX(bucket) FROM rollups WHERE tier = ?) - ?",
+                    (tier.name, tier.name, tier.retention),
+                ).rowcount
+        logger.debug("rollups: %s rows expired", deleted)
+        return deleted
+
+    def get_states(self, tier, plan, start, end) -> list:
+        """
+        returns the sorted (bucket start, binary state) of the
+        tier and plan with a bucket start in [start, end)
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT bucket, state FROM rollups WHERE tier = ? AND plan = ? "
+                "AND bucket >= ? AND bucket < ? ORDER BY bucket",
+                (tier.name, plan.get_digest(), start, end),
+            ).fetchall()
+
+    def query(self, plan, start, end, tier="1m") -> list:
+        """
+        returns the finalized metrics of each bucket of the tier that
+        starts in [start, end), epoch seconds. plan is the plan of the
+        input, or its bucket plan
+        """
+        plan = plan.get_bucket_plan()
+        tier = self.get_tier(tier)
+        return [
+            {
+                "start": bucket,
+                "end": bucket + tier.seconds,
+                "result": accumulators.get_result(accumulators.load_state(plan, state)),
+            }
+            for bucket, state in self.get_states(tier, plan, start, end)
+        ]
+
+    def query_total(self, plan, start, end) -> dict:
+        """
+        returns the finalized metrics of [start, end), merged from
+        the coarsest buckets that fit in the range, finer buckets
+        at its edges. to be called after compact
+        """
+        plan = plan.get_bucket_plan()
+        uncovered = [(start, end)]
+        states = []
+        for tier in reversed(self.tiers):
+            for bucket, state in self.get_states(tier, plan, start, end):
+                bucket_end = bucket + tier.seconds
+                for index, (low, high) in enumerate(uncovered):
+                    if low <= bucket and bucket_end <= high:
+                        uncovered[index:index + 1] = [
+                            interval
+                            for interval in ((low, bucket), (bucket_end, high))
+                            if interval[0] < interval[1]
+                        ]
+                        states.append(state)
+                        break
+        if not states:
+            return {}
+        return accumulators.get_result(accumulators.merge_states(plan, states))
+
+    def get_plan(self, digest):
+        """
+        returns the bucket plan of the digest, None when it is
+        of another plan format version. called with the lock
+        """
+        if digest not in self.plans:
+            (definition,) = self.connection.execute(
+                "SELECT definition FROM plans WHERE plan = ?", (digest,)
+            ).fetchone()
+            self.plans[digest] = plan_class.plan_from_dict(json.loads(definition))
+        return self.plans[digest]
+
+    def get_stats(self) -> dict:
+        """
+        returns tier => number of rows
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT tier, COUNT(*) FROM rollups GROUP BY tier"
+            ).fetchall()
+        return dict(rows)
+
+
+def open_rollup_store(url, retention=""):
+    """
+    returns the RollupStore of the url, sqlite:///tmp/ds2-rollups.db or
+    a path to a SQLite file, with the retention of parse_retention.
+    None when url is empty or the store can not be opened
+    """
+    if not url:
+        return None
+    try:
+        path = url[len("sqlite://"):] if url.startswith("sqlite://") else url
+        return RollupStore(path, parse_retention(retention))
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("rollup store %s not opened: %s: %s", url, type(err), err)
+    return None
@@ -0,0 +1,602 @@
+"""
+sinks publishing the metrics of the results: CloudWatch PutMetricData,
+CloudWatch Embedded Metric Format log lines, Azure Monitor custom
+metrics and local files.
+the numeric values of a result are flattened into metrics, each sink
+packs them into batches within the limits of its API, and the batches
+are sent by a pool of threads with bounded concurrency, retried with
+exponential backoff. flush waits for all the batches, so that the
+metrics are published before the function returns
+"""
+
+import datetime
+import importlib
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import NamedTuple
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NAMESPACE = "DS2"
+
+# batches sent at a time by a publisher
+DEFAULT_MAX_CONCURRENCY = 4
+
+# attempts of a batch, and backoff before each retry: a random delay
+# up to base * 2^retry, capped (full jitter)
+MAX_ATTEMPTS = 5
+BACKOFF_BASE_SECONDS = 0.1
+BACKOFF_MAX_SECONDS = 5.0
+
+# HTTP status codes of the errors that are retried
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# error codes of AWS that are retried
+RETRYABLE_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "ServiceUnavailable",
+    "InternalFailure",
+}
+
+# exceptions of botocore raised before a response, retried
+RETRYABLE_EXCEPTION_NAMES = {
+    "EndpointConnectionError",
+    "ConnectTimeoutError",
+    "ReadTimeoutError",
+    "ConnectionClosedError",
+}
+
+# limits of PutMetricData: metrics per call, bytes per request
+CLOUDWATCH_MAX_METRICS = 1000
+CLOUDWATCH_MAX_BYTES = 1024 * 1024
+CLOUDWATCH_MAX_DIMENSIONS = 30
+
+# limits of an EMF log event: metrics per document, bytes per event
+EMF_MAX_METRICS = 100
+EMF_MAX_BYTES = 256 * 1024
+
+# limits of an Azure Monitor custom metrics request: series of the
+# metric, bytes per request, dimensions
+AZURE_MONITOR_MAX_SERIES = 50
+AZURE_MONITOR_MAX_BYTES = 1024 * 1024
+AZURE_MONITOR_MAX_DIMENSIONS = 10
+AZURE_MONITOR_SCOPE = "https://monitoring.azure.com/.default"
+
+# lines appended per write of a file sink
+FILE_MAX_METRICS = 1000
+
+# seconds of an HTTP request
+HTTP_TIMEOUT = 10
+
+
+class Metric(NamedTuple):
+    """
+    value of a metric at a time, epoch seconds,
+    with its dimensions: tuple of (name, value)
+    """
+
+    name: str
+    value: float
+    timestamp: float
+    dimensions: tuple = ()
+
+
+def is_metric_value(value) -> bool:
+    """
+    returns True if the value is a finite number, not a bool
+    """
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+    )
+
+
+def get_metrics(result, timestamp, dimensions=(), prefix="") -> list:
+    """
+    returns the metrics of the numeric values of the result:
+        - values of nested dicts are named <key>.<nested key>
+        - buckets of the timeseries are at the bucket start,
+          with the dimension interval
+        - groups have the dimensions of the group
+    top-k lists and other values are left out
+    """
+    metrics = []
+    for key, value in result.items():
+        name = prefix + str(key)
+        if key == "timeseries" and not prefix:
+            for interval, buckets in value.items():
+                interval_dimensions = dimensions + (("interval", "{}m".format(interval)),)
+                for bucket, aggregates in buckets.items():
+                    metrics.extend(get_metrics(aggregates, float(bucket), interval_dimensions))
+        elif key == "groups" and not prefix and isinstance(value, list):
+            for group in value:
+                group_dimensions = dimensions + tuple(
+                    (str(dimension), str(dimension_value))
+                    for dimension, dimension_value in group["dimensions"].items()
+                )
+                metrics.append(Metric("rows", float(group["rows"]), timestamp, group_dimensions))
+                metrics.extend(get_metrics(group["result"], timestamp, group_dimensions))
+        elif isinstance(value, dict):
+            metrics.extend(get_metrics(value, timestamp, dimensions, name + "."))
+        elif is_metric_value(value):
+            metrics.append(Metric(name, float(value), timestamp, dimensions))
+    return metrics
+
+
+def is_retryable(err) -> bool:
+    """
+    returns True if the error of a send is transient
+    """
+    status = getattr(err, "code", None)
+    response = getattr(err, "response", None)
+    if isinstance(response, dict):
+        error_code = response.get("Error", {}).get("Code")
+        status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return error_code in RETRYABLE_ERROR_CODES or status in RETRYABLE_STATUS_CODES
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES
+    return isinstance(err, OSError) or type(err).__name__ in RETRYABLE_EXCEPTION_NAMES
+
+
+def get_backoff(retry, base=BACKOFF_BASE_SECONDS, cap=BACKOFF_MAX_SECONDS) -> float:
+    """
+    returns the seconds to wait before the retry, from 1
+    """
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+def to_datetime(timestamp) -> datetime.datetime:
+    """
+    returns the UTC datetime of the epoch seconds
+    """
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+class MetricSink:
+    """
+    packs the metrics into batches of at most max_metrics metrics
+    and max_bytes bytes, of metrics of the same batch key.
+    sinks implement send(batch)
+    """
+
+    name = "sink"
+    max_metrics = None
+    max_bytes = None
+
+    def get_batch_key(self, metric):
+        """
+        returns the key of the metrics that can be sent together
+        """
+        # pylint: disable=unused-argument
+        return None
+
+    def get_size(self, metric) -> int:
+        """
+        returns about the bytes of the metric in a request
+        """
+        return len(metric.name) + sum(len(name) + len(value) for name, value in metric.dimensions)
+
+    def get_batches(self, metrics) -> list:
+        """
+        returns the lists of metrics sent by a call each
+        """
+        batches = []
+        # batch key => (metrics, bytes) of the batch being filled
+        filling = {}
+        for metric in metrics:
+            key = self.get_batch_key(metric)
+            batch, size = filling.get(key, ([], 0))
+            metric_size = self.get_size(metric)
+            if batch and (
+                (self.max_metrics and len(batch) >= self.max_metrics)
+                or (self.max_bytes and size + metric_size > self.max_bytes)
+            ):
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(metric)
+            filling[key] = (batch, size + metric_size)
+        batches.extend(batch for batch, _ in filling.values())
+        return batches
+
+    def send(self, batch):
+        """
+        publishes the batch of metrics
+        """
+        raise NotImplementedError
+
+
+class CloudWatchSink(MetricSink):
+    """
+    publishes the metrics with PutMetricData, client is the boto3
+    cloudwatch client, created when not set. retries are left
+    to the publisher
+    """
+
+    name = "cloudwatch"
+    max_metrics = CLOUDWATCH_MAX_METRICS
+    # room is left for the encoding of the request
+    max_bytes = CLOUDWATCH_MAX_BYTES // 2
+
+    def __init__(self, namespace=DEFAULT_NAMESPACE, client=None, endpoint_url=None):
+        self.namespace = namespace
+        if client is None:
+            boto3 = importlib.import_module("boto3")
+            config = importlib.import_module("botocore.config")
+            client = boto3.client(
+                "cloudwatch",
+                endpoint_url=endpoint_url,
+                config=config.Config(retries={"mode": "standard", "total_max_attempts": 1}),
+            )
+        self.client = client
+
+    def get_size(self, metric) -> int:
+        """
+        returns about the bytes of the metric in a request,
+        with the field names and the timestamp
+        """
+        return 100 + super().get_size(metric) + 30 * len(metric.dimensions)
+
+    def send(self, batch):
+        """
+        publishes the batch with one PutMetricData call
+        """
+        self.client.put_metric_data(
+            Namespace=self.namespace,
+            MetricData=[
+                {
+                    "MetricName": metric.name,
+                    "Dimensions": [
+                        {"Name": name, "Value": value}
+                        for name, value in metric.dimensions[:CLOUDWATCH_MAX_DIMENSIONS]
+                    ],
+                    "Timestamp": to_datetime(metric.timestamp),
+                    "Value": metric.value,
+                }
+                for metric in batch
+            ],
+        )
+
+
+class EMFSink(MetricSink):
+    """
+    writes the metrics as CloudWatch Embedded Metric Format log lines
+    to the stream, stdout by default, that lambda sends to CloudWatch
+    Logs. a document has the metrics of a timestamp and dimensions
+    """
+
+    name = "emf"
+    max_metrics = EMF_MAX_METRICS
+    # room is left for the metadata of the document
+    max_bytes = EMF_MAX_BYTES // 2
+
+    def __init__(self, namespace=DEFAULT_NAMESPACE, stream=None):
+        self.namespace = namespace
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def get_batch_key(self, metric):
+        """
+        documents have a single timestamp and set of dimensions
+        """
+        return metric.timestamp, metric.dimensions
+
+    def get_size(self, metric) -> int:
+        """
+        returns about the bytes of the metric in a document
+        """
+        return 2 * len(metric.name) + 50
+
+    def get_document(self, batch) -> dict:
+        """
+        returns the EMF document of the batch
+        """
+        metric = batch[0]
+        document = {
+            "_aws": {
+                "Timestamp": int(metric.timestamp * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [[name for name, _ in metric.dimensions]],
+                        "Metrics": [{"Name": metric.name} for metric in batch],
+                    }
+                ],
+            }
+        }
+        document.update(metric.dimensions)
+        document.update((metric.name, metric.value) for metric in batch)
+        return document
+
+    def send(self, batch):
+        """
+        writes the document of the batch as one line
+        """
+        line = json.dumps(self.get_document(batch), separators=(",", ":")) + "\n"
+        stream = self.stream or sys.stdout
+        with self.lock:
+            stream.write(line)
+            stream.flush()
+
+
+class AzureMonitorSink(MetricSink):
+    """
+    publishes the metrics to the Azure Monitor custom metrics API of the
+    resource, say /subscriptions/<id>/resourceGroups/<group>/providers/
+    Microsoft.Web/sites/<function app>. a request has the series of the
+    dimension values of a metric at a time. the bearer token is of
+    azure.identity's DefaultAzureCredential when not set
+    """
+
+    name = "azuremonitor"
+    max_metrics = AZURE_MONITOR_MAX_SERIES
+    max_bytes = AZURE_MONITOR_MAX_BYTES // 2
+
+    def __init__(
+        self, region, resource_id, namespace=DEFAULT_NAMESPACE, token=None, endpoint=None
+    ):
+        # pylint: disable=too-many-arguments
+        self.namespace = namespace
+        self.url = (endpoint or "https://{}.monitoring.azure.com".format(region)) + (
+            "/" + resource_id.strip("/") + "/metrics"
+        )
+        self.token = token
+        self.credential = None
+        self.lock = threading.Lock()
+
+    def get_token(self) -> str:
+        """
+        returns the bearer token, from the credential when not set
+        """
+        if self.token is not None:
+            return self.token
+        with self.lock:
+            if self.credential is None:
+                identity = importlib.import_module("azure.identity")
+                self.credential = identity.DefaultAzureCredential()
+        return self.credential.get_token(AZURE_MONITOR_SCOPE).token
+
+    def get_batch_key(self, metric):
+        """
+        requests have a single metric, time and dimension names
+        """
+        return metric.name, metric.timestamp, tuple(name for name, _ in metric.dimensions)
+
+    def get_size(self, metric) -> int:
+        """
+        returns about the bytes of the series of the metric
+        """
+        return 100 + sum(len(value) + 3 for _, value in metric.dimensions)
+
+    def get_body(self, batch) -> dict:
+        """
+        returns the body of the request of the batch
+        """
+        metric = batch[0]
+        dimensions = metric.dimensions[:AZURE_MONITOR_MAX_DIMENSIONS]
+        return {
+            "time": to_datetime(metric.timestamp).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "data": {
+                "baseData": {
+                    "metric": metric.name,
+                    "namespace": self.namespace,
+                    "dimNames": [name for name, _ in dimensions],
+                    "series": [
+                        {
+                            "dimValues": [
+                                value
+                                for _, value in series.dimensions[:AZURE_MONITOR_MAX_DIMENSIONS]
+                            ],
+                            "min": series.value,
+                            "max": series.value,
+                            "sum": series.value,
+                            "count": 1,
+                        }
+                        for series in batch
+                    ],
+                }
+            },
+        }
+
+    def send(self, batch):
+        """
+        publishes the batch with one POST request
+        """
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(self.get_body(batch)).encode("utf-8"),
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": "Bearer " + self.get_token(),
+            },
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+            response.read()
+
+
+class FileSink(MetricSink):
+    """
+    appends the metrics to a local file, as JSON lines
+    """
+
+    name = "file"
+    max_metrics = FILE_MAX_METRICS
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def send(self, batch):
+        """
+        appends the lines of the batch
+        """
+        lines = "".join(json.dumps(metric._asdict()) + "\n" for metric in batch)
+        with self.lock, open(self.path, "a", encoding="utf-8") as file_writer:
+            file_writer.write(lines)
+
+
+class MetricPublisher:
+    """
+    sends the batches of the metrics of the sinks in a pool of at most
+    max_concurrency threads, as soon as they are submitted, so that
+    publishing overlaps the rest of the invocation, until flush
+    """
+
+    def __init__(
+        self,
+        sinks,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        max_attempts=MAX_ATTEMPTS,
+        backoff_base=BACKOFF_BASE_SECONDS,
+    ):
+        self.sinks = sinks
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.executor = None
+        self.lock = threading.Lock()
+        # (sink, number of metrics, future) of the batches not flushed
+        self.pending = []
+        self.started = None
+
+    def send_with_retries(self, sink, batch) -> int:
+        """
+        sends the batch, retrying the transient errors
+        with backoff. returns the number of retries
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                sink.send(batch)
+                return attempt - 1
+            except Exception as err:  # pylint: disable=broad-except
+                if attempt == self.max_attempts or not is_retryable(err):
+                    raise
+                delay = get_backoff(attempt, self.backoff_base)
+                logger.debug("%s: retry %s in %.3fs: %s", sink.name, attempt, delay, err)
+                time.sleep(delay)
+        return self.max_attempts
+
+    def submit(self, result, timestamp=None, dimensions=()) -> int:
+        """
+        starts publishing the metrics of the result to all the sinks,
+        at the timestamp, now by default. returns the number of metrics
+        """
+        metrics = get_metrics(result, time.time() if timestamp is None else timestamp, dimensions)
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency, thread_name_prefix="ds2-sink"
+                )
+            if self.started is None:
+                self.started = time.perf_counter()
+            for sink in self.sinks:
+                for batch in sink.get_batches(metrics):
+                    self.pending.append(
+                        (
+                            sink,
+                            len(batch),
+                            self.executor.submit(self.send_with_retries, sink, batch),
+                        )
+                    )
+        return len(metrics)
+
+    def flush(self) -> dict:
+        """
+        waits until the batches submitted are sent or failed.
+        returns sink name => stats of the batches
+        """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            started, self.started = self.started, None
+        wait([future for _, _, future in pending])
+
+        stats = {
+            sink.name: {"metrics": 0, "batches": 0, "retries": 0, "failed": 0}
+            for sink in self.sinks
+        }
+        for sink, size, future in pending:
+            sink_stats = stats[sink.name]
+            sink_stats["batches"] += 1
+            sink_stats["metrics"] += size
+            try:
+                sink_stats["retries"] += future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                logger.error("%s: %s: %s", sink.name, type(err), err)
+                sink_stats["failed"] += 1
+        if started is not None:
+            stats["seconds"] = round(time.perf_counter() - started, 3)
+        return stats
+
+    def publish(self, result, timestamp=None, dimensions=()) -> dict:
+        """
+        publishes the metrics of the result, returns the stats of flush
+        """
+        self.submit(result, timestamp, dimensions)
+        return self.flush()
+
+    def close(self):
+        """
+        flushes, then stops the threads
+        """
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+def open_sink(url) -> MetricSink:
+    """
+    returns the sink of the url:
+        cloudwatch://<namespace>
+        emf://<namespace>, written to stdout
+        azuremonitor://<region>/<resource id>?namespace=<namespace>
+        file:///path/metrics.jsonl
+    ?endpoint=http://host:port sends the requests of cloudwatch
+    and azuremonitor to another endpoint, say a local stand-in
+    """
+    parts = urlsplit(url)
+    options = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+    if parts.scheme == "cloudwatch":
+        return CloudWatchSink(
+            parts.netloc or DEFAULT_NAMESPACE, endpoint_url=options.get("endpoint")
+        )
+    if parts.scheme == "emf":
+        return EMFSink(parts.netloc or DEFAULT_NAMESPACE)
+    if parts.scheme == "azuremonitor":
+        return AzureMonitorSink(
+            parts.netloc,
+            parts.path,
+            options.get("namespace", DEFAULT_NAMESPACE),
+            endpoint=options.get("endpoint"),
+        )
+    if parts.scheme == "file":
+        return FileSink(parts.path)
+    raise ValueError("unknown metric sink: {}".format(url))
+
+
+def open_publisher(urls, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    returns the MetricPublisher of the sinks of the comma separated
+    urls, None when there are none. sinks that can not be opened
+    are left out
+    """
+    sinks = []
+    for url in filter(None, (url.strip() for url in urls.split(","))):
+        try:
+            sinks.append(open_sink(url))
+        except Exception as err:  # pylint: disable=broad-except
+            logger.error("metric sink %s not opened: %s: %s", url, type(err), err)
+    if not sinks:
+        return None
+    return MetricPublisher(sinks, max_concurrency)
@@ -0,0 +1,213 @@
+"""
+compact binary serialization of the partial-aggregate states.
+values are encoded with a one byte tag, integers as zigzag varints,
+floats as 8 bytes and numeric arrays as raw bytes; the payload is
+zlib compressed. unlike pickle, decoding never runs code
+"""
+
+import struct
+import zlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# format of the encoded values, bumped when the tags change
+CODEC_VERSION = 1
+
+TAG_NONE = b"N"
+TAG_TRUE = b"T"
+TAG_FALSE = b"F"
+TAG_INT = b"i"
+TAG_FLOAT = b"d"
+TAG_STR = b"s"
+TAG_BYTES = b"b"
+TAG_LIST = b"l"
+TAG_TUPLE = b"t"
+TAG_DICT = b"m"
+TAG_COUNTER = b"c"
+TAG_ARRAY = b"a"
+TAG_TYPED_ARRAY = b"u"
+TAG_FRAME = b"f"
+
+FLOAT = struct.Struct("<d")
+
+
+def write_varint(out, value):
+    """
+    appends the unsigned int as a varint
+    """
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def write_value(out, value):
+    """
+    appends the encoded value to the bytearray
+    """
+    # pylint: disable=too-many-branches
+    if value is None:
+        out += TAG_NONE
+    elif isinstance(value, (bool, np.bool_)):
+        out += TAG_TRUE if value else TAG_FALSE
+    elif isinstance(value, (int, np.integer)):
+        value = int(value)
+        out += TAG_INT
+        write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif isinstance(value, (float, np.floating)):
+        out += TAG_FLOAT
+        out += FLOAT.pack(value)
+    elif isinstance(value, str):
+        out += TAG_STR
+        write_bytes(out, value.encode("utf-8"))
+    elif isinstance(value, bytes):
+        out += TAG_BYTES
+        write_bytes(out, value)
+    elif isinstance(value, np.ndarray) and value.dtype.kind in "iub":
+        # integer arrays keep their type, say the uint8 registers of a HyperLogLog
+        dtype = value.dtype.newbyteorder("<")
+        out += TAG_TYPED_ARRAY
+        write_bytes(out, dtype.str.encode("ascii"))
+        write_bytes(out, np.ascontiguousarray(value, dtype=dtype).tobytes())
+    elif isinstance(value, np.ndarray):
+        out += TAG_ARRAY
+        write_bytes(out, np.ascontiguousarray(value, dtype="<f8").tobytes())
+    elif isinstance(value, pd.DataFrame):
+        out += TAG_FRAME
+        write_value(
+            out,
+            {
+                str(col): [
+                    None if pd.isna(item) else item
+                    for item in value[col].to_numpy(dtype=object).tolist()
+                ]
+                for col in value.columns
+            },
+        )
+    elif isinstance(value, Counter):
+        out += TAG_COUNTER
+        write_items(out, value.items())
+    elif isinstance(value, dict):
+        out += TAG_DICT
+        write_items(out, value.items())
+    elif isinstance(value, (list, tuple)):
+        out += TAG_TUPLE if isinstance(value, tuple) else TAG_LIST
+        write_varint(out, len(value))
+        for item in value:
+            write_value(out, item)
+    else:
+        raise TypeError("can not encode {}".format(type(value)))
+
+
+def write_bytes(out, value):
+    """
+    appends the length and the bytes
+    """
+    write_varint(out, len(value))
+    out += value
+
+
+def write_items(out, items):
+    """
+    appends the key value pairs of a dict
+    """
+    items = list(items)
+    write_varint(out, len(items))
+    for key, value in items:
+        write_value(out, key)
+        write_value(out, value)
+
+
+class Reader:
+    """
+    decodes the values written by write_value
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def read_varint(self) -> int:
+        """
+        returns the next varint
+        """
+        value, shift = 0, 0
+        while True:
+            byte = self.data[self.offset]
+            self.offset += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def read_bytes(self) -> bytes:
+        """
+        returns the next length prefixed bytes
+        """
+        size = self.read_varint()
+        value = self.data[self.offset:self.offset + size].tobytes()
+        self.offset += size
+        return value
+
+    def read_value(self):
+        """
+        returns the next value
+        """
+        # pylint: disable=too-many-return-statements
+        tag = self.data[self.offset:self.offset + 1].tobytes()
+        self.offset += 1
+        if tag == TAG_NONE:
+            return None
+        if tag in (TAG_TRUE, TAG_FALSE):
+            return tag == TAG_TRUE
+        if tag == TAG_INT:
+            value = self.read_varint()
+            return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+        if tag == TAG_FLOAT:
+            value = FLOAT.unpack_from(self.data, self.offset)[0]
+            self.offset += FLOAT.size
+            return value
+        if tag == TAG_STR:
+            return self.read_bytes().decode("utf-8")
+        if tag == TAG_BYTES:
+            return self.read_bytes()
+        if tag == TAG_ARRAY:
+            return np.frombuffer(self.read_bytes(), dtype="<f8").copy()
+        if tag == TAG_TYPED_ARRAY:
+            dtype = np.dtype(self.read_bytes().decode("ascii"))
+            return np.frombuffer(self.read_bytes(), dtype=dtype).astype(dtype.newbyteorder("="))
+        if tag == TAG_FRAME:
+            return pd.DataFrame(self.read_value())
+        if tag in (TAG_DICT, TAG_COUNTER):
+            items = {}
+            for _ in range(self.read_varint()):
+                key = self.read_value()
+                items[key] = self.read_value()
+            return Counter(items) if tag == TAG_COUNTER else items
+        if tag in (TAG_LIST, TAG_TUPLE):
+            values = [self.read_value() for _ in range(self.read_varint())]
+            return tuple(values) if tag == TAG_TUPLE else values
+        raise ValueError("unknown tag {!r} at offset {}".format(tag, self.offset - 1))
+
+
+def encode(value, level=6) -> bytes:
+    """
+    returns the compressed binary encoding of the value
+    """
+    out = bytearray([CODEC_VERSION])
+    write_value(out, value)
+    return zlib.compress(bytes(out), level)
+
+
+def decode(data):
+    """
+    returns the value of the bytes returned by encode
+    """
+    payload = zlib.decompress(data)
+    if payload[0] != CODEC_VERSION:
+        raise ValueError("state codec version {} is not {}".format(payload[0], CODEC_VERSION))
+    reader = Reader(payload)
+    reader.offset = 1
+    return reader.read_value()
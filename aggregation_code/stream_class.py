@@ -2,11 +2,20 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# delimiter names in the stream config => delimiter
+DELIMITERS = {
+    "SPACE": " ",
+    "TAB": "\t",
+    "COMMA": ",",
+}
+
 
 class Fields:
-    def __init__(self, dataset_id, dataset_name):
+    def __init__(self, dataset_id, dataset_name, dataset_dtype=None, categorical=False):
         self.id = dataset_id
         self.name = dataset_name
+        self.dtype = dataset_dtype
+        self.categorical = categorical
 
 
 class StreamMetadata:
@@ -64,7 +73,14 @@ class StreamMetadata:
         self.chosen_fields.append(Fields(None, "version"))
         for i in chosen_ids:
             try:
-                self.chosen_fields.append(Fields(i, all_ds_fields[i]["name"].lower()))
+                self.chosen_fields.append(
+                    Fields(
+                        i,
+                        all_ds_fields[i]["name"].lower(),
+                        all_ds_fields[i].get("dtype"),
+                        bool(all_ds_fields[i].get("categorical", 0)),
+                    )
+                )
             except Exception as err:
                 logger.warn("%s: key %s not found in all_fields_map ", err, i)
 
@@ -75,3 +91,27 @@ class StreamMetadata:
         returns the list of field names
         """
         return [field.name for field in self.chosen_fields]
+
+    def get_stream_field_dtypes(self):
+        """
+        returns the dtype details of the fields
+        as defined in the all_datastream_fields file
+        """
+        return {
+            field.name: {"dtype": field.dtype, "categorical": field.categorical}
+            for field in self.chosen_fields
+            if field.dtype is not None
+        }
+
+    def get_delimiter(self):
+        """
+        returns the delimiter of the STRUCTURED format,
+        defaults to space
+        """
+        if self.delimiter in DELIMITERS:
+            return DELIMITERS[self.delimiter]
+        if self.delimiter is not None and len(self.delimiter) == 1:
+            return self.delimiter
+        if self.delimiter is not None:
+            logger.warning("unknown delimiter %s, using SPACE", self.delimiter)
+        return DELIMITERS["SPACE"]
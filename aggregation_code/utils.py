@@ -3,16 +3,271 @@
     Uses connection string to connect to storage
 """
 
+import array
+import contextlib
+import gzip
+import importlib
 import io
 import json
 import logging
+import math
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
+from aggregation_code.metadata_cache import METADATA_CACHE, MetadataNotFoundError
+
 logger = logging.getLogger(__name__)
 
+# pylint: disable=invalid-name
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    logger.debug("orjson not available, using json to parse JSON lines")
+    json_loads = json.loads
+
+# placeholder used by DS2 for a field without value
+NULL_SENTINEL = "-"
+
+# nullable integer types, smallest first
+NULLABLE_INT_TYPES = ("Int8", "Int16", "Int32", "Int64")
+
+
+def get_reader_dtypes(field_dtypes, usecols=None) -> dict:
+    """
+    returns the dtype map to be passed to the reader,
+    built from the dtypes in the all_datastream_fields file.
+    bigint columns are parsed as float64, which is much faster
+    than parsing to a nullable integer type, and downcast later
+    """
+    dtypes = {}
+    for name, spec in field_dtypes.items():
+        if usecols is not None and name not in usecols:
+            continue
+        if spec["categorical"]:
+            dtypes[name] = "category"
+        elif spec["dtype"] == "bigint":
+            dtypes[name] = "float64"
+    return dtypes
+
+
+def get_reader_na_values(field_dtypes, usecols=None) -> dict:
+    """
+    returns the per column na_values for the reader,
+    NULL_SENTINEL is a missing value for typed columns only;
+    free text columns keep it as is
+    """
+    return {
+        name: [NULL_SENTINEL]
+        for name in get_reader_dtypes(field_dtypes, usecols)
+    }
+
+
+def downcast_integer(column):
+    """
+    returns the column as the smallest nullable
+    integer type that holds all of its values
+    """
+    if column.count() == 0:
+        return column.astype(NULLABLE_INT_TYPES[0])
+
+    col_min, col_max = column.min(), column.max()
+    for int_type in NULLABLE_INT_TYPES:
+        int_info = np.iinfo(int_type.lower())
+        if int_info.min <= col_min and col_max <= int_info.max:
+            return column.astype(int_type)
+    return column
+
+
+def is_integral(column) -> bool:
+    """
+    checks if every non null value of the numeric column is a whole number
+    """
+    values = column.dropna()
+    return bool((values % 1 == 0).all())
+
+
+def apply_field_dtypes(dataframe, field_dtypes):
+    """
+    converts the columns of the dataframe to the dtypes
+    in the all_datastream_fields file;
+    bigint columns are downcast to the smallest nullable integer type,
+    or kept as float64 when they have fractional values, say the
+    epochs with milliseconds of reqTimeSec,
+    and categorical bigint columns get numeric categories
+    """
+    for name, spec in field_dtypes.items():
+        if name not in dataframe.columns:
+            continue
+        if not spec["categorical"] and spec["dtype"] != "bigint":
+            continue
+
+        column = dataframe[name]
+        if not (
+            pd.api.types.is_numeric_dtype(column)
+            or isinstance(column.dtype, pd.CategoricalDtype)
+        ):
+            # not converted by the reader, say JSON input
+            column = column.replace(NULL_SENTINEL, np.nan)
+
+        if spec["categorical"]:
+            column = column.astype("category")
+            if NULL_SENTINEL in column.cat.categories:
+                column = column.cat.remove_categories([NULL_SENTINEL])
+            if spec["dtype"] == "bigint":
+                column = column.cat.rename_categories(
+                    pd.to_numeric(column.cat.categories)
+                )
+        else:
+            column = pd.to_numeric(column)
+            if is_integral(column):
+                column = downcast_integer(column.astype("Int64"))
+            else:
+                column = column.astype("float64")
+
+        dataframe[name] = column
+    return dataframe
+
+
+def get_csv_engine(engine):
+    """
+    returns the arrow_engine module for the arrow engine,
+    None for the pandas engine or when pyarrow is not available
+    """
+    if engine != "arrow":
+        return None
+    try:
+        return importlib.import_module("aggregation_code.arrow_engine")
+    except ImportError as err:
+        logger.warning("%s: %s, falling back to pandas engine", type(err), err)
+    return None
+
+
+def to_float(value):
+    """
+    returns the JSON value as float, NaN if missing or not
+    a number, same as pd.to_numeric with errors="coerce"
+    """
+    if value is None or value == NULL_SENTINEL:
+        return math.nan
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return math.nan
+
+
+def get_ordered_columns(chosen_field_names, usecols):
+    """
+    returns usecols in the order of the fields in the stream,
+    same as the column order of the STRUCTURED reader
+    """
+    return [name for name in chosen_field_names if name in usecols] + [
+        name for name in usecols if name not in chosen_field_names
+    ]
+
+
+def open_input(filename_or_buffer, compression="gzip"):
+    """
+    returns the binary file reader of the input,
+    decompressed when compression is gzip
+    """
+    if compression == "gzip":
+        return gzip.open(filename_or_buffer, "rb")
+    if isinstance(filename_or_buffer, (str, os.PathLike)):
+        return open(filename_or_buffer, "rb")
+    return contextlib.nullcontext(filename_or_buffer)
+
+
+def iter_json_lines(
+    filename_or_buffer,
+    chosen_field_names,
+    usecols,
+    field_dtypes,
+    chunksize=None,
+    compression="gzip",
+):
+    """
+    parses the gzip compressed (unless compression is None)
+    JSON lines one by one and yields
+    dataframes with only the usecols columns, of chunksize rows each
+    or a single dataframe when chunksize is not set.
+    keys are matched case insensitively to the lower cased usecols,
+    bigint fields are collected in float64 arrays and the rest in lists
+    """
+    # pylint: disable=too-many-locals
+    column_names = get_ordered_columns(chosen_field_names, usecols)
+    numeric_names = {
+        name
+        for name, dtype in get_reader_dtypes(field_dtypes, usecols).items()
+        if dtype == "float64"
+    }
+
+    def new_columns():
+        return {
+            name: array.array("d") if name in numeric_names else []
+            for name in column_names
+        }
+
+    def to_dataframe(columns):
+        return pd.DataFrame(
+            {
+                name: np.frombuffer(values, dtype=np.float64)
+                if name in numeric_names
+                else values
+                for name, values in columns.items()
+            },
+            columns=column_names,
+        )
+
+    # keys of the last record layout and the columns they map to
+    record_keys = None
+    numeric_keys, other_keys, missing_names = [], [], []
+
+    columns = new_columns()
+    rows = 0
+    with open_input(filename_or_buffer, compression) as file_reader:
+        for line in file_reader:
+            if not line.strip():
+                continue
+
+            record = json_loads(line)
+            if record.keys() != record_keys:
+                # new layout of keys; match them to the columns again
+                record_keys = set(record)
+                key_names = {key.lower(): key for key in record}
+                numeric_keys = [
+                    (key_names[name], columns[name])
+                    for name in column_names
+                    if name in key_names and name in numeric_names
+                ]
+                other_keys = [
+                    (key_names[name], columns[name])
+                    for name in column_names
+                    if name in key_names and name not in numeric_names
+                ]
+                missing_names = [name for name in column_names if name not in key_names]
+
+            for key, values in numeric_keys:
+                values.append(to_float(record[key]))
+            for key, values in other_keys:
+                values.append(record[key])
+            for name in missing_names:
+                columns[name].append(math.nan if name in numeric_names else None)
+
+            rows += 1
+            if chunksize and rows == chunksize:
+                yield to_dataframe(columns)
+                columns = new_columns()
+                record_keys = None
+                rows = 0
+
+    if rows or not chunksize:
+        yield to_dataframe(columns)
+
 
 class BaseUtils:
     """
@@ -31,6 +286,7 @@ class BaseUtils:
             "stream_file": "stream.json",
             "all_datastream_fields": "all_datastream_fields.json",
             "all_custom_functions": "all_custom_functions.json",
+            "plan_file": "aggregation_plan.json",
         }
 
     def get_dict_from_json(self, json_content) -> dict:
@@ -62,12 +318,27 @@ class BaseUtils:
         try:
             with open(os.path.join(self.config_dir, filename), "wb") as file_writer:
                 file_writer.write(data)
+            METADATA_CACHE.invalidate(self.get_metadata_cache_key(filename))
             logger.debug("write success for file: %s", filename)
 
         except Exception as err:
             logger.error("write failed for file: %s", filename)
             logger.error("%s: %s", type(err), err)
 
+    def write_output_file(self, location, key, data) -> str:
+        """
+        writes the binary output file to key under the local directory,
+        through a temporary file so that readers never see a partial file.
+        returns the path of the file
+        """
+        path = os.path.join(location, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file_writer:
+            file_writer.write(data)
+        os.replace(temp_path, path)
+        return path
+
     def read_file_to_text(self, file_to_read: str) -> dict:
         """
         Parse file and retuns content as text
@@ -99,84 +370,167 @@ class BaseUtils:
 
         return json_data
 
+    def get_metadata_cache_key(self, file_name) -> str:
+        """
+        returns the key of the metadata file in the metadata cache
+        """
+        return os.path.join(self.config_dir, file_name)
+
+    def fetch_metadata(self, file_name, etag=None):
+        """
+        returns (dict, etag) of the metadata file,
+        dict is None when the file is not modified since etag.
+        the etag of a local file is its modification time and size
+        """
+        file_to_read = os.path.join(self.config_dir, file_name)
+        try:
+            file_stat = os.stat(file_to_read)
+        except FileNotFoundError as err:
+            raise MetadataNotFoundError(file_to_read) from err
+        file_etag = "{}-{}".format(file_stat.st_mtime_ns, file_stat.st_size)
+        if file_etag == etag:
+            return None, etag
+        return self.read_json_file_to_dict(file_to_read), file_etag
+
+    def read_metadata_file(self, file_name, required=True) -> dict:
+        """
+        reads the metadata file through the process level metadata cache,
+        returns {} if the file can not be read
+        """
+        try:
+            return METADATA_CACHE.get(
+                self.get_metadata_cache_key(file_name),
+                lambda etag: self.fetch_metadata(file_name, etag),
+            )
+        except Exception as err:
+            log = logger.error if required else logger.debug
+            log("metadata read failed for file: %s", file_name)
+            log("%s: %s", type(err), err)
+        return {}
+
     def read_all_datastream_fields_metadata(self):
-        # TODO: add info
+        """
+        reads the all_datastream_fields file
+        """
         if "all_datastream_fields" in self.input_configs:
-            return self.read_json_file_to_dict(
-                os.path.join(
-                    self.config_dir, self.input_configs["all_datastream_fields"]
-                )
-            )
+            return self.read_metadata_file(self.input_configs["all_datastream_fields"])
         return {}
 
     def read_all_custom_functions_metadata(self):
-        # TODO: add info
+        """
+        reads the all_custom_functions file
+        """
         if "all_custom_functions" in self.input_configs:
-            return self.read_json_file_to_dict(
-                os.path.join(
-                    self.config_dir, self.input_configs["all_custom_functions"]
-                )
-            )
+            return self.read_metadata_file(self.input_configs["all_custom_functions"])
         return {}
 
     def read_stream_metadata(self):
-        # TODO: add info
+        """
+        reads the stream file
+        """
         if "stream_file" in self.input_configs:
-            return self.read_json_file_to_dict(
-                os.path.join(self.config_dir, self.input_configs["stream_file"])
-            )
+            return self.read_metadata_file(self.input_configs["stream_file"])
+        return {}
+
+    def read_plan_metadata(self):
+        """
+        reads the compiled aggregation plan file,
+        the plan is optional so a missing file is not an error
+        """
+        if "plan_file" in self.input_configs:
+            return self.read_metadata_file(self.input_configs["plan_file"], required=False)
         return {}
 
     def read_provision_metadata(self):
-        # TODO: add info
+        """
+        reads the provision file
+        """
         if "provision_file" in self.input_configs:
-            return self.read_json_file_to_dict(
-                os.path.join(self.config_dir, self.input_configs["provision_file"])
-            )
+            return self.read_metadata_file(self.input_configs["provision_file"])
         return {}
 
     def read_data_file_from_local(
-        self, filename, file_format, chosen_field_names, custom_field_names
+        self, filename, file_format, chosen_field_names, custom_field_names, **read_options
     ):
         return self.read_data_file(
-            filename, file_format, chosen_field_names, custom_field_names
+            filename, file_format, chosen_field_names, custom_field_names, **read_options
         )
 
     def read_data_file(
-        self, filename_or_buffer, file_format, chosen_field_names, custom_field_names
+        self,
+        filename_or_buffer,
+        file_format,
+        chosen_field_names,
+        custom_field_names,
+        chunksize=None,
+        field_dtypes=None,
+        delimiter=" ",
+        engine="pandas",
+        compression="gzip",
     ):
         """
         reads the content from the provided filename or iobuffer
+        returns a dataframe, or an iterator of dataframes of
+        chunksize rows each when chunksize is set.
+        columns are typed as per field_dtypes when set.
+        engine is the parser for STRUCTURED input, pandas or arrow.
+        the input is gzip compressed, or not when compression is None
         """
+        # pylint: disable=too-many-arguments
+        if chunksize:
+            return self.read_data_file_in_chunks(
+                filename_or_buffer,
+                file_format,
+                chosen_field_names,
+                custom_field_names,
+                chunksize,
+                field_dtypes,
+                delimiter,
+                engine,
+                compression,
+            )
+
         output_dataframe = None
+        field_dtypes = field_dtypes or {}
 
         logger.debug("all columns in the input file... \n%s", chosen_field_names)
         logger.debug("columns needed for aggregation... \n%s", custom_field_names)
 
         if file_format == "STRUCTURED":
-            output_dataframe = pd.read_csv(
-                filename_or_buffer,
-                index_col=False,
-                header=None,
-                compression="gzip",
-                names=chosen_field_names,
-                usecols=custom_field_names,
-                delimiter=" ",
-            )
+            csv_engine = get_csv_engine(engine)
+            if csv_engine is not None:
+                output_dataframe = csv_engine.read_csv(
+                    filename_or_buffer,
+                    chosen_field_names,
+                    custom_field_names,
+                    field_dtypes,
+                    delimiter,
+                    compression,
+                )
+            else:
+                output_dataframe = pd.read_csv(
+                    filename_or_buffer,
+                    index_col=False,
+                    header=None,
+                    compression=compression,
+                    names=chosen_field_names,
+                    usecols=custom_field_names,
+                    delimiter=delimiter,
+                    dtype=get_reader_dtypes(field_dtypes, custom_field_names),
+                    na_values=get_reader_na_values(field_dtypes, custom_field_names),
+                )
         else:
-            output_dataframe = pd.read_json(
-                filename_or_buffer, lines="True", compression="gzip", encoding="utf-8"
-            )
-            json_cnames = list(output_dataframe.columns.values)
-            json_new_cname = [x.lower() for x in json_cnames]
-            new_name_dic = {}
-            count = 0
-            for cname in json_cnames:
-                new_name_dic[cname] = json_new_cname[count]
-                count = count + 1
-                output_dataframe = output_dataframe.rename(
-                    columns=new_name_dic, inplace=False
+            output_dataframe = next(
+                iter_json_lines(
+                    filename_or_buffer,
+                    chosen_field_names,
+                    custom_field_names,
+                    field_dtypes,
+                    compression=compression,
                 )
+            )
+
+        output_dataframe = apply_field_dtypes(output_dataframe, field_dtypes)
 
         # check if read properly
         logger.debug("top 5 rows... \n%s", output_dataframe.head(5))
@@ -184,3 +538,63 @@ class BaseUtils:
         logger.debug("columns... \n%s", output_dataframe.columns)
 
         return output_dataframe
+
+    def read_data_file_in_chunks(
+        self,
+        filename_or_buffer,
+        file_format,
+        chosen_field_names,
+        custom_field_names,
+        chunksize,
+        field_dtypes=None,
+        delimiter=" ",
+        engine="pandas",
+        compression="gzip",
+    ):
+        """
+        reads the content from the provided filename or iobuffer
+        and yields dataframes of chunksize rows
+        """
+        # pylint: disable=too-many-arguments
+        field_dtypes = field_dtypes or {}
+        logger.debug("reading input in chunks of %s rows", chunksize)
+
+        if file_format == "STRUCTURED":
+            csv_engine = get_csv_engine(engine)
+            if csv_engine is not None:
+                reader = csv_engine.iter_csv(
+                    filename_or_buffer,
+                    chosen_field_names,
+                    custom_field_names,
+                    field_dtypes,
+                    delimiter,
+                    chunksize,
+                    compression,
+                )
+            else:
+                reader = pd.read_csv(
+                    filename_or_buffer,
+                    index_col=False,
+                    header=None,
+                    compression=compression,
+                    names=chosen_field_names,
+                    usecols=custom_field_names,
+                    delimiter=delimiter,
+                    dtype=get_reader_dtypes(field_dtypes, custom_field_names),
+                    na_values=get_reader_na_values(field_dtypes, custom_field_names),
+                    chunksize=chunksize,
+                )
+        else:
+            reader = iter_json_lines(
+                filename_or_buffer,
+                chosen_field_names,
+                custom_field_names,
+                field_dtypes,
+                chunksize,
+                compression,
+            )
+
+        for chunk in reader:
+            chunk = apply_field_dtypes(chunk, field_dtypes)
+            logger.debug("chunk rows: %s", len(chunk))
+            yield chunk
@@ -0,0 +1,179 @@
+"""
+compares the base aggregates of the provision files in configs/
+computed with one pandas reduction per (column, function), as before,
+and with cal_base_aggregates, one pass over the column per function list
+
+usage:
+    python -m benchmarks.bench_base_aggregates --rows 1000000
+"""
+
+import argparse
+import glob
+import math
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from aggregation_code import custom_functions
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+ALL_FUNCTIONS = list(custom_functions.BASE_AGGREGATE_STATS)
+
+
+def legacy_base_aggregates(lst, csvdata, col):
+    """
+    cal_base_aggregates before the single pass engine,
+    with variance as pandas var (it was computed as the median)
+    """
+    out = 0
+    if lst == "sum":
+        out = csvdata[col].sum()
+    if lst == "min":
+        out = csvdata[col].min()
+    if lst == "max":
+        out = csvdata[col].max()
+    if lst == "mean":
+        out = csvdata[col].mean()
+    if lst == "median":
+        out = csvdata[col].median()
+    if lst == "variance":
+        out = csvdata[col].var()
+    if lst == "any":
+        out = csvdata[col].any()
+    if lst == "count":
+        out = csvdata[col].count()
+    if out is pd.NA:
+        return math.nan
+    return float(out)
+
+
+def run_legacy(dataframe, base_aggregates) -> dict:
+    """
+    returns the aggregates, one reduction per (column, function)
+    """
+    result = {}
+    for aggregate in base_aggregates:
+        for function in aggregate.funcs:
+            result[aggregate.column + "_" + function] = legacy_base_aggregates(
+                function, dataframe, aggregate.column
+            )
+    return result
+
+
+def run_engine(dataframe, base_aggregates) -> dict:
+    """
+    returns the aggregates, one pass per column
+    """
+    result = {}
+    for aggregate in base_aggregates:
+        values = custom_functions.cal_base_aggregates(
+            dataframe[aggregate.column], aggregate.funcs
+        )
+        for function, value in zip(aggregate.funcs, values):
+            result[aggregate.column + "_" + function] = value
+    return result
+
+
+def get_best_time(function, repeat, *args) -> tuple:
+    """
+    returns (best seconds of repeat runs, result)
+    """
+    best = math.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def is_close(result, expected) -> bool:
+    """
+    checks the results are the same, NaN aware: a value
+    that is not defined is None in result, NaN in expected
+    """
+    return result.keys() == expected.keys() and all(
+        (value is None and math.isnan(expected[key]))
+        or math.isclose(value, expected[key], rel_tol=1e-8)
+        for key, value in result.items()
+    )
+
+
+def get_plans(obj) -> list:
+    """
+    returns (label, plan) of each provision file in configs/,
+    and of the one with the most columns with every base aggregate function
+    """
+    plans = []
+    config_dir = obj.cloud_storage_object.config_dir
+    for provision_file in sorted(glob.glob(os.path.join(config_dir, "prov*.json"))):
+        obj.set_provision(obj.cloud_storage_object.read_json_file_to_dict(provision_file))
+        obj.compile_plan()
+        plans.append((os.path.basename(provision_file), obj.plan))
+
+    label, plan = max(plans, key=lambda item: len(item[1].base_aggregates))
+    plans.append(
+        (
+            label + " (all functions)",
+            plan._replace(
+                base_aggregates=tuple(
+                    aggregate._replace(funcs=tuple(ALL_FUNCTIONS))
+                    for aggregate in plan.base_aggregates
+                )
+            ),
+        )
+    )
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=1000000, type=int)
+    parser.add_argument("--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    obj = StreamDash()
+    obj.read_metadata(read_provision=False)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = synthetic.write_structured_file(
+            os.path.join(tmp_dir, "input.gz"), args.rows
+        )
+        print("rows: {}".format(args.rows))
+        print(
+            "{:<40} {:>10} {:>12} {:>10} {:>8} {:>6}".format(
+                "provision", "aggregates", "per pair (s)", "engine (s)", "speedup", "same"
+            )
+        )
+        for label, plan in get_plans(obj):
+            if not plan.base_aggregates:
+                continue
+            obj.plan = plan
+            dataframe = obj.cloud_storage_object.read_data_file(
+                input_file,
+                *obj.get_read_args(),
+                field_dtypes=plan.get_field_dtypes(),
+                delimiter=plan.delimiter,
+            )
+            legacy_time, expected = get_best_time(
+                run_legacy, args.repeat, dataframe, plan.base_aggregates
+            )
+            engine_time, result = get_best_time(
+                run_engine, args.repeat, dataframe, plan.base_aggregates
+            )
+            print(
+                "{:<40} {:>10} {:>12.4f} {:>10.4f} {:>7.1f}x {:>6}".format(
+                    label,
+                    len(result),
+                    legacy_time,
+                    engine_time,
+                    legacy_time / engine_time,
+                    str(is_close(result, expected)),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+compares the pandas and arrow engines
+for STRUCTURED input on a multi million row file
+
+usage:
+    python -m benchmarks.bench_csv_engines --rows 2000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+
+def read(input_file, engine, chunksize=None):
+    """
+    returns (seconds, rows) to read the input with the engine
+    """
+    obj = StreamDash(chunksize=chunksize, engine=engine)
+    obj.read_metadata()
+
+    start = time.perf_counter()
+    obj.read_input_data(input_file)
+    if chunksize:
+        rows = sum(len(chunk) for chunk in obj.dataframe)
+    else:
+        rows = len(obj.dataframe)
+    return time.perf_counter() - start, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=2000000, type=int)
+    parser.add_argument("--chunksize", default=500000, type=int)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = synthetic.write_structured_file(
+            os.path.join(tmp_dir, "input.gz"), args.rows
+        )
+        print(
+            "rows: {}, compressed size: {:.1f} MB, cpus: {}".format(
+                args.rows, os.path.getsize(input_file) / 2**20, os.cpu_count()
+            )
+        )
+        print("{:<8} {:>10} {:>12} {:>12}".format("engine", "chunksize", "seconds", "rows/s"))
+        for engine in ("pandas", "arrow"):
+            for chunksize in (None, args.chunksize):
+                seconds, rows = read(input_file, engine, chunksize)
+                print(
+                    "{:<8} {:>10} {:>12.2f} {:>12.0f}".format(
+                        engine, chunksize or "-", seconds, rows / seconds
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+compares the dataframe memory and aggregation time
+with and without the field catalog dtypes
+
+usage:
+    python -m benchmarks.bench_dtypes --rows 1000000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+
+def run(input_file, field_dtypes):
+    """
+    returns (dataframe memory in MB, read seconds,
+    aggregate seconds, number of aggregated values)
+    """
+    obj = StreamDash()
+    obj.read_metadata()
+    # UA parsing is not affected by dtypes and dominates the runtime
+    obj.plan = obj.plan.drop_custom_functions("getuserAgent")
+
+    start = time.perf_counter()
+    obj.dataframe = obj.cloud_storage_object.read_data_file(
+        input_file,
+        *obj.get_read_args(),
+        field_dtypes=field_dtypes,
+    )
+    read_time = time.perf_counter() - start
+    memory = obj.dataframe.memory_usage(deep=True).sum() / 2**20
+
+    start = time.perf_counter()
+    result = obj.process_data()
+    return memory, read_time, time.perf_counter() - start, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=1000000, type=int)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = synthetic.write_structured_file(
+            os.path.join(tmp_dir, "input.gz"), args.rows
+        )
+        obj = StreamDash()
+        obj.read_metadata(read_provision=False)
+
+        print("rows: {}".format(args.rows))
+        # columns with "-" placeholders are skipped when the dtype is inferred
+        print(
+            "{:<10} {:>12} {:>10} {:>14} {:>8}".format(
+                "dtypes", "memory (MB)", "read (s)", "aggregate (s)", "values"
+            )
+        )
+        for label, field_dtypes in (
+            ("inferred", None),
+            ("catalog", obj.stream_metadata.get_stream_field_dtypes()),
+        ):
+            memory, read_time, agg_time, values = run(input_file, field_dtypes)
+            print(
+                "{:<10} {:>12.1f} {:>10.2f} {:>14.3f} {:>8}".format(
+                    label, memory, read_time, agg_time, values
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
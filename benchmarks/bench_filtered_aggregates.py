@@ -0,0 +1,146 @@
+"""
+compares the filtered aggregates on the masks of the predicates module
+with the DataFrame.query and own mask of each metric:
+    - originResponsetime and OffloadRate, as before and on shared masks
+    - n metrics filtered by predicates sharing cachestatus == 0
+
+usage:
+    python -m benchmarks.bench_filtered_aggregates --rows 1000000 --metrics 8
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from aggregation_code import custom_functions, predicates
+
+REPEAT = 5
+
+
+def get_dataframe(rows, seed=0) -> pd.DataFrame:
+    """
+    returns a chunk with the dtypes of the stream columns
+    """
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "cachestatus": pd.Categorical(rng.choice([0, 1], rows, p=[0.2, 0.8])),
+            "cacherefreshsrc": pd.Categorical(
+                rng.choice(["origin", "peer", "parent"], rows, p=[0.6, 0.2, 0.2])
+            ),
+            "statuscode": rng.choice(
+                [200, 206, 304, 404, 503], rows, p=[0.7, 0.1, 0.1, 0.07, 0.03]
+            ).astype("int16"),
+            "turnaroundtimemsec": rng.integers(0, 2000, rows).astype("int32"),
+            "bytes": rng.integers(0, 1 << 20, rows).astype("int64"),
+        }
+    )
+
+
+def get_seconds(function) -> float:
+    """
+    returns the best time of REPEAT runs of the function
+    """
+    best = np.inf
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def legacy_functions(dataframe) -> tuple:
+    """
+    originResponsetime and OffloadRate, each filtering on its own
+    """
+    origin = int(
+        dataframe.query("cachestatus == 0 and cacherefreshsrc == 'origin'")[
+            "turnaroundtimemsec"
+        ].sum()
+    )
+    cachestatus = dataframe["cachestatus"]
+    offload = (cachestatus == 1).sum() * 100.00 / cachestatus.count()
+    return origin, offload
+
+
+def shared_functions(dataframe) -> tuple:
+    """
+    originResponsetime and OffloadRate on the masks of the chunk
+    """
+    with predicates.shared_masks(dataframe):
+        return (
+            custom_functions.cal_origin_responsetime(dataframe),
+            custom_functions.cal_offload_rate(dataframe),
+        )
+
+
+def get_metric_predicates(metrics) -> list:
+    """
+    returns the predicates of metrics that share cachestatus == 0
+    """
+    extra = [
+        "cacherefreshsrc == 'origin'",
+        "cacherefreshsrc == 'peer'",
+        "statuscode >= 400",
+        "statuscode in [200, 206]",
+        "turnaroundtimemsec > 1000",
+        "bytes < 4096",
+    ]
+    return [
+        "cachestatus == 0 and " + extra[metric % len(extra)]
+        for metric in range(metrics)
+    ]
+
+
+def query_metrics(dataframe, texts) -> list:
+    """
+    sums of the metrics, DataFrame.query per metric
+    """
+    return [int(dataframe.query(text)["bytes"].sum()) for text in texts]
+
+
+def shared_metrics(dataframe, texts) -> list:
+    """
+    sums of the metrics on the shared masks
+    """
+    with predicates.shared_masks(dataframe):
+        return [
+            int(dataframe["bytes"][predicates.get_mask(text, dataframe)].sum())
+            for text in texts
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=1000000, type=int)
+    parser.add_argument("--metrics", default=8, type=int)
+    args = parser.parse_args()
+
+    dataframe = get_dataframe(args.rows)
+    texts = get_metric_predicates(args.metrics)
+    assert legacy_functions(dataframe) == shared_functions(dataframe)
+    assert query_metrics(dataframe, texts) == shared_metrics(dataframe, texts)
+
+    print("rows: {}, best of {}".format(args.rows, REPEAT))
+    row = "{:<40} {:>10.4f} {:>10.4f} {:>8.1f}x"
+    print("{:<40} {:>10} {:>10} {:>9}".format("", "before s", "shared s", "speedup"))
+    for name, before, shared in (
+        (
+            "originResponsetime + OffloadRate",
+            lambda: legacy_functions(dataframe),
+            lambda: shared_functions(dataframe),
+        ),
+        (
+            "{} metrics sharing cachestatus == 0".format(args.metrics),
+            lambda: query_metrics(dataframe, texts),
+            lambda: shared_metrics(dataframe, texts),
+        ),
+    ):
+        before_seconds, shared_seconds = get_seconds(before), get_seconds(shared)
+        print(row.format(name, before_seconds, shared_seconds, before_seconds / shared_seconds))
+
+
+if __name__ == "__main__":
+    main()
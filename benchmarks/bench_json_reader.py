@@ -0,0 +1,84 @@
+"""
+compares the projected JSON lines reader with pandas read_json
+on a wide JSON log
+
+usage:
+    python -m benchmarks.bench_json_reader --rows 200000 --extra-fields 60
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+
+from aggregation_code import utils
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+
+def read_with_pandas(input_file):
+    """
+    reads all the keys with pandas read_json and
+    lower cases the column names, as done before the projected reader
+    """
+    dataframe = pd.read_json(input_file, lines=True, compression="gzip", encoding="utf-8")
+    return dataframe.rename(columns=str.lower)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=200000, type=int)
+    parser.add_argument("--extra-fields", default=60, type=int)
+    args = parser.parse_args()
+
+    obj = StreamDash()
+    obj.read_metadata()
+    chosen_field_names = list(obj.plan.field_names)
+    usecols = obj.plan.get_column_names()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_file = synthetic.write_json_file(
+            os.path.join(tmp_dir, "input.json.gz"),
+            args.rows,
+            extra_fields=args.extra_fields,
+        )
+        print(
+            "rows: {}, keys per record: {}, json decoder: {}".format(
+                args.rows,
+                len(chosen_field_names) + args.extra_fields,
+                utils.json_loads.__module__,
+            )
+        )
+
+        start = time.perf_counter()
+        dataframe = read_with_pandas(input_file)
+        print(
+            "{:<12} {:>8.2f}s {:>8.1f} MB".format(
+                "read_json",
+                time.perf_counter() - start,
+                dataframe.memory_usage(deep=True).sum() / 2**20,
+            )
+        )
+        del dataframe
+
+        start = time.perf_counter()
+        dataframe = obj.cloud_storage_object.read_data_file(
+            input_file,
+            "JSON",
+            chosen_field_names,
+            usecols,
+            field_dtypes=obj.plan.get_field_dtypes(),
+        )
+        print(
+            "{:<12} {:>8.2f}s {:>8.1f} MB".format(
+                "json lines",
+                time.perf_counter() - start,
+                dataframe.memory_usage(deep=True).sum() / 2**20,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
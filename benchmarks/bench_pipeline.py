@@ -0,0 +1,93 @@
+"""
+compares the wall clock time of aggregating a single large input file
+read in chunks by one process with the pipelined mode, for a range of
+numbers of processes up to the number of cores
+
+usage:
+    python -m benchmarks.bench_pipeline --rows 5000000
+    python -m benchmarks.bench_pipeline --input /data/ds2-logs.gz
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from aggregation_code import accumulators, pipeline
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+
+def get_process_counts(cores) -> list:
+    """
+    returns 1, 2, 4, ... up to the number of cores
+    """
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def run_sequential(input_file, chunksize) -> tuple:
+    """
+    returns (seconds, request_count) of one process reading in chunks
+    """
+    start = time.perf_counter()
+    obj = StreamDash(chunksize=chunksize)
+    obj.read_metadata()
+    obj.read_input_data(input_file)
+    result = obj.process_data()
+    return time.perf_counter() - start, result.get("request_count")
+
+
+def run_pipeline(input_file, processes, block_size) -> tuple:
+    """
+    returns (seconds, request_count) of the pipelined mode
+    """
+    start = time.perf_counter()
+    obj = StreamDash()
+    obj.read_metadata()
+    pipeline.process_file(obj, input_file, processes, block_size)
+    result = accumulators.get_result(obj.accumulators)
+    return time.perf_counter() - start, result.get("request_count")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default=None, type=str)
+    parser.add_argument("--rows", default=2000000, type=int)
+    parser.add_argument("--chunksize", default=100000, type=int)
+    parser.add_argument("--block-size", default=16, type=float, help="MB")
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_file = args.input
+        if input_file is None:
+            input_file = os.path.join(temp_dir, "input.gz")
+            synthetic.write_structured_file(input_file, args.rows)
+
+        cores = os.cpu_count() or 1
+        print(
+            "input: {:.1f} MB, cores: {}".format(os.path.getsize(input_file) / 1e6, cores)
+        )
+        sequential, count = run_sequential(input_file, args.chunksize)
+        print("{:<22} {:>10} {:>9}".format("", "seconds", "speedup"))
+        print("{:<22} {:>10.2f} {:>8.2f}x".format("sequential, chunked", sequential, 1.0))
+        for processes in get_process_counts(cores):
+            seconds, pipeline_count = run_pipeline(
+                input_file, processes, int(args.block_size * (1 << 20))
+            )
+            assert pipeline_count == count
+            print(
+                "{:<22} {:>10.2f} {:>8.2f}x".format(
+                    "pipeline, {} processes".format(processes), seconds, sequential / seconds
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
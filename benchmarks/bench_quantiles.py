@@ -0,0 +1,94 @@
+"""
+compares the p50/p95/p99 of the quantile sketch, for a range of
+relative accuracies, with the exact numpy.percentile of all the values:
+relative error, memory (bins and bytes of the encoded state) and time,
+for latency like distributions
+
+usage:
+    python -m benchmarks.bench_quantiles --rows 1000000 --chunks 10
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from aggregation_code import quantile_sketch, state_codec
+
+QUANTILES = {"p50": 0.50, "p95": 0.95, "p99": 0.99}
+ACCURACIES = (0.05, 0.02, 0.01, 0.005, 0.001)
+
+
+def get_distributions(rows, seed=0) -> dict:
+    """
+    returns name => latencies in ms
+    """
+    rng = np.random.default_rng(seed)
+    return {
+        "uniform 0-2000": rng.integers(0, 2000, rows).astype("float64"),
+        "lognormal": np.round(rng.lognormal(4, 1, rows)),
+        "pareto tail": np.round(10 * (1 + rng.pareto(1.5, rows))),
+    }
+
+
+def cal_merged_sketch(values, chunks, relative_accuracy) -> dict:
+    """
+    returns the merge of the sketches of the chunks of the values,
+    as when a file is read in chunks
+    """
+    sketch = quantile_sketch.init_sketch(relative_accuracy)
+    for chunk in np.array_split(values, chunks):
+        quantile_sketch.merge_sketches(
+            sketch, quantile_sketch.cal_sketch(chunk, relative_accuracy)
+        )
+    return sketch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=1000000, type=int)
+    parser.add_argument("--chunks", default=10, type=int)
+    args = parser.parse_args()
+
+    print("rows: {}, chunks: {}".format(args.rows, args.chunks))
+    header = "{:<16} {:>9} {:>7} {:>10} {:>9} " + " ".join(["{:>9}"] * len(QUANTILES))
+    row = "{:<16} {:>9} {:>7} {:>10} {:>9.3f} " + " ".join(["{:>9.4%}"] * len(QUANTILES))
+    for name, values in get_distributions(args.rows).items():
+        print()
+        print(
+            header.format(
+                name, "accuracy", "bins", "bytes", "seconds", *["err " + q for q in QUANTILES]
+            )
+        )
+
+        start = time.perf_counter()
+        exact = np.percentile(values, [100 * q for q in QUANTILES.values()], method="lower")
+        exact_time = time.perf_counter() - start
+        print(
+            row.format(
+                "exact", "-", "-", len(state_codec.encode(values)), exact_time, *[0.0] * len(QUANTILES)
+            )
+        )
+
+        for accuracy in ACCURACIES:
+            start = time.perf_counter()
+            sketch = cal_merged_sketch(values, args.chunks, accuracy)
+            estimates = quantile_sketch.get_quantiles(sketch, list(QUANTILES.values()))
+            sketch_time = time.perf_counter() - start
+            print(
+                row.format(
+                    "sketch",
+                    accuracy,
+                    len(sketch["positive"]) + len(sketch["negative"]),
+                    len(state_codec.encode(sketch)),
+                    sketch_time,
+                    *[
+                        abs(estimate - value) / value if value else 0.0
+                        for estimate, value in zip(estimates, exact)
+                    ],
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+measures the time an invocation spends publishing the metrics of its
+results, as a share of the invocation time, for the CloudWatch and
+Azure Monitor sinks and a range of concurrencies. the APIs are
+emulated by a local HTTP stand-in, with a latency per request and
+a share of throttled (503) responses that are retried.
+an invocation aggregates --objects files, as an S3 event, the metrics
+of each object are submitted as soon as it is processed and flushed
+before the invocation returns
+
+usage:
+    python -m benchmarks.bench_sinks --objects 8 --rows 20000 --latency-ms 30
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from aggregation_code import accumulators, sinks
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    answers every POST after the latency of the server,
+    with a 503 for the share of throttled requests
+    """
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        reads the request and answers it
+        """
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            throttled = server.random.random() < server.error_rate
+        time.sleep(server.latency)
+        self.send_response(503 if throttled else 200)
+        # empty answer of the rpc-v2-cbor protocol of the cloudwatch client
+        self.send_header("smithy-protocol", "rpc-v2-cbor")
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_):  # pylint: disable=arguments-differ
+        pass
+
+
+def start_stand_in(latency, error_rate) -> ThreadingHTTPServer:
+    """
+    returns the stand-in server, serving in a thread on a free port
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.random = random.Random(0)
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def get_sink(name, endpoint) -> sinks.MetricSink:
+    """
+    returns the sink of the name sending its requests to the endpoint
+    """
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "stand-in")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "stand-in")
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    if name == "cloudwatch":
+        return sinks.CloudWatchSink(endpoint_url=endpoint)
+    return sinks.AzureMonitorSink(
+        "local", "/subscriptions/0/resourceGroups/ds2/providers/Microsoft.Web/sites/ds2",
+        token="stand-in", endpoint=endpoint,
+    )
+
+
+def run_invocation(obj, input_files, publisher) -> tuple:
+    """
+    returns (invocation seconds, seconds the invocation waited for
+    the publisher, flush stats) of aggregating the input files
+    """
+    start = time.perf_counter()
+    publishing = 0.0
+    for index, input_file in enumerate(input_files):
+        result = accumulators.get_result(obj.aggregate_input(input_file))
+        submit_start = time.perf_counter()
+        publisher.submit(result, dimensions=(("object", str(index)),))
+        publishing += time.perf_counter() - submit_start
+    flush_start = time.perf_counter()
+    stats = publisher.flush()
+    publishing += time.perf_counter() - flush_start
+    return time.perf_counter() - start, publishing, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", default=8, type=int)
+    parser.add_argument("--rows", default=20000, type=int)
+    parser.add_argument("--latency-ms", default=30, type=float)
+    parser.add_argument("--error-rate", default=0.05, type=float)
+    parser.add_argument("--concurrency", default="1,4,16", type=str)
+    args = parser.parse_args()
+    logging.disable(logging.CRITICAL)
+
+    server = start_stand_in(args.latency_ms / 1000, args.error_rate)
+    endpoint = "http://127.0.0.1:{}".format(server.server_address[1])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_files = [
+            synthetic.write_structured_file(
+                os.path.join(temp_dir, "input-{}.gz".format(index)), args.rows, seed=index
+            )
+            for index in range(args.objects)
+        ]
+        obj = StreamDash()
+        obj.read_metadata()
+        # warm up the reader and the custom functions
+        obj.aggregate_input(input_files[0])
+
+        print(
+            "{} objects of {} rows, latency {} ms, {:.0%} throttled".format(
+                args.objects, args.rows, args.latency_ms, args.error_rate
+            )
+        )
+        print(
+            "{:<12} {:>11} {:>8} {:>9} {:>8} {:>11} {:>10} {:>7}".format(
+                "sink", "concurrency", "metrics", "requests", "retries",
+                "invocation", "publish", "share",
+            )
+        )
+        for name in ("cloudwatch", "azuremonitor"):
+            for concurrency in (int(value) for value in args.concurrency.split(",")):
+                publisher = sinks.MetricPublisher(
+                    [get_sink(name, endpoint)], concurrency, backoff_base=0.01
+                )
+                requests = server.requests
+                seconds, publishing, stats = run_invocation(obj, input_files, publisher)
+                publisher.close()
+                sink_stats = stats[name]
+                assert not sink_stats["failed"], sink_stats
+                print(
+                    "{:<12} {:>11} {:>8} {:>9} {:>8} {:>10.2f}s {:>9.2f}s {:>6.1%}".format(
+                        name,
+                        concurrency,
+                        sink_stats["metrics"],
+                        server.requests - requests,
+                        sink_stats["retries"],
+                        seconds,
+                        publishing,
+                        publishing / seconds,
+                    )
+                )
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
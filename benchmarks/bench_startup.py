@@ -0,0 +1,129 @@
+"""
+measures the cold start of the aggregation entry point:
+import time per package (python -X importtime) and the latency
+from process start to the first result, and of a warm invocation
+
+usage:
+    python -m benchmarks.bench_startup --repeat 5
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+# modules that are loaded on first use only,
+# none of them should be imported at startup
+LAZY_MODULES = (
+    "httpagentparser",
+    "boto3",
+    "azure.storage.blob",
+    "aggregation_code.arrow_engine",
+    "aggregation_code.batch",
+    "aggregation_code.pipeline",
+    "aggregation_code.ledger",
+    "aggregation_code.rollups",
+    "aggregation_code.sinks",
+    "aggregation_code.parquet_output",
+)
+
+
+def get_import_times(module) -> tuple:
+    """
+    imports the module in a new interpreter with -X importtime,
+    returns ({package: self time in ms}, set of imported modules)
+    """
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    package_times = defaultdict(float)
+    imported = set()
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        imported.add(name)
+        package_times[name.split(".")[0]] += int(self_time) / 1000
+    return package_times, imported
+
+
+def run():
+    """
+    imports the entry point and runs two invocations in this process,
+    prints the timings in ms as JSON
+    """
+    start = time.perf_counter()
+    sys.argv = [sys.argv[0], "--loglevel", "error"]
+    # pylint: disable=import-outside-toplevel
+    import run_aggregations
+
+    imported = time.perf_counter()
+    run_aggregations.main(None, None)
+    first_result = time.perf_counter()
+    run_aggregations.main(None, None)
+    warm_result = time.perf_counter()
+    print(
+        json.dumps(
+            {
+                "import": (imported - start) * 1000,
+                "first result": (first_result - start) * 1000,
+                "warm invocation": (warm_result - first_result) * 1000,
+            }
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="run_aggregations")
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--top", default=10, type=int)
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run()
+        return
+
+    package_times, imported = get_import_times(args.module)
+    print("import time of {} by package (self, ms)".format(args.module))
+    for package, self_time in sorted(
+        package_times.items(), key=lambda item: item[1], reverse=True
+    )[: args.top]:
+        print("{:<28} {:>8.1f}".format(package, self_time))
+    print("{:<28} {:>8.1f}".format("total", sum(package_times.values())))
+    print(
+        "lazy modules imported at startup: {}".format(
+            [module for module in LAZY_MODULES if module in imported] or "none"
+        )
+    )
+
+    # one process per cold start
+    timings = defaultdict(list)
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--run"],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        timings["process exit"].append((time.perf_counter() - start) * 1000)
+        for name, value in json.loads(output.splitlines()[-1]).items():
+            timings[name].append(value)
+
+    print("cold start, median of {} runs (ms)".format(args.repeat))
+    for name in ("import", "first result", "warm invocation", "process exit"):
+        print("{:<28} {:>8.1f}".format(name, statistics.median(timings[name])))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+compares the peak RSS of reading a data file from S3
+into a BytesIO buffer and streaming it into the parser,
+using a local stand-in for the object store
+
+usage:
+    python -m benchmarks.bench_stream_input --rows 1500000
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BUCKET = "ds2-data"
+KEY = "input.gz"
+MODES = ("buffered", "streamed", "streamed-chunked")
+
+
+def get_max_rss():
+    """
+    returns the peak RSS of the process in MB;
+    VmHWM is used on linux as ru_maxrss is inherited across exec
+    """
+    try:
+        with open("/proc/self/status", encoding="UTF-8") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(root, mode, engine, chunksize):
+    """
+    reads the object in this process and prints
+    the peak RSS before and after the read
+    """
+    # pylint: disable=import-outside-toplevel
+    from aggregation_code.dashboard_class import StreamDash
+    from benchmarks.local_object_store import LocalS3Client
+    from cloud_services.aws.utils import AWSStorageContainer
+
+    obj = StreamDash(chunksize=chunksize if mode == "streamed-chunked" else None, engine=engine)
+    obj.read_metadata()
+    obj.plan = obj.plan.drop_custom_functions("getuserAgent")
+    obj.cloud_storage_object = AWSStorageContainer()
+    obj.cloud_storage_object.s3_client = LocalS3Client(root)
+    read_args = obj.get_read_args()
+    rss_before = get_max_rss()
+
+    start = time.perf_counter()
+    if mode == "buffered":
+        # as before: whole object in a BytesIO buffer
+        data = obj.cloud_storage_object.read_from_s3(BUCKET, KEY)
+        obj.dataframe = obj.cloud_storage_object.read_data_file(
+            data, *read_args, **obj.get_read_options()
+        )
+    else:
+        obj.dataframe = obj.cloud_storage_object.read_data_file_from_s3(
+            BUCKET, KEY, *read_args, **obj.get_read_options()
+        )
+    obj.process_data()
+    print(
+        "{:<18} {:<8} {:>12.1f} {:>12.1f} {:>10.2f}".format(
+            mode, engine, rss_before, get_max_rss(), time.perf_counter() - start
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=1500000, type=int)
+    parser.add_argument("--chunksize", default=100000, type=int)
+    parser.add_argument("--engine", default="pandas")
+    parser.add_argument("--run", nargs=2, metavar=("ROOT", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run[0], args.run[1], args.engine, args.chunksize)
+        return
+
+    # pylint: disable=import-outside-toplevel
+    from benchmarks import synthetic
+
+    with tempfile.TemporaryDirectory() as root:
+        os.makedirs(os.path.join(root, BUCKET))
+        input_file = synthetic.write_structured_file(
+            os.path.join(root, BUCKET, KEY), args.rows
+        )
+        print(
+            "rows: {}, compressed size: {:.1f} MB".format(
+                args.rows, os.path.getsize(input_file) / 2**20
+            )
+        )
+        print(
+            "{:<18} {:<8} {:>12} {:>12} {:>10}".format(
+                "mode", "engine", "rss pre (MB)", "peak (MB)", "seconds"
+            )
+        )
+        # one process per mode, for an independent peak RSS
+        for mode in MODES:
+            subprocess.run(
+                [
+                    sys.executable, "-m", "benchmarks.bench_stream_input",
+                    "--run", root, mode,
+                    "--engine", args.engine,
+                    "--chunksize", str(args.chunksize),
+                ],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
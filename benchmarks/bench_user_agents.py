@@ -0,0 +1,86 @@
+"""
+compares getuserAgent parsing every row with Series.apply, as before,
+with parse_user_agent over the distinct user agents of the column,
+with a cold and a warm (reused across invocations) parse cache
+
+usage:
+    python -m benchmarks.bench_user_agents --rows 1000000 --ua-cardinality 1000
+"""
+
+import argparse
+import json
+import time
+
+import pandas as pd
+
+from aggregation_code import custom_functions
+from benchmarks import synthetic
+
+
+def legacy_extract_from_ua(ua_string, to_extract):
+    """
+    extract_from_ua before the parse cache
+    """
+    # pylint: disable=import-outside-toplevel
+    import httpagentparser
+
+    client_info = httpagentparser.detect(ua_string)
+    if to_extract in client_info:
+        if client_info[to_extract]["name"] is not None:
+            return client_info[to_extract]["name"]
+    return str("invalid")
+
+
+def legacy_parse_user_agent(user_agent):
+    """
+    parse_user_agent before the parse cache,
+    three detect calls per row
+    """
+    client_info = {}
+    for to_extract in custom_functions.UA_INFO:
+        client_info[to_extract] = json.loads(
+            user_agent.apply(legacy_extract_from_ua, args=(to_extract,))
+            .value_counts()
+            .to_json()
+        )
+    return client_info
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default=1000000, type=int)
+    parser.add_argument("--ua-cardinality", default=1000, type=int)
+    parser.add_argument(
+        "--legacy-rows",
+        default=100000,
+        type=int,
+        help="rows parsed per row, the time is extrapolated to --rows",
+    )
+    args = parser.parse_args()
+
+    user_agent = pd.Series(
+        synthetic.generate_columns(
+            args.rows, ["ua"], ua_cardinality=args.ua_cardinality
+        )["ua"]
+    )
+    print(
+        "rows: {}, distinct user agents: {}".format(args.rows, user_agent.nunique())
+    )
+    print("{:<28} {:>10}".format("getuserAgent", "seconds"))
+
+    legacy_rows = min(args.legacy_rows, args.rows)
+    start = time.perf_counter()
+    legacy_parse_user_agent(user_agent.iloc[:legacy_rows])
+    legacy_time = (time.perf_counter() - start) * args.rows / legacy_rows
+    label = "per row" if legacy_rows == args.rows else "per row (extrapolated)"
+    print("{:<28} {:>10.2f}".format(label, legacy_time))
+
+    for label in ("distinct, cold cache", "distinct, warm cache"):
+        start = time.perf_counter()
+        custom_functions.parse_user_agent(user_agent)
+        print("{:<28} {:>10.3f}".format(label, time.perf_counter() - start))
+    print(custom_functions.detect_user_agent.cache_info())
+
+
+if __name__ == "__main__":
+    main()
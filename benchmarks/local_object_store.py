@@ -0,0 +1,85 @@
+"""
+local stand-in for the S3 client used by AWSStorageContainer,
+objects are files under a root directory: <root>/<bucket>/<key>
+"""
+
+import hashlib
+import io
+import os
+
+from botocore.exceptions import ClientError
+
+
+class LocalStreamingBody(io.RawIOBase):
+    """
+    non seekable body read from a local file,
+    similar to botocore's StreamingBody
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.file_reader = open(path, "rb")
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.file_reader.readinto(buffer)
+
+    def close(self):
+        self.file_reader.close()
+        super().close()
+
+
+class LocalS3Client:
+    """
+    implements get_object of the boto3 s3 client
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.get_count = 0
+
+    def get_path(self, bucket, key):
+        """
+        returns the local path of the object
+        """
+        return os.path.join(self.root, bucket, key)
+
+    def get_etag(self, path):
+        """
+        returns the ETag of the object, derived from size and mtime
+        """
+        stat = os.stat(path)
+        return '"{}"'.format(
+            hashlib.md5("{}-{}".format(stat.st_size, stat.st_mtime_ns).encode()).hexdigest()
+        )
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None, **_):
+        """
+        returns the response with the streaming body of the object,
+        raises 304 Not Modified when IfNoneMatch is the ETag
+        """
+        # pylint: disable=invalid-name
+        path = self.get_path(Bucket, Key)
+        self.get_count += 1
+        if IfNoneMatch is not None and IfNoneMatch == self.get_etag(path):
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"
+            )
+        return {
+            "Body": LocalStreamingBody(path),
+            "ContentLength": os.path.getsize(path),
+            "ETag": self.get_etag(path),
+        }
+
+    def put_object(self, Bucket, Key, Body):
+        """
+        writes the object
+        """
+        # pylint: disable=invalid-name
+        path = self.get_path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file_writer:
+            file_writer.write(Body)
+        return {"ETag": self.get_etag(path)}
@@ -0,0 +1,147 @@
+"""
+generates synthetic DS2 log files for the benchmarks
+the columns follow the field order in configs/stream.json
+"""
+
+import gzip
+import json
+
+import numpy as np
+
+from aggregation_code.dashboard_class import StreamDash
+
+BROWSERS = (
+    "Chrome/{}.0.{}.77%20Safari/537.36",
+    "Firefox/{}.0",
+    "Edg/{}.0.{}.57",
+    "Version/{}.1%20Safari/605.1.15",
+)
+
+PLATFORMS = (
+    "Windows%20NT%2010.0;%20Win64;%20x64",
+    "Macintosh;%20Intel%20Mac%20OS%20X%2010_15_7",
+    "X11;%20Linux%20x86_64",
+    "iPhone;%20CPU%20iPhone%20OS%2014_4%20like%20Mac%20OS%20X",
+    "Linux;%20Android%2011;%20SM-G991B",
+)
+
+
+def get_user_agents(cardinality, rng):
+    """
+    returns cardinality distinct user agent strings
+    """
+    user_agents = []
+    for i in range(cardinality):
+        platform = PLATFORMS[i % len(PLATFORMS)]
+        browser = BROWSERS[(i // len(PLATFORMS)) % len(BROWSERS)]
+        version = 60 + (i // (len(PLATFORMS) * len(BROWSERS)))
+        user_agents.append(
+            "Mozilla/5.0%20({})%20AppleWebKit/537.36%20(KHTML%20like%20Gecko)%20{}".format(
+                platform, browser.format(version, rng.integers(1000, 5000))
+            )
+        )
+    return np.array(user_agents)
+
+
+def with_placeholders(values, rng, ratio):
+    """
+    replaces ratio of the values with the DS2 placeholder "-"
+    """
+    values = values.astype(str)
+    values[rng.random(len(values)) < ratio] = "-"
+    return values
+
+
+def generate_columns(rows, field_names, seed=0, ua_cardinality=300, start_time=1606768500):
+    """
+    returns dict of field name => numpy array of string values
+    """
+    # pylint: disable=too-many-locals
+    rng = np.random.default_rng(seed)
+    zipf = np.minimum(rng.zipf(1.3, rows), 100000)
+    columns = {
+        "version": np.full(rows, "1"),
+        "cp": rng.choice(["80765", "80766", "91234", "123456"], rows, p=[0.6, 0.2, 0.15, 0.05]),
+        "reqid": np.char.add("3d6ab88.", np.arange(rows).astype(str)),
+        "reqtimesec": (start_time + np.sort(rng.integers(0, 3600, rows))).astype(str),
+        "bytes": rng.integers(0, 2_000_000, rows).astype(str),
+        "totalbytes": rng.integers(200, 2_000_500, rows).astype(str),
+        "cliip": np.char.add("10.0.", (zipf % 65536).astype(str)),
+        "statuscode": rng.choice(
+            ["200", "206", "304", "404", "403", "500", "503"],
+            rows,
+            p=[0.8, 0.05, 0.07, 0.04, 0.01, 0.02, 0.01],
+        ),
+        "proto": rng.choice(["HTTPS", "HTTP"], rows, p=[0.9, 0.1]),
+        "reqhost": rng.choice(
+            ["www.example.com", "img.example.com", "api.example.com", "cdn.example.net"], rows
+        ),
+        "reqmethod": rng.choice(["GET", "POST", "HEAD"], rows, p=[0.9, 0.08, 0.02]),
+        "reqpath": np.char.add("assets/", (zipf % 20000).astype(str)),
+        "reqport": np.full(rows, "443"),
+        "rspcontentlen": rng.integers(0, 2_000_000, rows).astype(str),
+        "rspcontentdtype": rng.choice(["text/html", "image/jpeg", "application/json"], rows),
+        "ua": get_user_agents(ua_cardinality, rng)[
+            np.minimum(rng.zipf(1.5, rows), ua_cardinality) - 1
+        ],
+        "tlsoverheadtimemsec": with_placeholders(rng.integers(0, 300, rows), rng, 0.3),
+        "tlsversion": rng.choice(["TLSv1.2", "TLSv1.3"], rows),
+        "objsize": rng.integers(0, 2_000_000, rows).astype(str),
+        "uncompressedsize": with_placeholders(rng.integers(0, 4_000_000, rows), rng, 0.5),
+        "overheadbytes": rng.integers(100, 2000, rows).astype(str),
+        "totalbillablebytes": rng.integers(200, 2_000_500, rows).astype(str),
+        "turnaroundtimemsec": rng.integers(0, 2000, rows).astype(str),
+        "transfertimemsec": rng.integers(0, 5000, rows).astype(str),
+        "dnslookuptimemsec": with_placeholders(rng.integers(0, 100, rows), rng, 0.9),
+        "reqendtimemsec": rng.integers(0, 50, rows).astype(str),
+        "maxagesec": rng.integers(0, 86400, rows).astype(str),
+        "cachestatus": rng.choice(["0", "1"], rows, p=[0.2, 0.8]),
+        "cacherefreshsrc": rng.choice(["origin", "peer", "-"], rows, p=[0.15, 0.05, 0.8]),
+    }
+    return {
+        name: columns.get(name, np.full(rows, "-")) for name in field_names
+    }
+
+
+def get_stream_field_names():
+    """
+    returns the stream field names from the local configs
+    """
+    obj = StreamDash()
+    obj.read_metadata(read_provision=False)
+    return obj.stream_metadata.get_stream_field_names()
+
+
+def write_structured_file(path, rows, seed=0, ua_cardinality=300):
+    """
+    writes a gzip compressed STRUCTURED (space delimited) log file
+    """
+    field_names = get_stream_field_names()
+    columns = generate_columns(rows, field_names, seed, ua_cardinality)
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as file_writer:
+        for row in zip(*columns.values()):
+            file_writer.write(" ".join(row) + "\n")
+    return path
+
+
+def write_json_file(path, rows, seed=0, ua_cardinality=300, extra_fields=0):
+    """
+    writes a gzip compressed JSON lines log file,
+    keys are the camel case names in all_datastream_fields.
+    extra_fields adds that many unused keys to each record
+    """
+    obj = StreamDash()
+    obj.read_metadata(read_provision=False)
+    field_names = obj.stream_metadata.get_stream_field_names()
+    key_names = {
+        field["name"].lower(): field["name"]
+        for field in obj.cloud_storage_object.read_all_datastream_fields_metadata().values()
+    }
+    columns = generate_columns(rows, field_names, seed, ua_cardinality)
+    keys = [key_names.get(name, name) for name in field_names]
+    keys += ["extraField{}".format(i) for i in range(extra_fields)]
+    padding = ["-"] * extra_fields
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=1) as file_writer:
+        for row in zip(*columns.values()):
+            file_writer.write(json.dumps(dict(zip(keys, list(row) + padding))) + "\n")
+    return path
@@ -5,6 +5,8 @@ import io
 import logging
 
 import boto3
+from botocore.exceptions import ClientError
+from aggregation_code.metadata_cache import MetadataNotFoundError
 from aggregation_code.utils import BaseUtils
 from cloud_services.aws import connection_details
 
@@ -73,53 +75,111 @@ class AWSStorageContainer(BaseUtils):
             logger.error("%s: %s", type(err), err)
         return response
 
-    def read_json_metadata_from_s3(self, json_file) -> dict:
+    def open_s3_stream(self, bucket, file_to_read):
         """
-        reads buffer from blob storage
-        and return dict object
+        returns the streaming body of the object,
+        the object is downloaded as the body is read
+        instead of buffering it in memory
         """
-        try:
 
-            if self.metadata_path is not None:
-                json_file_path = self.metadata_path + "/" + json_file
+        if self.s3_client is None:
+            self.set_s3_client()
 
-            json_buffer = self.read_from_s3(self.metadata_bucket, json_file_path)
-            return self.get_dict_from_json(json_buffer)
+        try:
+            logger.debug("streaming file: %s from bucket: %s", file_to_read, bucket)
+            response = self.s3_client.get_object(Bucket=bucket, Key=file_to_read)
+            return response["Body"]
         except Exception as err:
             logger.error("%s: %s", type(err), err)
-        return {}
+            raise
 
-    def read_all_datastream_fields_metadata(self):
-        # TODO: add info
-        return self.read_json_metadata_from_s3(
-            self.input_configs["all_datastream_fields"]
-        )
+    def read_from_s3_if_modified(self, bucket, file_to_read, etag=None):
+        """
+        returns (io buffer, etag) of the object,
+        io buffer is None when the object has the same etag,
+        MetadataNotFoundError when it does not exist
+        """
 
-    def read_all_custom_functions_metadata(self):
-        """"""
-        return self.read_json_metadata_from_s3(
-            self.input_configs["all_custom_functions"]
-        )
+        if self.s3_client is None:
+            self.set_s3_client()
 
-    def read_stream_metadata(self):
-        # TODO: add info
-        return self.read_json_metadata_from_s3(self.input_configs["stream_file"])
+        logger.debug("reading file: %s from bucket: %s", file_to_read, bucket)
+        get_object_args = {"Bucket": bucket, "Key": file_to_read}
+        if etag is not None:
+            get_object_args["IfNoneMatch"] = etag
+        try:
+            response = self.s3_client.get_object(**get_object_args)
+        except ClientError as err:
+            code = err.response.get("Error", {}).get("Code")
+            if code in ("304", "NotModified"):
+                return None, etag
+            if code in ("404", "NoSuchKey"):
+                raise MetadataNotFoundError(
+                    "s3://{}/{}".format(bucket, file_to_read)
+                ) from err
+            raise
+        return self.get_bytes_io_buffer(response["Body"]), response.get("ETag")
+
+    def write_output_file(self, location, key, data) -> str:
+        """
+        writes the binary output file to key in the bucket location,
+        returns its url
+        """
+        self.s3_client.put_object(Bucket=location, Key=key, Body=data)
+        return "s3://{}/{}".format(location, key)
+
+    def get_metadata_path(self, json_file) -> str:
+        """
+        returns the key of the metadata file in the metadata bucket
+        """
+        if self.metadata_path is not None:
+            return self.metadata_path + "/" + json_file
+        return json_file
+
+    def get_metadata_cache_key(self, file_name) -> str:
+        """
+        returns the key of the metadata file in the metadata cache
+        """
+        return "s3://{}/{}".format(self.metadata_bucket, self.get_metadata_path(file_name))
 
-    def read_provision_metadata(self):
+    def fetch_metadata(self, file_name, etag=None):
         """
-        reads the provision_file from blob and returns the data buffer
+        returns (dict, etag) of the metadata file,
+        dict is None when the file is not modified since etag
         """
+        json_buffer, etag = self.read_from_s3_if_modified(
+            self.metadata_bucket, self.get_metadata_path(file_name), etag
+        )
+        if json_buffer is None:
+            return None, etag
+        return self.get_dict_from_json(json_buffer), etag
 
-        return self.read_json_metadata_from_s3(self.input_configs["provision_file"])
+    def read_json_metadata_from_s3(self, json_file) -> dict:
+        """
+        reads buffer from blob storage
+        and return dict object
+        """
+        return self.read_metadata_file(json_file)
 
     def read_data_file_from_s3(
-        self, bucket, filename, file_format, chosen_field_names, custom_columns
+        self,
+        bucket,
+        filename,
+        file_format,
+        chosen_field_names,
+        custom_columns,
+        **read_options,
     ):
         """
-        read input data file and returns a dataframe
+        read input data file and returns a dataframe,
+        the object is decompressed and parsed as it is downloaded
         """
 
-        data_buffer = self.read_from_s3(bucket, filename)
+        data_stream = self.open_s3_stream(bucket, filename)
         return self.read_data_file(
-            data_buffer, file_format, chosen_field_names, custom_columns
+            data_stream,
+            file_format,
+            chosen_field_names,
+            custom_columns,
+            **read_options,
         )
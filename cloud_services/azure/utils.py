@@ -6,10 +6,13 @@
 import logging
 import json
 from typing import Container
-import io 
+import io
+from aggregation_code.metadata_cache import MetadataNotFoundError
 from aggregation_code.utils import BaseUtils
 from cloud_services.azure import connection_details
 
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceNotFoundError, ResourceNotModifiedError
 from azure.storage.blob import ContainerClient
 
 logger = logging.getLogger(__name__)
@@ -56,6 +59,27 @@ def read_from_blob(container_client, file_name):
     return None
 
 
+def read_from_blob_if_modified(container_client, file_name, etag=None):
+    """
+    reads the file_name from blob and returns (content, etag),
+    content is None when the blob has the same etag,
+    MetadataNotFoundError when it does not exist
+    """
+    blob_client = container_client.get_blob_client(file_name)
+    try:
+        if etag is None:
+            downloader = blob_client.download_blob()
+        else:
+            downloader = blob_client.download_blob(
+                etag=etag, match_condition=MatchConditions.IfModified
+            )
+    except ResourceNotModifiedError:
+        return None, etag
+    except ResourceNotFoundError as err:
+        raise MetadataNotFoundError(file_name) from err
+    return downloader.readall(), downloader.properties.etag
+
+
 def upload_file(container_client, filename, data):
     """
     upload file to blob
@@ -86,6 +110,29 @@ class AzureStorageContainer(BaseUtils):
             connection_details.load_metadata_config
         )
         self.container_client_for_data = None
+        # container name => client of the output files
+        self.container_clients_for_output = {}
+
+    def get_container_client_for_output(self, location):
+        """
+        returns the client of the output container location,
+        created once per container
+        """
+        if location not in self.container_clients_for_output:
+            connect_info = connection_details.load_metadata_config()
+            self.container_clients_for_output[location] = ContainerClient.from_connection_string(
+                connect_info["azure_storage_connectionstring"], location
+            )
+        return self.container_clients_for_output[location]
+
+    def write_output_file(self, location, key, data) -> str:
+        """
+        writes the binary output file to the blob key of the
+        container location of the storage account, returns its url
+        """
+        container_client = self.get_container_client_for_output(location)
+        container_client.upload_blob(key, data, overwrite=True)
+        return "azure://{}/{}".format(location, key)
 
     def read_json_metadata_from_blob(self, container_client, json_file):
         """
@@ -101,45 +148,44 @@ class AzureStorageContainer(BaseUtils):
             logger.error("%s: %s", type(err), err)
         return {}
 
-    def read_all_datastream_fields_metadata(self):
-        """"""
-        # TODO: add info
-        return self.read_json_metadata_from_blob(
-            self.container_client_for_metadata,
-            self.input_configs["all_datastream_fields"],
-        )
-
-    def read_all_custom_functions_metadata(self):
-        """"""
-        return self.read_json_metadata_from_blob(
-            self.container_client_for_metadata,
-            self.input_configs["all_custom_functions"],
-        )
-
-    def read_stream_metadata(self):
-        """"""
-        # TODO: add info
-        return self.read_json_metadata_from_blob(
-            self.container_client_for_metadata, self.input_configs["stream_file"]
-        )
+    def get_metadata_cache_key(self, file_name) -> str:
+        """
+        returns the key of the metadata file in the metadata cache
+        """
+        container_name = getattr(self.container_client_for_metadata, "container_name", None)
+        return "azure://{}/{}".format(container_name, file_name)
 
-    def read_provision_metadata(self):
-        """"""
-        # TODO: add info
-        return self.read_json_metadata_from_blob(
-            self.container_client_for_metadata, self.input_configs["provision_file"]
+    def fetch_metadata(self, file_name, etag=None):
+        """
+        returns (dict, etag) of the metadata file,
+        dict is None when the file is not modified since etag
+        """
+        json_content, etag = read_from_blob_if_modified(
+            self.container_client_for_metadata, file_name, etag
         )
+        if json_content is None:
+            return None, etag
+        return json.loads(json_content), etag
 
     def read_data_file_from_azure_blob(
-        self, filename, file_format, chosen_field_names, custom_columns
+        self,
+        filename,
+        file_format,
+        chosen_field_names,
+        custom_columns,
+        **read_options,
     ):
         """
         reads data file from azure blob store
-        and returns dataframe
+        and returns dataframe.
+        filename is the blob input stream, it is passed
+        to the reader as is to avoid another copy of the blob
         """
 
-        data_buffer = io.BytesIO(filename.read())
-        
         return self.read_data_file(
-            data_buffer, file_format, chosen_field_names, custom_columns
+            filename,
+            file_format,
+            chosen_field_names,
+            custom_columns,
+            **read_options,
         )
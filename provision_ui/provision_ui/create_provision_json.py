@@ -115,3 +115,12 @@ def write_provision_to_file(streamDashObj, fields, custom_fields):
         )
     except Exception as e:
         print("Couldnt upload prov_site.json file", e)
+        return
+
+    # compile the aggregation plan of the provision,
+    # so that the runtime loads it instead of deriving it
+    try:
+        streamDashObj.set_provision(d)
+        streamDashObj.write_plan()
+    except Exception as e:
+        print("Couldnt upload aggregation plan file", e)
@@ -4,13 +4,28 @@ Main Module
 # TODO: add more info
 
 import argparse
+import base64
+import functools
+import importlib
 import textwrap
 import logging
 import time
 import json
 import os
+from urllib.parse import unquote_plus
 
+from aggregation_code import accumulators, hyperloglog, plan_class, quantile_sketch
 from aggregation_code.dashboard_class import StreamDash
+from aggregation_code.metadata_cache import DEFAULT_TTL, METADATA_CACHE
+
+
+def import_module(name):
+    """
+    returns the module of aggregation_code, imported on first use,
+    so that the modules of the modes and options that an invocation
+    does not use are not loaded
+    """
+    return importlib.import_module("aggregation_code." + name)
 
 
 def parse_inputs() -> dict:
@@ -42,6 +57,255 @@ def parse_inputs() -> dict:
         ),
     )
 
+    parser.add_argument(
+        "--chunksize",
+        default=int(os.environ.get("DS2_CHUNKSIZE", 0)),
+        type=int,
+        help=textwrap.dedent(
+            """\
+            number of rows to read and aggregate at a time,
+            0 reads the whole input file at once.
+            (env: DS2_CHUNKSIZE, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--engine",
+        default=os.environ.get("DS2_ENGINE", "pandas"),
+        type=str,
+        choices=["pandas", "arrow"],
+        help=textwrap.dedent(
+            """\
+            parser for STRUCTURED input files,
+            arrow falls back to pandas if pyarrow is not installed.
+            (env: DS2_ENGINE, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--max-workers",
+        default=int(os.environ.get("DS2_MAX_WORKERS", 4)),
+        type=int,
+        help=textwrap.dedent(
+            """\
+            number of objects of an S3 event downloaded and
+            aggregated at a time.
+            (env: DS2_MAX_WORKERS, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--merge-results",
+        default=os.environ.get("DS2_MERGE_RESULTS", "0") == "1",
+        action="store_true",
+        help=textwrap.dedent(
+            """\
+            also return the merged result of all the objects of an S3 event.
+            (env: DS2_MERGE_RESULTS=1, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--emit-state",
+        default=os.environ.get("DS2_EMIT_STATE", "0") == "1",
+        action="store_true",
+        help=textwrap.dedent(
+            """\
+            also return the binary partial aggregate state, base64 encoded,
+            that can be merged with the states of other inputs later.
+            (env: DS2_EMIT_STATE=1, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--metadata-ttl",
+        default=float(os.environ.get("DS2_METADATA_TTL", DEFAULT_TTL)),
+        type=float,
+        help=textwrap.dedent(
+            """\
+            seconds the metadata files are reused by warm invocations
+            before they are revalidated with their ETag, 0 revalidates
+            on every invocation.
+            (env: DS2_METADATA_TTL, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--sketch-accuracy",
+        default=float(
+            os.environ.get(
+                "DS2_SKETCH_ACCURACY", quantile_sketch.DEFAULT_RELATIVE_ACCURACY
+            )
+        ),
+        type=float,
+        help=textwrap.dedent(
+            """\
+            relative error of the p50, p95 and p99 aggregates,
+            states of different accuracies can not be merged.
+            (env: DS2_SKETCH_ACCURACY, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--hll-precision",
+        default=int(os.environ.get("DS2_HLL_PRECISION", hyperloglog.DEFAULT_PRECISION)),
+        type=int,
+        choices=range(hyperloglog.MIN_PRECISION, hyperloglog.MAX_PRECISION + 1),
+        metavar="{{{}-{}}}".format(hyperloglog.MIN_PRECISION, hyperloglog.MAX_PRECISION),
+        help=textwrap.dedent(
+            """\
+            precision of the distinct aggregates, 2^precision registers
+            of one byte each, with a standard error of 1.04/sqrt(2^precision).
+            states of different precisions can not be merged.
+            (env: DS2_HLL_PRECISION, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--input",
+        default=os.environ.get("DS2_INPUT"),
+        type=str,
+        help=textwrap.dedent(
+            """\
+            input of the local run. batch mode: directory, glob
+            pattern or path prefix of the input files to aggregate
+            into one merged result; the file of the pipelined mode.
+            (env: DS2_INPUT, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--processes",
+        default=int(os.environ.get("DS2_PROCESSES", 0)),
+        type=int,
+        help=textwrap.dedent(
+            """\
+            number of processes aggregating the files of the
+            batch mode, 0 is the number of cores.
+            (env: DS2_PROCESSES, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--pipeline",
+        default=os.environ.get("DS2_PIPELINE", "0") == "1",
+        action="store_true",
+        help=textwrap.dedent(
+            """\
+            pipelined mode for a single large input file, when run locally:
+            a thread decompresses the --input file into blocks of lines
+            aggregated by --processes processes.
+            (env: DS2_PIPELINE=1, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--block-size",
+        default=os.environ.get("DS2_BLOCK_SIZE"),
+        type=float,
+        help=textwrap.dedent(
+            """\
+            MB of decompressed input per block of the pipelined mode.
+            (env: DS2_BLOCK_SIZE, default: 16)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--ledger",
+        default=os.environ.get("DS2_LEDGER", ""),
+        type=str,
+        help=textwrap.dedent(
+            """\
+            ledger of the processed objects, a duplicate delivery of an
+            object returns the recorded result without reading it:
+            sqlite:///tmp/ds2-ledger.db, dynamodb://<table> or
+            table://<azure table>, empty to disable.
+            (env: DS2_LEDGER, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--rollup-store",
+        default=os.environ.get("DS2_ROLLUP_STORE", ""),
+        type=str,
+        help=textwrap.dedent(
+            """\
+            rollup store of the per minute partial aggregates of the
+            processed objects, compacted into 5m, 1h and 1d tiers:
+            sqlite:///tmp/ds2-rollups.db, empty to disable.
+            (env: DS2_ROLLUP_STORE, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--rollup-retention",
+        default=os.environ.get("DS2_ROLLUP_RETENTION", ""),
+        type=str,
+        help=textwrap.dedent(
+            """\
+            retention of the tiers of the rollup store, say 1m=1d,1d=400d,
+            tiers not set keep 1m=2d,5m=14d,1h=90d,1d=800d.
+            (env: DS2_ROLLUP_RETENTION, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--sinks",
+        default=os.environ.get("DS2_SINKS", ""),
+        type=str,
+        help=textwrap.dedent(
+            """\
+            comma separated sinks the metrics of the results are published
+            to: cloudwatch://<namespace>, emf://<namespace>,
+            azuremonitor://<region>/<resource id>, file:///path/metrics.jsonl,
+            empty to disable.
+            (env: DS2_SINKS, default: %(default)s)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--sink-concurrency",
+        default=os.environ.get("DS2_SINK_CONCURRENCY"),
+        type=int,
+        help=textwrap.dedent(
+            """\
+            number of batches of metrics sent to the sinks at a time.
+            (env: DS2_SINK_CONCURRENCY, default: 4)
+            \n"""
+        ),
+    )
+
+    parser.add_argument(
+        "--output",
+        default=os.environ.get("DS2_OUTPUT", ""),
+        type=str,
+        help=textwrap.dedent(
+            """\
+            Parquet output of the per bucket results of the processed objects,
+            partitioned by stream id, date and hour: s3://<bucket>/<prefix>,
+            azure://<container>/<prefix> or a local directory, empty to disable.
+            needs pyarrow.
+            (env: DS2_OUTPUT, default: %(default)s)
+            \n"""
+        ),
+    )
+
     args, _ = parser.parse_known_args()
     return vars(args)
 
@@ -73,9 +337,116 @@ def init_logging(log_level):
     return logger
 
 
-def main(aws_event, azure_blob, cloud=None):
+@functools.lru_cache(maxsize=None)
+def get_ledger(url):
     """
-    main function
+    returns the ledger of the url, None when disabled,
+    opened once per process
+    """
+    if not url:
+        return None
+    return import_module("ledger").open_ledger(url)
+
+
+@functools.lru_cache(maxsize=None)
+def get_rollup_store(url, retention):
+    """
+    returns the rollup store of the url, None when disabled,
+    opened once per process
+    """
+    if not url:
+        return None
+    return import_module("rollups").open_rollup_store(url, retention)
+
+
+def upsert_rollups(rollup_store, plan, object_accumulators):
+    """
+    upserts the buckets of the accumulators of a processed
+    object into the rollup store
+    """
+    if rollup_store is None:
+        return
+    logger = logging.getLogger()
+    try:
+        rollup_store.upsert(plan, accumulators.get_rollup_states(object_accumulators))
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("%s: %s", type(err), err)
+
+
+def update_rollups(rollup_store, plan, accumulators_list):
+    """
+    upserts the buckets of the accumulators of each processed object
+    into the rollup store, then compacts and expires the tiers
+    """
+    if rollup_store is None:
+        return
+    logger = logging.getLogger()
+    try:
+        for object_accumulators in accumulators_list:
+            rollup_store.upsert(plan, accumulators.get_rollup_states(object_accumulators))
+        rollup_store.compact()
+        rollup_store.expire()
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("%s: %s", type(err), err)
+
+
+@functools.lru_cache(maxsize=None)
+def get_publisher(urls, max_concurrency):
+    """
+    returns the metric publisher of the sinks, None when disabled,
+    opened once per process
+    """
+    if not urls:
+        return None
+    sinks = import_module("sinks")
+    return sinks.open_publisher(urls, max_concurrency or sinks.DEFAULT_MAX_CONCURRENCY)
+
+
+def submit_metrics(obj, params, result):
+    """
+    starts publishing the metrics of the result to the sinks,
+    with the dimension stream
+    """
+    publisher = get_publisher(params["sinks"], params["sink_concurrency"])
+    if publisher is None:
+        return
+    stream_id = obj.get_stream_id()
+    publisher.submit(result, dimensions=(("stream", stream_id),) if stream_id else ())
+
+
+def flush_metrics(params):
+    """
+    waits until the metrics submitted are published
+    """
+    publisher = get_publisher(params["sinks"], params["sink_concurrency"])
+    if publisher is None:
+        return
+    logger = logging.getLogger()
+    logger.info("published metrics: %s", publisher.flush())
+
+
+def write_output(obj, params, output_accumulators):
+    """
+    writes the per bucket results of the accumulators of the
+    processed objects as Parquet files, one per partition
+    """
+    if not params["output"] or not output_accumulators:
+        return
+    logger = logging.getLogger()
+    try:
+        writer = import_module("parquet_output").open_output_writer(params["output"], obj)
+        writer.add(obj.get_stream_id(), output_accumulators)
+        logger.info("output files: %s", writer.flush())
+    except Exception as err:  # pylint: disable=broad-except
+        logger.error("%s: %s", type(err), err)
+
+
+@functools.lru_cache(maxsize=None)
+def setup() -> tuple:
+    """
+    parses the inputs and creates the logger,
+    once per process, so warm invocations reuse them.
+    returns (params, logger)
     """
     params = parse_inputs()
 
@@ -85,28 +456,65 @@ def main(aws_event, azure_blob, cloud=None):
     logger = init_logging(params["loglevel"])
     logger.debug("logging level set to %s mode", params["loglevel"])
 
+    METADATA_CACHE.ttl = params["metadata_ttl"]
+    quantile_sketch.RELATIVE_ACCURACY = params["sketch_accuracy"]
+    hyperloglog.PRECISION = params["hll_precision"]
+    return params, logger
+
+
+def main(aws_event, azure_blob, cloud=None):
+    """
+    main function
+    """
+    params, logger = setup()
+
     # init
-    obj = StreamDash(cloud_provider=cloud)
+    obj = StreamDash(
+        cloud_provider=cloud, chunksize=params["chunksize"], engine=params["engine"]
+    )
 
     # parse config files
     logger.debug("read metadata files...")
     obj.read_metadata()
+    logger.debug("metadata cache: %s", METADATA_CACHE.get_stats())
+    # the rollups are the per minute buckets of the store and of the output
+    rollup_store = get_rollup_store(params["rollup_store"], params["rollup_retention"])
+    if rollup_store is not None or params["output"]:
+        obj.plan = plan_class.with_rollups(obj.plan)
 
     # set input data
     input_file = None
     input_bucket = None
 
+    if cloud is None and params["pipeline"]:
+        return process_pipeline(obj, params)
+
+    if cloud is None and params["input"]:
+        return process_batch(obj, params)
+
     if cloud is None:
         # temporarily setting the input file
         input_file = os.getcwd() + "/sample-input/test-data-custom.gz"
 
     if cloud == "aws":
-        input_bucket = aws_event["Records"][0]["s3"]["bucket"]["name"]
-        input_file = aws_event["Records"][0]["s3"]["object"]["key"]
+        return process_s3_event(obj, aws_event, params)
 
     if cloud == "azure":
         input_file = azure_blob
 
+    # duplicate deliveries return the recorded result
+    processing_ledger = get_ledger(params["ledger"])
+    if processing_ledger is not None:
+        object_id, version = get_object_version(input_file, cloud)
+        recorded = processing_ledger.lookup(
+            object_id, version, obj.plan.get_digest(), need_state=params["emit_state"]
+        )
+        if recorded is not None:
+            obj.result, state = recorded
+            if params["emit_state"]:
+                obj.result["state"] = encode_state(state)
+            return obj.result
+
     # parse input data
     logger.debug("read input files...")
     obj.read_input_data(input_file=input_file, bucket_name=input_bucket)
@@ -114,11 +522,263 @@ def main(aws_event, azure_blob, cloud=None):
     # process input data
     logger.debug("process input files...")
     obj.process_data()
+    if processing_ledger is not None:
+        processing_ledger.record(
+            object_id, version, obj.plan.get_digest(), obj.result, obj.get_state()
+        )
+    update_rollups(rollup_store, obj.plan, [obj.accumulators])
+    write_output(obj, params, obj.accumulators)
+    submit_metrics(obj, params, obj.result)
+    flush_metrics(params)
+    if params["emit_state"]:
+        obj.result["state"] = encode_state(obj.get_state())
 
     # publish results
     return obj.result
 
 
+def encode_state(state) -> str:
+    """
+    returns the binary state as text for the JSON result
+    """
+    return base64.b64encode(state).decode("ascii")
+
+
+def process_batch(obj, params) -> dict:
+    """
+    aggregates the local input files of the batch mode
+    in a pool of processes, returns the merged result
+    """
+    logger = logging.getLogger()
+    batch = import_module("batch")
+    input_files = batch.get_input_files(params["input"])
+    if not input_files:
+        raise FileNotFoundError("no input files for {}".format(params["input"]))
+
+    rollup_store = get_rollup_store(params["rollup_store"], params["rollup_retention"])
+    processed = [] if params["output"] else None
+    output = batch.process_files(
+        obj,
+        input_files,
+        params["processes"],
+        get_ledger(params["ledger"]),
+        rollup_store,
+        processed,
+    )
+    update_rollups(rollup_store, obj.plan, [])
+    # files recorded in the ledger were written when processed
+    if processed:
+        write_output(obj, params, accumulators.merge_states(obj.plan, processed))
+    submit_metrics(obj, params, output["merged"])
+    flush_metrics(params)
+    if params["emit_state"]:
+        output["merged_state"] = encode_state(obj.get_state())
+    if output["failed"]:
+        logger.error("processing failed for files: %s", output["failed"])
+
+    obj.result = output
+    return output
+
+
+def process_pipeline(obj, params) -> dict:
+    """
+    aggregates the local input file in the pipelined mode
+    """
+    input_file = params["input"] or os.getcwd() + "/sample-input/test-data-custom.gz"
+    if not os.path.isfile(input_file):
+        raise FileNotFoundError("pipelined mode needs an input file: {}".format(input_file))
+
+    pipeline = import_module("pipeline")
+    output = pipeline.process_file(
+        obj,
+        input_file,
+        params["processes"],
+        int(params["block_size"] * (1 << 20))
+        if params["block_size"]
+        else pipeline.DEFAULT_BLOCK_SIZE,
+    )
+    update_rollups(
+        get_rollup_store(params["rollup_store"], params["rollup_retention"]),
+        obj.plan,
+        [obj.accumulators],
+    )
+    write_output(obj, params, obj.accumulators)
+    submit_metrics(obj, params, output["merged"])
+    flush_metrics(params)
+    if params["emit_state"]:
+        output["merged_state"] = encode_state(obj.get_state())
+
+    obj.result = output
+    return output
+
+
+def merge_into(merged, object_accumulators) -> list:
+    """
+    returns the accumulators merged so far, None at first,
+    with the accumulators of an object merged into them
+    """
+    if merged is None:
+        return object_accumulators
+    return accumulators.merge_accumulators([merged, object_accumulators])
+
+
+def get_object_version(input_file, cloud) -> tuple:
+    """
+    returns (object id, version) of the local file or azure blob
+    input stream, the version is the ETag, or the size
+    """
+    if cloud == "azure":
+        properties = getattr(input_file, "blob_properties", None) or {}
+        return (
+            "azure://" + input_file.name,
+            properties.get("Etag") or properties.get("ETag") or input_file.length,
+        )
+    ledger = import_module("ledger")
+    return ledger.get_file_id(input_file), ledger.get_file_version(input_file)
+
+
+def get_s3_input_files(aws_event) -> list:
+    """
+    returns the list of (key, bucket) of
+    all the records in the S3 event notification
+    """
+    return [
+        (
+            unquote_plus(record["s3"]["object"]["key"]),
+            record["s3"]["bucket"]["name"],
+        )
+        for record in aws_event.get("Records", [])
+    ]
+
+
+def get_s3_object_versions(aws_event) -> list:
+    """
+    returns the version of each object of the S3 event
+    notification, its ETag or else its size
+    """
+    return [
+        record["s3"]["object"].get("eTag") or record["s3"]["object"].get("size")
+        for record in aws_event.get("Records", [])
+    ]
+
+
+def get_recorded_objects(obj, input_files, versions, params) -> dict:
+    """
+    returns index => (result, state) of the objects of the
+    S3 event recorded in the ledger, state when it is needed
+    """
+    processing_ledger = get_ledger(params["ledger"])
+    if processing_ledger is None:
+        return {}
+    recorded = {}
+    for index, ((input_file, input_bucket), version) in enumerate(
+        zip(input_files, versions)
+    ):
+        object_recorded = processing_ledger.lookup(
+            "s3://{}/{}".format(input_bucket, input_file),
+            version,
+            obj.plan.get_digest(),
+            need_state=params["merge_results"] or params["emit_state"],
+        )
+        if object_recorded is not None:
+            recorded[index] = object_recorded
+    return recorded
+
+
+def process_s3_event(obj, aws_event, params) -> dict:
+    """
+    aggregates every object in the S3 event concurrently,
+    returns the result of each object, and the merged result
+    of all the objects when merge_results is set.
+    the accumulators of an object are released once its result is
+    built, only the merged accumulators of the objects are kept
+    for merge_results and for the output
+    """
+    # pylint: disable=too-many-locals,too-many-branches
+    logger = logging.getLogger()
+    input_files = get_s3_input_files(aws_event)
+    versions = get_s3_object_versions(aws_event)
+    processing_ledger = get_ledger(params["ledger"])
+    rollup_store = get_rollup_store(params["rollup_store"], params["rollup_retention"])
+    recorded = get_recorded_objects(obj, input_files, versions, params)
+    logger.debug(
+        "process %s objects of the s3 event, %s recorded in the ledger...",
+        len(input_files),
+        len(recorded),
+    )
+
+    # consumed in order as the objects are processed, so that the
+    # accumulators of each object are released once used
+    processed = obj.process_input_files(
+        [f for index, f in enumerate(input_files) if index not in recorded],
+        params["max_workers"],
+    )
+
+    output = {"objects": []}
+    failed = []
+    merged = None
+    # the buckets of the objects of the event in the same files
+    output_accumulators = None
+    for index, (input_file, input_bucket) in enumerate(input_files):
+        object_output = {"bucket": input_bucket, "key": input_file}
+        if index in recorded:
+            result, state = recorded[index]
+            object_output["recorded"] = True
+            object_accumulators = (
+                accumulators.load_state(obj.plan, state) if params["merge_results"] else None
+            )
+        else:
+            _, object_accumulators = next(processed)
+            if isinstance(object_accumulators, Exception):
+                failed.append(input_file)
+                continue
+            result = accumulators.get_result(object_accumulators)
+            # recorded objects were published when processed
+            submit_metrics(obj, params, result)
+            upsert_rollups(rollup_store, obj.plan, object_accumulators)
+            state = accumulators.dump_state(obj.plan, object_accumulators)
+            if params["output"]:
+                # from the state, as the accumulators are merged below
+                output_accumulators = merge_into(
+                    output_accumulators, accumulators.load_state(obj.plan, state)
+                )
+            if processing_ledger is not None:
+                processing_ledger.record(
+                    "s3://{}/{}".format(input_bucket, input_file),
+                    versions[index],
+                    obj.plan.get_digest(),
+                    result,
+                    state,
+                )
+        object_output["result"] = result
+        if params["emit_state"]:
+            object_output["state"] = encode_state(state)
+        output["objects"].append(object_output)
+        if params["merge_results"] and object_accumulators is not None:
+            merged = merge_into(merged, object_accumulators)
+    # shuts down the thread pool of the processed objects
+    processed.close()
+
+    update_rollups(rollup_store, obj.plan, [])
+    write_output(obj, params, output_accumulators)
+    if params["merge_results"]:
+        output["merged"] = accumulators.get_result(merged) if merged else {}
+        if params["emit_state"] and merged:
+            output["merged_state"] = encode_state(
+                accumulators.dump_state(obj.plan, merged)
+            )
+    if processing_ledger is not None:
+        logger.debug("ledger: %s", processing_ledger.get_stats())
+    flush_metrics(params)
+
+    if failed:
+        # fail the invocation so that the event is retried
+        logger.info(json.dumps(output, indent=2))
+        raise RuntimeError("processing failed for objects: {}".format(failed))
+
+    obj.result = output
+    return output
+
 if __name__ == "__main__":
     result = main(None, None, None)
     print("Result...")
@@ -0,0 +1,37 @@
+"""
+fixtures of the tests: synthetic input files and a StreamDash
+with the local config files
+"""
+
+import os
+
+import pytest
+
+from aggregation_code.dashboard_class import StreamDash
+from benchmarks import synthetic
+
+ROWS = 3000
+
+
+@pytest.fixture(scope="session")
+def input_files(tmp_path_factory) -> list:
+    """
+    returns the paths of three synthetic STRUCTURED input files
+    """
+    directory = tmp_path_factory.mktemp("input")
+    return [
+        synthetic.write_structured_file(
+            os.path.join(directory, "input-{}.gz".format(seed)), ROWS, seed=seed
+        )
+        for seed in range(3)
+    ]
+
+
+@pytest.fixture
+def dash() -> StreamDash:
+    """
+    returns a StreamDash with the plan of the local config files
+    """
+    obj = StreamDash()
+    obj.read_metadata()
+    return obj
@@ -0,0 +1,23 @@
+"""
+helpers of the tests
+"""
+
+import math
+
+
+def assert_results_equal(left, right, path="result"):
+    """
+    asserts that two results are equal, floats up to rounding
+    """
+    if isinstance(left, dict) and isinstance(right, dict):
+        assert left.keys() == right.keys(), path
+        for key in left:
+            assert_results_equal(left[key], right[key], "{}.{}".format(path, key))
+    elif isinstance(left, (list, tuple)) and isinstance(right, (list, tuple)):
+        assert len(left) == len(right), path
+        for index, (left_item, right_item) in enumerate(zip(left, right)):
+            assert_results_equal(left_item, right_item, "{}[{}]".format(path, index))
+    elif isinstance(left, float) or isinstance(right, float):
+        assert math.isclose(left, right, rel_tol=1e-9, abs_tol=1e-9), (path, left, right)
+    else:
+        assert left == right, (path, left, right)
@@ -0,0 +1,54 @@
+"""
+tests of the base aggregates
+"""
+
+import gzip
+import json
+
+import numpy as np
+import pandas as pd
+
+from aggregation_code import accumulators, custom_functions
+
+FUNCS = ["min", "max", "mean", "sum", "count", "variance", "median"]
+
+
+def test_base_aggregates():
+    column = pd.Series([4.0, None, 1.0, 7.0], dtype="Float64")
+    assert custom_functions.cal_base_aggregates(column, FUNCS) == [
+        1.0, 7.0, 4.0, 12.0, 3.0, 9.0, 4.0
+    ]
+
+
+def test_all_na_column_is_none():
+    column = pd.Series([None, None], dtype="Float64")
+    assert custom_functions.cal_base_aggregates(column, FUNCS) == [
+        None, None, None, 0.0, 0.0, None, None
+    ]
+
+
+def test_merge_with_empty_stats():
+    stats = custom_functions.init_column_stats()
+    other = custom_functions.cal_column_stats(np.array([2.0, 5.0]), {"min", "max", "sum"})
+    custom_functions.merge_column_stats(stats, other)
+    assert custom_functions.get_base_aggregates(stats, ["min", "max", "mean"]) == [
+        2.0, 5.0, 3.5
+    ]
+
+
+def test_placeholder_columns_are_valid_json(dash, tmp_path):
+    path = str(tmp_path / "placeholders.gz")
+    with gzip.open(path, "wt") as file_writer:
+        for row in range(3):
+            file_writer.write(
+                " ".join(
+                    "1606768500" if name == "reqtimesec" else "-"
+                    for name in dash.plan.field_names
+                )
+                + "\n"
+            )
+    result = accumulators.get_result(dash.aggregate_input(path))
+    assert result["overheadbytes_min"] is None
+    assert result["totalbytes_mean"] is None
+    assert result["OffloadRate"] is None
+    json.dumps(result, allow_nan=False)
@@ -0,0 +1,27 @@
+"""
+tests of the batch mode for many local input files
+"""
+
+import os
+
+from aggregation_code import batch, ledger
+
+
+def test_stats_count_the_files_read(dash, input_files, tmp_path):
+    corrupt = tmp_path / "corrupt.gz"
+    corrupt.write_bytes(b"not gzip")
+    files = input_files + [str(corrupt)]
+    processing_ledger = ledger.open_ledger(str(tmp_path / "ledger.db"))
+
+    output = batch.process_files(dash, files, 2, processing_ledger)
+    stats = output["stats"]
+    assert output["failed"] == [str(corrupt)]
+    assert (stats["files_read"], stats["files_skipped"], stats["files_failed"]) == (3, 0, 1)
+    assert stats["bytes"] == sum(os.path.getsize(path) for path in input_files)
+
+    output = batch.process_files(dash, files, 2, processing_ledger)
+    stats = output["stats"]
+    assert (stats["files_read"], stats["files_skipped"], stats["files_failed"]) == (0, 3, 1)
+    assert stats["bytes"] == 0
+    assert stats["files_per_second"] == 0
+    assert output["recorded"] == 3
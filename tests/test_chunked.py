@@ -0,0 +1,25 @@
+"""
+tests of the chunked input reader
+"""
+
+from aggregation_code import accumulators
+from aggregation_code.dashboard_class import StreamDash
+from tests.helpers import assert_results_equal
+
+
+def test_chunked_result_equals_whole_file(dash, input_files):
+    chunked = StreamDash(chunksize=700)
+    chunked.read_metadata()
+    whole = accumulators.get_result(dash.aggregate_input(input_files[0]))
+    assert whole["totalbytes_sum"] > 0
+    assert_results_equal(
+        whole, accumulators.get_result(chunked.aggregate_input(input_files[0]))
+    )
+
+
+def test_process_data_of_chunks(dash, input_files):
+    whole = accumulators.get_result(dash.aggregate_input(input_files[0]))
+    chunked = StreamDash(chunksize=1000)
+    chunked.read_metadata()
+    chunked.read_input_data(input_files[0])
+    assert_results_equal(whole, chunked.process_data())
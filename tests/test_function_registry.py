@@ -0,0 +1,56 @@
+"""
+tests of the custom function registry and of the columns read by the plan
+"""
+
+import pandas as pd
+
+from aggregation_code import accumulators, function_registry, plan_class
+
+
+def test_registered_functions_declare_their_inputs(dash):
+    for function in dash.plan.custom_functions:
+        registered = function_registry.get_custom_function(function.name)
+        assert function.inputs == registered.inputs
+    assert function_registry.get_custom_function("not_registered") is None
+
+
+def test_mergeable_function_of_chunks():
+    function = function_registry.get_custom_function("cal_stat_count")
+    dataframe = pd.DataFrame(
+        {"statuscode": pd.Series([200, 200, 304, 404, 503, None], dtype="Int64")}
+    )
+    whole = function.run(dataframe)
+    state = function.merge(function.partial(dataframe[:2]), function.partial(dataframe[2:]))
+    assert function.finalize(state) == whole
+    assert whole["2xx_count"] == 2
+    assert whole["request_count"] == 5
+
+
+def test_register_custom_function(monkeypatch):
+    monkeypatch.setattr(function_registry, "CUSTOM_FUNCTIONS", {})
+
+    @function_registry.register_custom_function("max_bytes", ("bytes",), ("max_bytes",))
+    def max_bytes(dataframe):
+        return {"max_bytes": dataframe["bytes"].max()}
+
+    function = function_registry.get_custom_function("max_bytes")
+    assert not function.mergeable
+    accumulator = accumulators.CustomFunctionAccumulator(function)
+    accumulator.update(pd.DataFrame({"bytes": [1, 5], "other": [0, 0]}))
+    accumulator.update(pd.DataFrame({"bytes": [3], "other": [0]}))
+    assert list(accumulator.state.columns) == ["bytes"]
+    assert accumulator.result() == max_bytes(accumulator.state) == {"max_bytes": 5}
+
+
+def test_only_used_columns_are_read(dash):
+    used = {aggregate.column for aggregate in dash.plan.base_aggregates}
+    for function in dash.plan.custom_functions:
+        used.update(function.inputs)
+    used.add(dash.plan.time_column)
+    assert set(dash.plan.get_column_names()) == used
+    assert len(used) < len(dash.plan.field_names)
+
+    plan = dash.plan.drop_custom_functions("getuserAgent")
+    assert "ua" not in plan.get_column_names()
+    assert plan.sources == dash.plan.sources
+    assert isinstance(plan, plan_class.AggregationPlan)
@@ -0,0 +1,108 @@
+"""
+tests of the aggregates per group of the dimension columns
+"""
+
+import pytest
+
+from aggregation_code import accumulators, plan_class
+from aggregation_code.dashboard_class import StreamDash
+from tests.helpers import assert_results_equal
+
+
+def get_grouped_dash(dimensions, max_groups=100) -> StreamDash:
+    """
+    returns a StreamDash with the plan of the local provision and the dimensions
+    """
+    obj = StreamDash()
+    obj.read_metadata(read_provision=False)
+    provision = obj.cloud_storage_object.read_provision_metadata()
+    provision = dict(provision, dimensions={"fields": dimensions, "max-groups": max_groups})
+    obj.set_provision(provision)
+    obj.compile_plan()
+    assert obj.plan.dimensions == tuple(dimensions)
+    return obj
+
+
+def aggregate(plan, dataframe) -> dict:
+    return accumulators.get_result(
+        accumulators.update_accumulators(accumulators.init_accumulators(plan), [dataframe])
+    )
+
+
+def test_groups_equal_the_aggregates_of_their_rows(input_files):
+    obj = get_grouped_dash(["reqhost", "cacherefreshsrc"])
+    dataframe = obj.read_input(input_files[0])
+    result = aggregate(obj.plan, dataframe)
+
+    group_plan = obj.plan._replace(dimensions=())
+    whole = aggregate(group_plan, dataframe)
+    assert_results_equal(dict(result, groups=None), dict(whole, groups=None))
+    assert sum(group["rows"] for group in result["groups"]) == len(dataframe)
+    for group in result["groups"]:
+        refresh = group["dimensions"]["cacherefreshsrc"]
+        mask = (dataframe["reqhost"] == group["dimensions"]["reqhost"]).to_numpy()
+        if refresh is None:
+            mask = mask & dataframe["cacherefreshsrc"].isna().to_numpy()
+        else:
+            mask = mask & (dataframe["cacherefreshsrc"] == refresh).to_numpy()
+        assert group["rows"] == mask.sum()
+        assert_results_equal(group["result"], aggregate(group_plan, dataframe[mask]))
+
+
+def test_group_accumulators_are_updated_once_per_chunk(input_files, monkeypatch):
+    obj = get_grouped_dash(["reqhost", "cacherefreshsrc"])
+    dataframe = obj.read_input(input_files[0])
+    updates = []
+    update_accumulators = accumulators.update_accumulators
+
+    def counted(group, chunks):
+        updates.append(len(group))
+        return update_accumulators(group, chunks)
+
+    groupby = accumulators.GroupByAccumulator(obj.plan)
+    monkeypatch.setattr(accumulators, "update_accumulators", counted)
+    groupby.update(dataframe)
+    assert len(updates) == len(groupby.groups)
+    assert len(updates) == len(
+        dataframe.groupby(["reqhost", "cacherefreshsrc"], observed=True, dropna=False)
+    )
+
+
+def test_value_of_the_other_group_name_is_a_group(input_files):
+    obj = get_grouped_dash(["reqhost"], max_groups=2)
+    dataframe = obj.read_input(input_files[0])
+    reqhost = dataframe["reqhost"].astype(object)
+    reqhost[: len(reqhost) * 2 // 3] = plan_class.OTHER_GROUP
+    dataframe["reqhost"] = reqhost
+
+    result = aggregate(obj.plan, dataframe)
+    groups = result["groups"]
+    assert len(groups) == 3
+    assert groups[0]["dimensions"] == {"reqhost": plan_class.OTHER_GROUP}
+    assert not groups[0].get("other")
+    assert groups[0]["rows"] == len(reqhost) * 2 // 3
+    assert groups[-1]["other"]
+    assert groups[-1]["dimensions"] == {"reqhost": plan_class.OTHER_GROUP}
+    assert sum(group["rows"] for group in groups) == len(dataframe)
+
+    # the other group is kept apart through the state
+    state = accumulators.dump_state(
+        obj.plan,
+        accumulators.update_accumulators(accumulators.init_accumulators(obj.plan), [dataframe]),
+    )
+    assert_results_equal(
+        accumulators.get_result(accumulators.load_state(obj.plan, state)), result
+    )
+
+
+@pytest.mark.parametrize("chunksize", [500, 2000])
+def test_chunked_groups_equal_whole(input_files, chunksize):
+    obj = get_grouped_dash(["reqhost", "cacherefreshsrc"])
+    dataframe = obj.read_input(input_files[0])
+    chunks = [
+        dataframe[start:start + chunksize] for start in range(0, len(dataframe), chunksize)
+    ]
+    chunked = accumulators.get_result(
+        accumulators.update_accumulators(accumulators.init_accumulators(obj.plan), chunks)
+    )
+    assert_results_equal(chunked, aggregate(obj.plan, dataframe))
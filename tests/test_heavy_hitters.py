@@ -0,0 +1,88 @@
+"""
+tests of the top-k heavy hitters
+"""
+
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation_code import heavy_hitters
+
+
+def get_chunks(seed, chunks=20, rows=2000) -> list:
+    """
+    returns the chunks of zipf distributed paths
+    """
+    rng = np.random.default_rng(seed)
+    return [
+        pd.Series(np.char.add("/assets/", (rng.zipf(1.3, rows) % 5000).astype(str)))
+        for _ in range(chunks)
+    ]
+
+
+def merge_chunks(chunks, capacity, weights=None) -> dict:
+    """
+    returns the summary of the chunks, merged one by one
+    """
+    summary = heavy_hitters.init_summary()
+    for index, chunk in enumerate(chunks):
+        summary = heavy_hitters.merge_summaries(
+            summary,
+            heavy_hitters.cal_summary(
+                chunk, None if weights is None else weights[index], capacity
+            ),
+            capacity,
+        )
+    return summary
+
+
+@pytest.mark.parametrize("capacity", [10, 50, 200])
+def test_counts_within_the_error_bounds(capacity):
+    chunks = get_chunks(0)
+    exact = Counter()
+    for chunk in chunks:
+        exact.update(chunk.tolist())
+    summary = merge_chunks(chunks, capacity)
+    top = heavy_hitters.get_top(summary, 10)
+
+    assert top["total"] == sum(exact.values())
+    assert len(summary["counts"]) <= capacity
+    for item in top["top"]:
+        assert item["count"] - item["error"] <= exact[item["value"]] <= item["count"]
+    for value, count in exact.items():
+        if value not in summary["counts"]:
+            assert count <= top["max_error"]
+
+
+def test_top_values_of_a_skewed_input():
+    chunks = get_chunks(1)
+    exact = Counter()
+    for chunk in chunks:
+        exact.update(chunk.tolist())
+    top = heavy_hitters.get_top(merge_chunks(chunks, 100), 3)
+    assert [item["value"] for item in top["top"]] == [
+        value for value, _ in exact.most_common(3)
+    ]
+
+
+def test_weighted_counts():
+    chunks = get_chunks(2, chunks=5)
+    weights = [np.arange(len(chunk), dtype="float64") for chunk in chunks]
+    exact = Counter()
+    for chunk, chunk_weights in zip(chunks, weights):
+        for value, weight in zip(chunk.tolist(), chunk_weights.tolist()):
+            exact[value] += weight
+    summary = merge_chunks(chunks, 20, weights)
+    assert summary["total"] == pytest.approx(sum(exact.values()))
+    for value, count in summary["counts"].items():
+        error = summary["errors"].get(value, 0)
+        assert count - error <= exact[value] + 1e-6
+        assert exact[value] <= count + 1e-6
+
+
+def test_status_class():
+    assert heavy_hitters.get_status_class("5xx") == 5
+    assert heavy_hitters.get_status_class("6xx") is None
+    assert heavy_hitters.get_status_class(None) is None
@@ -0,0 +1,54 @@
+"""
+tests of the HyperLogLog distinct counters
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation_code import custom_functions, hyperloglog
+
+
+def get_hll(values, precision=12) -> dict:
+    """
+    returns the counter of the values of a column
+    """
+    return hyperloglog.cal_hll(
+        custom_functions.get_value_hashes(pd.Series(values))[1], precision
+    )
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 200000])
+def test_estimate_within_the_standard_error(distinct):
+    values = np.char.add("10.0.", np.arange(distinct).astype(str))
+    # every value twice
+    estimate = hyperloglog.get_estimate(get_hll(np.concatenate([values, values])))
+    error = 1.04 / np.sqrt(1 << 12)
+    assert abs(estimate - distinct) <= 4 * error * distinct + 1
+
+
+def test_merge_equals_the_counter_of_the_union():
+    values = np.arange(30000).astype(str)
+    parts = [values[:20000], values[10000:25000], values[22000:]]
+    merged = hyperloglog.init_hll(12)
+    for part in parts:
+        hyperloglog.merge_hlls(merged, get_hll(part))
+    np.testing.assert_array_equal(merged["registers"], get_hll(values)["registers"])
+
+
+def test_counters_of_different_precisions_are_not_merged():
+    with pytest.raises(ValueError):
+        hyperloglog.merge_hlls(get_hll(["a"], 12), get_hll(["a"], 14))
+    with pytest.raises(ValueError):
+        hyperloglog.init_hll(hyperloglog.MAX_PRECISION + 1)
+
+
+def test_distinct_aggregate_of_chunks():
+    column = pd.Series(np.arange(5000) % 1234, dtype="Int64")
+    whole = custom_functions.cal_base_aggregates(column, ["distinct"])
+    stats = custom_functions.cal_stats_of_column(column[:2000], {"hll"})
+    custom_functions.merge_column_stats(
+        stats, custom_functions.cal_stats_of_column(column[2000:], {"hll"})
+    )
+    assert custom_functions.get_base_aggregates(stats, ["distinct"]) == whole
+    assert whole[0] == pytest.approx(1234, rel=0.05)
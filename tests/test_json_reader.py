@@ -0,0 +1,38 @@
+"""
+tests of the projected JSON lines reader
+"""
+
+import io
+import math
+
+from aggregation_code import utils
+
+FIELD_DTYPES = {
+    "bytes": {"dtype": "bigint", "categorical": False},
+    "reqhost": {"dtype": "string", "categorical": False},
+}
+
+
+def test_to_float():
+    assert utils.to_float("12") == 12.0
+    assert utils.to_float(3) == 3.0
+    assert math.isnan(utils.to_float(None))
+    assert math.isnan(utils.to_float(utils.NULL_SENTINEL))
+    assert math.isnan(utils.to_float("abc"))
+    assert math.isnan(utils.to_float({"bytes": 1}))
+
+
+def test_values_that_are_not_numbers_are_missing():
+    lines = (
+        b'{"bytes": "10", "reqHost": "a"}\n'
+        b'{"bytes": "n/a", "reqHost": "b"}\n'
+        b'{"bytes": [1], "reqHost": "c"}\n'
+        b'{"reqHost": "d"}\n'
+    )
+    (dataframe,) = utils.iter_json_lines(
+        io.BytesIO(lines), ["bytes", "reqhost"], ["bytes", "reqhost"], FIELD_DTYPES,
+        compression=None,
+    )
+    assert dataframe["reqhost"].tolist() == ["a", "b", "c", "d"]
+    assert dataframe["bytes"].count() == 1
+    assert dataframe["bytes"].sum() == 10
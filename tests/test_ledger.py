@@ -0,0 +1,79 @@
+"""
+tests of the ledger of the processed objects
+"""
+
+import json
+
+import pytest
+
+import run_aggregations
+from aggregation_code import ledger
+from tests.helpers import assert_results_equal
+from tests.test_s3_event import PARAMS, get_event
+
+
+@pytest.fixture(name="processing_ledger")
+def fixture_processing_ledger(tmp_path):
+    return ledger.open_ledger("sqlite://" + str(tmp_path / "ledger.db"))
+
+
+def test_hit_of_the_recorded_version_and_plan(processing_ledger):
+    processing_ledger.record("s3://b/k", "etag-1", "plan-1", {"rows": 3}, b"state")
+    assert processing_ledger.lookup("s3://b/k", "etag-1", "plan-1") == ({"rows": 3}, b"state")
+    assert processing_ledger.get_stats() == {"hits": 1, "misses": 0, "recorded": 1}
+
+
+def test_miss_on_version_or_plan_change(processing_ledger):
+    processing_ledger.record("s3://b/k", "etag-1", "plan-1", {"rows": 3}, b"state")
+    assert processing_ledger.lookup("s3://b/k", "etag-2", "plan-1") is None
+    assert processing_ledger.lookup("s3://b/k", "etag-1", "plan-2") is None
+    assert processing_ledger.lookup("s3://b/other", "etag-1", "plan-1") is None
+    assert processing_ledger.get_stats()["misses"] == 3
+
+    # the entry is replaced when the object is processed again
+    processing_ledger.record("s3://b/k", "etag-2", "plan-2", {"rows": 4})
+    assert processing_ledger.lookup("s3://b/k", "etag-1", "plan-1") is None
+    assert processing_ledger.lookup("s3://b/k", "etag-2", "plan-2") == ({"rows": 4}, None)
+
+
+def test_miss_without_the_needed_state(processing_ledger):
+    processing_ledger.record("s3://b/k", "etag-1", "plan-1", {"rows": 3})
+    assert processing_ledger.lookup("s3://b/k", "etag-1", "plan-1") == ({"rows": 3}, None)
+    assert processing_ledger.lookup("s3://b/k", "etag-1", "plan-1", need_state=True) is None
+
+
+def test_state_too_large_is_not_recorded(processing_ledger, monkeypatch):
+    monkeypatch.setattr(processing_ledger.store, "max_state_bytes", 4)
+    processing_ledger.record("s3://b/k", "etag-1", "plan-1", {"rows": 3}, b"large state")
+    assert processing_ledger.lookup("s3://b/k", "etag-1", "plan-1") == ({"rows": 3}, None)
+
+
+def process_s3_event(dash, event, params) -> dict:
+    """
+    returns the output of the invocation as JSON, the results
+    recorded in the ledger have the bucket keys of JSON
+    """
+    return json.loads(json.dumps(run_aggregations.process_s3_event(dash, event, params)))
+
+
+def test_redelivered_event(dash, input_files, tmp_path):
+    params = dict(PARAMS, ledger="sqlite://" + str(tmp_path / "ledger.db"))
+    first = process_s3_event(dash, get_event(input_files), params)
+    second = process_s3_event(dash, get_event(input_files), params)
+    assert all(item.get("recorded") for item in second["objects"])
+    assert_results_equal(
+        second["objects"], [dict(item, recorded=True) for item in first["objects"]]
+    )
+    assert_results_equal(second["merged"], first["merged"])
+
+    # a new version of an object is a miss of that object
+    event = get_event(input_files)
+    event["Records"][0]["s3"]["object"]["eTag"] = "changed"
+    third = process_s3_event(dash, event, params)
+    assert [bool(item.get("recorded")) for item in third["objects"]] == [False, True, True]
+    assert_results_equal(third["merged"], first["merged"])
+
+    # a changed provision is a miss of every object
+    dash.plan = dash.plan._replace(sources=(("provision_file", "changed"),))
+    fourth = process_s3_event(dash, get_event(input_files), params)
+    assert not any(item.get("recorded") for item in fourth["objects"])
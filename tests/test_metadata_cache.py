@@ -0,0 +1,70 @@
+"""
+tests of the metadata cache
+"""
+
+import pytest
+
+from aggregation_code.metadata_cache import MetadataCache, MetadataNotFoundError
+from aggregation_code.utils import BaseUtils
+
+
+class Fetcher:
+    """
+    fetch of a file, counting the reads
+    """
+
+    def __init__(self, value=None):
+        self.value = value
+        self.etags = []
+
+    def __call__(self, etag):
+        self.etags.append(etag)
+        if self.value is None:
+            raise MetadataNotFoundError("missing.json")
+        if etag == "v1":
+            return None, etag
+        return self.value, "v1"
+
+
+def test_hit_and_revalidation():
+    cache = MetadataCache(ttl=300)
+    fetch = Fetcher({"a": 1})
+    assert cache.get("key", fetch) == {"a": 1}
+    assert cache.get("key", fetch) == {"a": 1}
+    assert fetch.etags == [None]
+    cache.ttl = 0
+    assert cache.get("key", fetch) == {"a": 1}
+    assert fetch.etags == [None, "v1"]
+    assert cache.get_stats()["not_modified"] == 1
+
+
+def test_not_found_is_cached_for_the_ttl():
+    cache = MetadataCache(ttl=300)
+    fetch = Fetcher()
+    for _ in range(3):
+        with pytest.raises(MetadataNotFoundError):
+            cache.get("key", fetch)
+    assert fetch.etags == [None]
+    assert cache.get_stats()["hits"] == 2
+
+    # found once due
+    cache.ttl = 0
+    fetch.value = {"a": 1}
+    assert cache.get("key", fetch) == {"a": 1}
+
+
+def test_missing_plan_file_is_read_once(tmp_path, monkeypatch):
+    monkeypatch.setattr("aggregation_code.utils.METADATA_CACHE", MetadataCache(ttl=300))
+    storage = BaseUtils()
+    storage.config_dir = str(tmp_path)
+    fetch_metadata = storage.fetch_metadata
+    fetched = []
+
+    def fetch(file_name, etag=None):
+        fetched.append(file_name)
+        return fetch_metadata(file_name, etag)
+
+    monkeypatch.setattr(storage, "fetch_metadata", fetch)
+    assert storage.read_plan_metadata() == {}
+    assert storage.read_plan_metadata() == {}
+    assert fetched == [storage.input_configs["plan_file"]]
@@ -0,0 +1,19 @@
+"""
+tests of the pipelined mode for a single large input file
+"""
+
+from aggregation_code import accumulators, pipeline
+from tests.conftest import ROWS
+from tests.helpers import assert_results_equal
+
+
+def test_pipeline_equals_whole_file(dash, input_files):
+    whole = accumulators.get_result(dash.aggregate_input(input_files[0]))
+    output = pipeline.process_file(dash, input_files[0], processes=2, block_size=64 << 10)
+    assert output["stats"]["blocks"] > 2
+    assert output["stats"]["rows"] == ROWS
+    assert_results_equal(output["merged"], whole)
+
+
+def test_workers_are_not_forked():
+    assert pipeline.get_mp_context().get_start_method() != "fork"
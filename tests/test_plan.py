@@ -0,0 +1,74 @@
+"""
+tests of the compiled aggregation plan
+"""
+
+import json
+import shutil
+
+import pytest
+
+from aggregation_code import dashboard_class, plan_class
+from aggregation_code.dashboard_class import StreamDash
+from aggregation_code.metadata_cache import METADATA_CACHE
+from aggregation_code.utils import BaseUtils
+
+
+@pytest.fixture
+def config_dir(tmp_path, monkeypatch):
+    """
+    returns a copy of the config directory, used by the local storage
+    """
+    storage = BaseUtils()
+    directory = tmp_path / "configs"
+    shutil.copytree(storage.config_dir, directory)
+    storage.config_dir = str(directory)
+    monkeypatch.setattr(dashboard_class, "CLOUD_STORAGE_OBJECTS", {None: storage})
+    METADATA_CACHE.invalidate()
+    yield directory
+    METADATA_CACHE.invalidate()
+
+
+def test_plan_round_trip(dash):
+    plan = plan_class.with_rollups(dash.plan)
+    assert plan.sources == dash.plan.sources
+    assert plan_class.plan_from_dict(json.loads(plan_class.dumps_plan(plan))) == plan
+
+
+def test_written_plan_is_used(config_dir):
+    obj = StreamDash()
+    obj.read_metadata()
+    obj.write_plan()
+    assert (config_dir / "aggregation_plan.json").exists()
+
+    loaded = StreamDash()
+    assert loaded.read_plan()
+    assert loaded.plan == obj.plan
+
+
+def test_plan_is_compiled_when_provision_changes(config_dir):
+    obj = StreamDash()
+    obj.read_metadata()
+    obj.write_plan()
+
+    provision = json.loads((config_dir / "provision.json").read_text())
+    provision["bytes"] = ["5", ["max"]]
+    (config_dir / "provision.json").write_text(json.dumps(provision))
+    METADATA_CACHE.invalidate()
+
+    changed = StreamDash()
+    assert not changed.read_plan()
+    changed.read_metadata()
+    assert changed.plan.get_digest() != obj.plan.get_digest()
+    assert [a.funcs for a in changed.plan.base_aggregates if a.column == "bytes"] == [("max",)]
+
+
+def test_reserved_dimensions_are_skipped(config_dir):
+    obj = StreamDash()
+    obj.read_metadata(read_provision=False)
+    field = next(f for f in obj.stream_metadata.chosen_fields if f.name == "cp")
+    field.name = "source"
+    provision = json.loads((config_dir / "provision.json").read_text())
+    provision["dimensions"] = ["source", "reqhost"]
+    obj.set_provision(provision)
+    obj.compile_plan()
+    assert obj.plan.dimensions == ("reqhost",)
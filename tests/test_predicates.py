@@ -0,0 +1,72 @@
+"""
+tests of the predicate masks of the filtered aggregates
+"""
+
+import pandas as pd
+import pytest
+
+from aggregation_code import predicates
+
+
+@pytest.fixture(name="chunk")
+def fixture_chunk():
+    return pd.DataFrame(
+        {
+            "cachestatus": pd.Series([0, 1, None, 0, 1], dtype="Int64"),
+            "cacherefreshsrc": pd.Series(
+                ["origin", "peer", "origin", None, "origin"], dtype="category"
+            ),
+        }
+    )
+
+
+def get_rows(text, chunk) -> list:
+    return list(predicates.get_mask(text, chunk).nonzero()[0])
+
+
+def test_comparisons(chunk):
+    assert get_rows("cachestatus == 0", chunk) == [0, 3]
+    assert get_rows("cachestatus != 0", chunk) == [1, 4]
+    assert get_rows("0 < cachestatus", chunk) == [1, 4]
+    assert get_rows("cacherefreshsrc == 'origin'", chunk) == [0, 2, 4]
+    assert get_rows("cacherefreshsrc in ['peer', 'origin']", chunk) == [0, 1, 2, 4]
+    assert get_rows("cacherefreshsrc not in ['peer']", chunk) == [0, 2, 4]
+
+
+def test_and_or(chunk):
+    assert get_rows("cachestatus == 1 and cacherefreshsrc == 'origin'", chunk) == [4]
+    assert get_rows("cachestatus == 1 or cacherefreshsrc == 'origin'", chunk) == [0, 1, 2, 4]
+    assert predicates.parse_predicate("a == 1 and b == 2") == predicates.parse_predicate(
+        "b == 2 and a == 1"
+    )
+
+
+def test_not_does_not_match_missing_values(chunk):
+    assert get_rows("not cachestatus == 0", chunk) == get_rows("cachestatus != 0", chunk)
+    assert get_rows("not cacherefreshsrc in ['peer']", chunk) == [0, 2, 4]
+    # a row with a missing value in a column of the operand never matches
+    assert get_rows("not (cachestatus == 0 or cacherefreshsrc == 'peer')", chunk) == [4]
+    assert get_rows("not not cachestatus == 0", chunk) == [0, 3]
+
+
+def test_shared_masks_are_evaluated_once(chunk, monkeypatch):
+    calls = []
+    evaluate_comparison = predicates.evaluate_comparison
+
+    def counted(column, op, value):
+        calls.append((column.name, op, value))
+        return evaluate_comparison(column, op, value)
+
+    monkeypatch.setattr(predicates, "evaluate_comparison", counted)
+    with predicates.shared_masks(chunk):
+        predicates.get_mask("cachestatus == 0", chunk)
+        predicates.get_mask("cachestatus == 0 and cacherefreshsrc == 'origin'", chunk)
+    assert calls == [("cachestatus", "==", 0), ("cacherefreshsrc", "==", "origin")]
+
+
+@pytest.mark.parametrize(
+    "text", ["cachestatus ==", "cachestatus + 1 == 2", "cachestatus in 1", "a == b", "f(a)"]
+)
+def test_invalid_predicates(text):
+    with pytest.raises(ValueError):
+        predicates.parse_predicate(text)
@@ -0,0 +1,54 @@
+"""
+tests of the quantile sketches
+"""
+
+import numpy as np
+import pytest
+
+from aggregation_code import quantile_sketch
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+
+def assert_within_accuracy(sketch, values, accuracy):
+    """
+    asserts that the quantiles of the sketch are the ones of
+    the values up to the relative accuracy
+    """
+    expected = np.quantile(values, QUANTILES, method="lower")
+    for value, exact in zip(quantile_sketch.get_quantiles(sketch, QUANTILES), expected):
+        assert abs(value - exact) <= accuracy * abs(exact) + 1e-12, (value, exact)
+
+
+@pytest.mark.parametrize("accuracy", [0.01, 0.05])
+def test_quantiles_within_accuracy(accuracy):
+    values = np.random.default_rng(0).lognormal(5, 2, 20000)
+    assert_within_accuracy(quantile_sketch.cal_sketch(values, accuracy), values, accuracy)
+
+
+def test_merged_sketches_equal_the_sketch_of_all_values():
+    rng = np.random.default_rng(1)
+    parts = [rng.exponential(200, 5000), -rng.exponential(10, 500), np.zeros(100)]
+    merged = quantile_sketch.init_sketch(0.01)
+    for part in parts:
+        quantile_sketch.merge_sketches(merged, quantile_sketch.cal_sketch(part, 0.01))
+    values = np.concatenate(parts)
+    whole = quantile_sketch.cal_sketch(values, 0.01)
+    assert merged == whole
+    assert quantile_sketch.get_count(merged) == len(values)
+    assert_within_accuracy(merged, values, 0.01)
+
+
+def test_empty_sketch():
+    sketch = quantile_sketch.init_sketch()
+    assert all(np.isnan(quantile_sketch.get_quantiles(sketch, QUANTILES)))
+    other = quantile_sketch.cal_sketch(np.array([1.0, 2.0]), 0.05)
+    assert quantile_sketch.merge_sketches(sketch, other)["accuracy"] == 0.05
+
+
+def test_sketches_of_different_accuracies_are_not_merged():
+    with pytest.raises(ValueError):
+        quantile_sketch.merge_sketches(
+            quantile_sketch.cal_sketch(np.array([1.0]), 0.01),
+            quantile_sketch.cal_sketch(np.array([1.0]), 0.02),
+        )
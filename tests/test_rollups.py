@@ -0,0 +1,132 @@
+"""
+tests of the compaction, expiry and queries of the rollup store
+"""
+
+import pytest
+
+from aggregation_code import accumulators, plan_class, rollups
+from tests.helpers import assert_results_equal
+
+END = 2 ** 32
+
+
+@pytest.fixture(name="rollup_plan")
+def fixture_rollup_plan(dash):
+    dash.plan = plan_class.with_rollups(dash.plan)
+    return dash.plan
+
+
+@pytest.fixture(name="bucket_states")
+def fixture_bucket_states(dash, rollup_plan, input_files) -> list:
+    """
+    returns bucket start => binary state of the 1 minute buckets of each input file
+    """
+    assert rollup_plan.rollup_interval
+    return [
+        accumulators.get_rollup_states(dash.aggregate_input(path)) for path in input_files
+    ]
+
+
+def get_result(plan, state) -> dict:
+    return accumulators.get_result(accumulators.load_state(plan.get_bucket_plan(), state))
+
+
+def merge_by_bucket(plan, bucket_states, seconds) -> dict:
+    """
+    returns bucket start => result of the direct merge of
+    the 1 minute states of the buckets of seconds
+    """
+    states = {}
+    for file_states in bucket_states:
+        for bucket, state in file_states.items():
+            states.setdefault(bucket - bucket % seconds, []).append(state)
+    return {
+        bucket: get_result(plan, rollups.merge_states(plan.get_bucket_plan(), bucket_list))
+        for bucket, bucket_list in states.items()
+    }
+
+
+def test_tiers_equal_a_direct_merge(rollup_plan, bucket_states, tmp_path):
+    store = rollups.RollupStore(str(tmp_path / "rollups.db"))
+    for file_states in bucket_states:
+        store.upsert(rollup_plan, file_states)
+    assert store.compact() > 0
+    for tier in store.tiers:
+        expected = merge_by_bucket(rollup_plan, bucket_states, tier.seconds)
+        buckets = store.query(rollup_plan, 0, END, tier.name)
+        assert [bucket["start"] for bucket in buckets] == sorted(expected)
+        for bucket in buckets:
+            assert bucket["end"] == bucket["start"] + tier.seconds
+            assert_results_equal(bucket["result"], expected[bucket["start"]])
+
+
+def test_minute_buckets_sum_to_the_total(rollup_plan, bucket_states, tmp_path):
+    store = rollups.RollupStore(str(tmp_path / "rollups.db"))
+    for file_states in bucket_states:
+        store.upsert(rollup_plan, file_states)
+    store.compact()
+    total = store.query_total(rollup_plan, 0, END)
+    minutes = store.query(rollup_plan, 0, END)
+    assert total["totalbytes_sum"] == pytest.approx(
+        sum(bucket["result"]["totalbytes_sum"] for bucket in minutes)
+    )
+    assert total["totalbytes_max"] == max(
+        bucket["result"]["totalbytes_max"] for bucket in minutes
+    )
+
+    # a range that is not aligned on the coarse buckets
+    start = min(bucket["start"] for bucket in minutes) + 7 * 60
+    end = start + 3 * 3600 + 11 * 60
+    assert store.query_total(rollup_plan, start, end)["totalbytes_sum"] == pytest.approx(
+        sum(
+            bucket["result"]["totalbytes_sum"]
+            for bucket in minutes
+            if start <= bucket["start"] < end
+        )
+    )
+
+
+def test_incremental_compaction(rollup_plan, bucket_states, tmp_path):
+    store = rollups.RollupStore(str(tmp_path / "incremental.db"))
+    for file_states in bucket_states:
+        store.upsert(rollup_plan, file_states)
+        store.compact()
+    # the pending deltas are merged once
+    assert store.compact() == 0
+
+    expected = merge_by_bucket(rollup_plan, bucket_states, rollups.DAY_SECONDS)
+    for bucket in store.query(rollup_plan, 0, END, "1d"):
+        assert_results_equal(bucket["result"], expected[bucket["start"]])
+
+
+def test_expire_keeps_the_pending_deltas(rollup_plan, bucket_states, tmp_path):
+    tiers = rollups.parse_retention("1m=10m,5m=1h")
+    store = rollups.RollupStore(str(tmp_path / "rollups.db"), tiers)
+    store.upsert(rollup_plan, bucket_states[0])
+    minutes = store.get_stats()["1m"]
+    # the rows not yet compacted are kept
+    assert store.expire() == 0
+    store.compact()
+    store.expire()
+    buckets = [bucket["start"] for bucket in store.query(rollup_plan, 0, END)]
+    assert len(buckets) < minutes
+    assert max(buckets) - min(buckets) <= 10 * 60
+    # the coarser tiers still have all the rows
+    expected = merge_by_bucket(rollup_plan, bucket_states[:1], 2 ** 40)
+    assert store.query_total(rollup_plan, 0, END)["totalbytes_sum"] == pytest.approx(
+        expected[0]["totalbytes_sum"]
+    )
+
+
+def test_parse_retention():
+    tiers = rollups.parse_retention("1m=1d, 1d=400d")
+    assert [tier.retention for tier in tiers] == [
+        rollups.DAY_SECONDS,
+        14 * rollups.DAY_SECONDS,
+        90 * rollups.DAY_SECONDS,
+        400 * rollups.DAY_SECONDS,
+    ]
+    assert rollups.parse_duration("90s") == 90
+    assert rollups.parse_duration("1.5h") == 5400
+    with pytest.raises(ValueError):
+        rollups.parse_retention("2m=1d")
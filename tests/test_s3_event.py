@@ -0,0 +1,94 @@
+"""
+tests of the processing of the objects of an S3 event
+"""
+
+import pytest
+
+import run_aggregations
+from aggregation_code import accumulators, plan_class
+from tests.helpers import assert_results_equal
+
+PARAMS = {
+    "ledger": "",
+    "rollup_store": "",
+    "rollup_retention": "",
+    "sinks": "",
+    "sink_concurrency": 1,
+    "output": "",
+    "max_workers": 2,
+    "merge_results": True,
+    "emit_state": False,
+}
+
+
+def get_event(keys) -> dict:
+    """
+    returns the S3 event notification of the local files
+    """
+    return {
+        "Records": [
+            {"s3": {"bucket": {"name": "local"}, "object": {"key": key, "size": 1}}}
+            for key in keys
+        ]
+    }
+
+
+def test_objects_and_merged_result(dash, input_files):
+    output = run_aggregations.process_s3_event(dash, get_event(input_files), PARAMS)
+    results = [accumulators.get_result(dash.aggregate_input(path)) for path in input_files]
+    assert [item["key"] for item in output["objects"]] == input_files
+    for item, result in zip(output["objects"], results):
+        assert_results_equal(item["result"], result)
+    assert output["merged"]["totalbytes_sum"] == pytest.approx(
+        sum(result["totalbytes_sum"] for result in results)
+    )
+    assert output["merged"]["totalbytes_max"] == max(
+        result["totalbytes_max"] for result in results
+    )
+
+
+def test_failed_object_fails_the_invocation(dash, input_files, tmp_path):
+    event = get_event([input_files[0], str(tmp_path / "missing.gz")])
+    with pytest.raises(RuntimeError):
+        run_aggregations.process_s3_event(dash, event, dict(PARAMS, merge_results=False))
+
+
+def test_rollups_and_output(dash, input_files, tmp_path):
+    dash.plan = plan_class.with_rollups(dash.plan)
+    params = dict(
+        PARAMS,
+        merge_results=False,
+        rollup_store=str(tmp_path / "rollups.db"),
+        output=str(tmp_path / "output"),
+    )
+    output = run_aggregations.process_s3_event(dash, get_event(input_files), params)
+    assert "merged" not in output
+    store = run_aggregations.get_rollup_store(params["rollup_store"], "")
+    total = store.query_total(dash.plan, 0, 2 ** 32)
+    assert total["totalbytes_sum"] == pytest.approx(
+        sum(item["result"]["totalbytes_sum"] for item in output["objects"])
+    )
+    assert list((tmp_path / "output").glob("stream_id=*/date=*/hour=*/*.parquet"))
+
+
+def test_objects_are_consumed_as_they_are_processed(dash, input_files, monkeypatch):
+    read = []
+    aggregate_input = dash.aggregate_input
+
+    def counted(input_file, bucket_name=None):
+        read.append(input_file)
+        return aggregate_input(input_file, bucket_name)
+
+    monkeypatch.setattr(dash, "aggregate_input", counted)
+    # objects read when the result of each object is published
+    published = []
+    monkeypatch.setattr(
+        run_aggregations, "submit_metrics", lambda *_: published.append(len(read))
+    )
+    run_aggregations.process_s3_event(dash, get_event(input_files), dict(PARAMS, max_workers=1))
+    assert published == [1, 2, 3]
+
+    processed = dash.process_input_files([(path, None) for path in input_files], 2)
+    assert next(processed)[0] == input_files[0]
+    assert len(read) == 3 + 2
+    processed.close()
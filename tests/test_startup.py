@@ -0,0 +1,32 @@
+"""
+tests of the modules loaded at startup
+"""
+
+import os
+import subprocess
+import sys
+
+from benchmarks.bench_startup import LAZY_MODULES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_lazy_modules_are_not_loaded_by_a_local_run():
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, run_aggregations; "
+            "lazy = set(sys.argv[1:]); "
+            "sys.argv = sys.argv[:1] + ['--loglevel', 'error']; "
+            "run_aggregations.main(None, None); "
+            "print(sorted(set(sys.modules) & lazy))",
+        ]
+        # httpagentparser is used by getuserAgent of the local provision
+        + [module for module in LAZY_MODULES if module != "httpagentparser"],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    ).stdout
+    assert output.splitlines()[-1] == "[]"
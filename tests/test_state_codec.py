@@ -0,0 +1,102 @@
+"""
+tests of the binary partial aggregate states
+"""
+
+import math
+import zlib
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation_code import accumulators, state_codec
+from tests.helpers import assert_results_equal
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        None,
+        True,
+        False,
+        0,
+        -1,
+        2 ** 70,
+        -(2 ** 63),
+        1.5,
+        -0.0,
+        math.inf,
+        "",
+        "réponse",
+        b"\x00\xff",
+        [1, "a", None],
+        (1, (2, 3)),
+        {"a": [1.0], 3: {"b": None}},
+        Counter({"200": 3, 404: 1}),
+    ],
+)
+def test_round_trip(value):
+    decoded = state_codec.decode(state_codec.encode(value))
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_round_trip_of_arrays_and_frames():
+    floats = np.array([1.5, np.nan, -2.0])
+    registers = np.array([0, 7, 255], dtype=np.uint8)
+    frame = pd.DataFrame({"bytes": [1.0, None], "ua": ["a", None]})
+    floats_out, registers_out, frame_out = state_codec.decode(
+        state_codec.encode([floats, registers, frame])
+    )
+    np.testing.assert_array_equal(floats_out, floats)
+    assert registers_out.dtype == np.uint8
+    np.testing.assert_array_equal(registers_out, registers)
+    assert frame_out["bytes"].tolist()[0] == 1.0
+    assert frame_out.isna().values.tolist() == [[False, False], [True, True]]
+
+
+def test_nan_round_trip():
+    assert math.isnan(state_codec.decode(state_codec.encode(math.nan)))
+
+
+def test_errors():
+    with pytest.raises(TypeError):
+        state_codec.encode(object())
+    data = bytearray(zlib.decompress(state_codec.encode(1)))
+    data[0] = state_codec.CODEC_VERSION + 1
+    with pytest.raises(ValueError):
+        state_codec.decode(zlib.compress(bytes(data)))
+
+
+def test_state_round_trip(dash, input_files):
+    input_accumulators = dash.aggregate_input(input_files[0])
+    state = accumulators.dump_state(dash.plan, input_accumulators)
+    assert_results_equal(
+        accumulators.get_result(accumulators.load_state(dash.plan, state)),
+        accumulators.get_result(input_accumulators),
+    )
+
+
+def test_merged_states_equal_the_whole_input(dash, input_files, tmp_path):
+    # the three inputs in one file
+    whole_file = tmp_path / "whole.gz"
+    with open(whole_file, "wb") as file_writer:
+        for input_file in input_files:
+            with open(input_file, "rb") as file_reader:
+                file_writer.write(file_reader.read())
+    whole = accumulators.get_result(dash.aggregate_input(str(whole_file)))
+
+    states = [
+        accumulators.dump_state(dash.plan, dash.aggregate_input(input_file))
+        for input_file in input_files
+    ]
+    assert_results_equal(
+        accumulators.get_result(accumulators.merge_states(dash.plan, states)), whole
+    )
+
+
+def test_state_of_another_plan(dash, input_files):
+    state = accumulators.dump_state(dash.plan, dash.aggregate_input(input_files[0]))
+    with pytest.raises(ValueError):
+        accumulators.load_state(dash.plan.drop_custom_functions("getuserAgent"), state)
@@ -0,0 +1,59 @@
+"""
+tests of the aggregates per time bucket
+"""
+
+import gzip
+
+import pytest
+
+from aggregation_code import accumulators, plan_class
+
+
+def read_column(path, field_names, name) -> list:
+    """
+    returns the values of the column of the STRUCTURED input file
+    """
+    position = list(field_names).index(name)
+    with gzip.open(path, "rt") as file_reader:
+        return [line.split(" ")[position] for line in file_reader]
+
+
+def test_buckets_add_up_to_the_input(dash, input_files):
+    result = accumulators.get_result(dash.aggregate_input(input_files[0]))
+    buckets = result["timeseries"][5]
+    times = [
+        int(value) for value in read_column(input_files[0], dash.plan.field_names, "reqtimesec")
+    ]
+    assert sorted(buckets) == sorted({time - time % 300 for time in times})
+    assert sum(bucket["bytes_count"] for bucket in buckets.values()) == len(times)
+    values = read_column(input_files[0], dash.plan.field_names, "bytes")
+    assert sum(bucket["bytes_sum"] for bucket in buckets.values()) == pytest.approx(
+        sum(float(value) for value in values)
+    )
+
+
+def test_custom_functions_are_not_bucketed(dash):
+    assert dash.plan.custom_functions
+    assert {bucket.agg_interval for bucket in dash.plan.time_buckets} == {
+        plan_class.NO_INTERVAL, 5
+    }
+    assert "bytes" in dict(dash.plan.time_buckets)[5]
+
+
+def test_fractional_epochs(dash, input_files, tmp_path):
+    position = list(dash.plan.field_names).index("reqtimesec")
+    path = str(tmp_path / "fractional.gz")
+    with gzip.open(input_files[0], "rt") as file_reader, gzip.open(path, "wt") as file_writer:
+        for line in file_reader:
+            values = line.rstrip("\n").split(" ")
+            values[position] += ".143"
+            file_writer.write(" ".join(values) + "\n")
+
+    dash.read_input_data(path)
+    assert dash.dataframe["reqtimesec"].dtype == "float64"
+    expected = accumulators.get_result(dash.aggregate_input(input_files[0]))["timeseries"][5]
+    result = accumulators.get_result(dash.aggregate_input(path))["timeseries"][5]
+    assert list(result) == list(expected)
+    assert all(isinstance(bucket, int) for bucket in result)
+    for bucket, aggregates in result.items():
+        assert aggregates["bytes_count"] == expected[bucket]["bytes_count"]